@@ -2,6 +2,14 @@
 base_path = None
 # Place to store simulations
 data_path = None
+# Optional: maximal total size (in bytes) of the cache for the output
+# of the data scripts in config_files/model_cache. Defaults to 2 GB.
+# model_cache_size = 2 * 1024 ** 3
+# Optional: specification of the compute nodes and path to a json
+# file with calibrated coefficients (see multiarea_model/resource_helpers.py)
+# used to size jobs with resource_helpers.size_job
+# node_spec = {'memory': 128 * 1024., 'cores': 48, 'max_nodes': 256}
+# resource_calibration = None
 # Template for job scripts
 jobscript_template = '''
 # Instruction for the queuing system
@@ -21,6 +29,20 @@ Here is an example for the Slurm queueing system:
 # #SBATCH --cpus-per-task={local_num_threads}
 # #SBATCH --ntasks={num_processes}
 # mpirun python {base_path}/run_simulation.py {label} {network_label}'''
+
+and for jobs sized with size_job and passed to start_job(..., job=job):
+
+# jobscript_template = '''#!/bin/bash
+# #SBATCH --job-name MAM
+# #SBATCH -o {sim_dir}/{label}.%j.o
+# #SBATCH -e {sim_dir}/{label}.%j.e
+# #SBATCH --mem={memory_per_node}M
+# #SBATCH --time={time_limit}
+# #SBATCH --exclusive
+# #SBATCH --nodes={num_nodes}
+# #SBATCH --ntasks-per-node={processes_per_node}
+# #SBATCH --cpus-per-task={local_num_threads}
+# mpirun python {base_path}/run_simulation.py {label} {network_label}'''
 """
 
 # Command to submit jobs on the local cluster
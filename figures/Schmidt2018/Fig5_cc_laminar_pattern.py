@@ -3,16 +3,14 @@ import numpy as np
 import json
 import pyx
 import os
-import subprocess
 
-from config import base_path
 from helpers import area_list, population_labels, layer_labels
 from helpers import datapath, raw_datapath
-from scipy import integrate
 from matplotlib import rc_file, gridspec
 from plotcolors import myred, myblue
 from multiarea_model import MultiAreaModel
 from multiarea_model.multiarea_helpers import create_mask
+from multiarea_model.data_multiarea.VisualCortex_Data import fit_SLN, probit
 
 NEURON_DENSITIES_AVAILABLE = False
 
@@ -122,17 +120,6 @@ if NEURON_DENSITIES_AVAILABLE:
                     y += overlap['visual'][area_key + '_M132'][FV91] / 100.
             neuron_densities[area] = {'overall': x / y}
 
-    def integrand(x, mu, sigma):
-        return 1 / (sigma * np.sqrt(2 * np.pi)) * np.exp(-(x - mu) ** 2 / (2. * sigma ** 2))
-
-    def probit(x,):
-        if isinstance(x, np.ndarray):
-            res = [integrate.quad(integrand, -1000., i,
-                                  args=(0., 1.))[0] for i in x]
-        else:
-            res = integrate.quad(integrand, -1000., x, args=(0., 1.))[0]
-        return res
-
     def chi2(x, y, z, n):
         return 1. / (n) * np.sum(((x - y) / z) ** 2)
 
@@ -142,31 +129,15 @@ if NEURON_DENSITIES_AVAILABLE:
     SLN_array = np.array(data[:, 10], dtype=np.float)
     densities = np.array(data[:, 7], dtype=np.float)
 
-    # Call R script to perform SLN fit
-    try:
-        proc = subprocess.Popen(["Rscript",
-                                 os.path.join(datapath, 'SLN_logdensities.R'),
-                                 base_path],
-                                stdout=subprocess.PIPE)
-        out = proc.communicate()[0].decode('utf-8')
-        R_fit = [float(out.split('\n')[1].split(' ')[1]),
-                 float(out.split('\n')[1].split(' ')[3])]
-    except OSError:
-        print("No R installation, taking hard-coded fit parameters.")
-        R_fit = [-0.1516142, -1.5343200]
-
-    print("We currently cannot publish the R code because of "
-          "copyright issues, there taking hard-coded fit parameters. "
-          "See Schmidt et al. (2018) for a full explanation "
-          "of the procedure.")
-    R_fit = [-0.1516142, -1.5343200]
-    print(R_fit)
+    # Beta-binomial fit of SLN vs. log ratio of densities
+    SLN_fit = fit_SLN()
+    print(SLN_fit)
 
     ax = axes['A']
     ax.plot(densities, SLN_array, '.', linewidth=1.5, color=myblue)
     x = np.arange(-2., 2., 0.1)
     ax.plot(x, np.array(
-        probit((R_fit[1] * x + R_fit[0]))), '-', linewidth=1.5, color='k')
+        probit((SLN_fit[1] * x + SLN_fit[0]))), '-', linewidth=1.5, color='k')
     ax.set_ylim(-0.1, 1.1)
     ax.set_ylabel(r'$SLN$')
     ax.set_xlabel(r'Log ratio of densities')
@@ -174,9 +145,9 @@ if NEURON_DENSITIES_AVAILABLE:
     ax.set_xticks([-2., -1., 0., 1., 2.])
     ax.set_yticks([0., 0.2, 0.4, 0.6, 0.8, 1.])
     goodness_bb = round(chi2(SLN_array, probit(
-        R_fit[1] * densities + R_fit[0]), np.ones(SLN_array.size), SLN_array.size - 2), 4)
+        SLN_fit[1] * densities + SLN_fit[0]), np.ones(SLN_array.size), SLN_array.size - 2), 4)
     corr_bb = round(np.corrcoef(
-        np.array(probit(R_fit[1] * densities + R_fit[0])), SLN_array)[0][1] ** 2, 2)
+        np.array(probit(SLN_fit[1] * densities + SLN_fit[0])), SLN_array)[0][1] ** 2, 2)
     print("SLN Fit: R={}, Chi2={}".format(corr_bb, goodness_bb))
 
 
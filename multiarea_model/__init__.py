@@ -1,5 +1,32 @@
-from . import default_params
-from .analysis import Analysis
-from .simulation import Simulation
-from .theory import Theory
-from .multiarea_model import MultiAreaModel
+"""
+The submodules of the package and their dependencies (NEST,
+matplotlib, pandas, scipy) are imported on first access of the
+respective class, so that importing the package is fast.
+"""
+import importlib
+
+_lazy_attributes = {'default_params': ('.default_params', None),
+                    'Analysis': ('.analysis', 'Analysis'),
+                    'Simulation': ('.simulation', 'Simulation'),
+                    'Theory': ('.theory', 'Theory'),
+                    'MultiAreaModel': ('.multiarea_model', 'MultiAreaModel'),
+                    'SubModel': ('.sub_model', 'SubModel')}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    module_name, attribute = _lazy_attributes[name]
+    module = importlib.import_module(module_name, __name__)
+    if attribute is None:
+        value = module
+    else:
+        value = getattr(module, attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
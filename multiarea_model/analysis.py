@@ -21,6 +21,7 @@ Sacha van Albada
 
 """
 from . import analysis_helpers as ah
+from .resource_helpers import read_logfiles, simulated_time
 import glob
 import inspect
 from itertools import chain, product
@@ -74,7 +75,12 @@ class Analysis:
         except OSError:
             pass
 
-        self.T = self.simulation.T
+        # Simulations stopped early because of the time budget or by
+        # a callback are analyzed up to the simulated time
+        self.T = simulated_time(read_logfiles(self.simulation.label), self.simulation.T)
+        if self.T < self.simulation.T:
+            print("Simulation stopped after {0:.1f} of {1:.1f} ms, "
+                  "analyzing the simulated time.".format(self.T, self.simulation.T))
 
         self.areas_simulated = self.simulation.areas_simulated
         self.areas_recorded = self.simulation.areas_recorded
@@ -127,6 +133,13 @@ class Analysis:
                     try:
                         data[area][pop] = np.load(fn)
                     except FileNotFoundError:
+                        # Binary files of the spike detectors of single populations
+                        files = glob.glob(os.path.join(rec_dir, '.'.join(('-'.join((fp, '*')),
+                                                                          'dat'))))
+                        if len(files) > 0:
+                            data[area][pop] = ah.load_spike_files(
+                                files, self.simulation.params['dt'])
+                            continue
                         if not hasattr(self, 'all_spikes'):
                             fp = '.'.join(('-'.join((self.simulation.label,
                                                      self.simulation.params[
@@ -16,6 +16,7 @@ _create_parameter_dict : Create parameter dict for functions
 _check_stored_data : Check if stored data was computed
                      with the correct Parameters.
 online_hist : Compute spike histogram on a spike file line by line.
+load_spike_files : Load spikes from the binary files of population spike detectors.
 pop_rate : Compute average firing rate.
 pop_rate_distribution : Compute distribution of single-cell firing rates.
 pop_rate_time_series : Compute time series of population rate.
@@ -45,7 +46,6 @@ from nested_dict import nested_dict
 import numpy as np
 import json
 from itertools import product
-from scipy.signal import welch
 
 
 area_list = ['V1', 'V2', 'VP', 'V3', 'PIP', 'V3A', 'MT', 'V4t', 'V4',
@@ -54,6 +54,12 @@ area_list = ['V1', 'V2', 'VP', 'V3', 'PIP', 'V3A', 'MT', 'V4t', 'V4',
              '7a', 'STPp', 'STPa', 'FEF', '46', 'TF', 'TH', 'AITd']
 pop_list = ['23E', '23I', '4E',  '4I', '5E', '5I', '6E', '6I']
 
+# Record of a spike in the binary files written by
+# Simulation.write_spikes: GID of the sender and time step of the
+# spike. Spike times up to 2**32 * dt (about 119 h for dt = 0.1 ms)
+# are stored exactly.
+spike_dtype = np.dtype([('senders', '<u4'), ('steps', '<u4')])
+
 
 def model_iter(mode='single',
                areas=None, pops='complete',
@@ -200,6 +206,38 @@ Helper functions for data loading
 """
 
 
+def load_spike_files(files, dt):
+    """
+    Load the spikes of a population from the binary files written by
+    Simulation.write_spikes, e.g. one file per MPI process.
+
+    Parameters
+    ----------
+    files : list
+        List of file names.
+    dt : float
+        Resolution of the simulation in ms.
+
+    Returns
+    -------
+    data_array : numpy.ndarray
+        Array of shape (number of spikes, 2) holding the senders and
+        the times of the spikes, as in the gdf files of spike
+        detectors.
+    """
+    spikes = np.concatenate([np.fromfile(f, dtype=spike_dtype) for f in sorted(files)] +
+                            [np.empty(0, dtype=spike_dtype)])
+    steps = spikes['steps'].astype(float)
+    steps_per_ms = np.round(1. / dt)
+    if np.isclose(steps_per_ms * dt, 1.):
+        # Dividing by an integer yields the float closest to the
+        # decimal spike time, i.e. the value read from a gdf file
+        times = steps / steps_per_ms
+    else:
+        times = steps * dt
+    return np.column_stack((spikes['senders'].astype(float), times))
+
+
 def _create_parameter_dict(default_dict, T, **keywords):
     """
     Create the parameter dict for the members of the data class.
@@ -712,6 +750,7 @@ def spectrum(data_array, num_neur, t_min, t_max, resolution=1., kernel='binned',
     freq : numpy.ndarray
         Discrete frequency values
     """
+    from scipy.signal import welch
     rate = pop_rate_time_series(
         data_array, num_neur, t_min, t_max, kernel=kernel, resolution=resolution)
     rate = centralize(rate, units=True)
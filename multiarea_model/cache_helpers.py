@@ -0,0 +1,303 @@
+"""
+cache_helpers
+==============
+
+Helper functions to cache the output of the data scripts
+(data_multiarea/Model.py) on disk. Each cached file is identified by a
+hash of the network parameters entering the data scripts and of the
+version of the raw data and the data scripts themselves. Cached files
+are stored in config_files/model_cache.
+
+Each cached file can additionally be registered under a base key, a
+cache key computed while ignoring some of the parameters, e.g. those
+only entering the synaptic weights. This allows to find a cached
+network that differs from a requested network only in the ignored
+parameters, so that only the data depending on them have to be
+recomputed.
+
+All write operations use temporary files that are atomically renamed
+to their final name, so that several processes can safely read from
+and write to the cache at the same time.
+
+Functions
+---------
+
+data_version : Return a hash identifying the raw data and the data scripts
+data_cache_key : Return the cache key for a set of custom network parameters
+is_cached : Return whether a data file is in the cache
+read_from_cache : Load the content of a cached data file
+read_base_from_cache : Load the content of a cached data file registered under a base key
+load_from_cache : Copy a cached data file to a given file name
+store_in_cache : Store a data file in the cache
+evict_cache : Remove the least recently used files from the cache
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from config import base_path
+from copy import deepcopy
+from .default_params import network_params, nested_update
+try:
+    from config import model_cache_size
+except ImportError:
+    # Maximal total size of the cache in bytes
+    model_cache_size = 2 * 1024 ** 3
+
+cache_dir = os.path.join(base_path, 'config_files', 'model_cache')
+
+# Connection parameters that are not read by the data scripts
+# but only act on the network after the data scripts have been executed.
+ignored_connection_params = ['K_stable', 'replace_cc', 'replace_non_simulated_areas',
+                             'replace_cc_input_source']
+
+_data_version = None
+
+
+def data_version():
+    """
+    Return a hash of the raw data files and the data scripts in
+    data_multiarea. The hash is computed once per process.
+    """
+    global _data_version
+    if _data_version is None:
+        data_dir = os.path.join(base_path, 'multiarea_model', 'data_multiarea')
+        files = [os.path.join('raw_data', fn) for fn in
+                 os.listdir(os.path.join(data_dir, 'raw_data'))]
+        files += [fn for fn in os.listdir(data_dir) if
+                  os.path.splitext(fn)[1] in ['.py', '.R']]
+        md5 = hashlib.md5()
+        for fn in sorted(files):
+            md5.update(fn.encode('utf-8'))
+            with open(os.path.join(data_dir, fn), 'rb') as f:
+                md5.update(f.read())
+        _data_version = md5.hexdigest()
+    return _data_version
+
+
+def data_cache_key(custom_params, ignored_params=None):
+    """
+    Return the cache key for a dictionary of custom network
+    parameters. The key is computed from a canonical serialization of
+    all parameters that enter the data scripts, completed by their
+    default values, and the version of the data.
+
+    Parameters
+    ----------
+    custom_params : dict
+        Custom network parameters overwriting the default parameters.
+    ignored_params : list, optional
+        Parameters that do not enter the key, given as paths in the
+        dictionary of network parameters, e.g.
+        [('connection_params', 'g')]. Used to compute base keys.
+        Defaults to None.
+    """
+    params = deepcopy(network_params)
+    nested_update(params, custom_params)
+    if ignored_params is not None:
+        for path in ignored_params:
+            d = params
+            for key in path[:-1]:
+                d = d[key]
+            d[path[-1]] = None
+    d = {'surface': params['surface'],
+         'single_neuron_dict': params['neuron_params']['single_neuron_dict'],
+         'connection_params': {key: val for key, val in params['connection_params'].items()
+                               if key not in ignored_connection_params}}
+    key_dict = {'params': d, 'data_version': data_version()}
+    if ignored_params is not None:
+        key_dict['ignored_params'] = [list(path) for path in ignored_params]
+    s = json.dumps(key_dict, sort_keys=True)
+    return hashlib.md5(s.encode('utf-8')).hexdigest()
+
+
+def _cache_fn(key):
+    return os.path.join(cache_dir, 'Data_Model_{}.json'.format(key))
+
+
+def _base_fn(base_key, key):
+    # Empty file registering the data file of key under base_key
+    return os.path.join(cache_dir, 'Base_Model_{}_{}'.format(base_key, key))
+
+
+def is_cached(key):
+    """
+    Return whether the data file for the given key is in the cache.
+
+    Parameters
+    ----------
+    key : str
+        Cache key of the data file.
+    """
+    return os.path.exists(_cache_fn(key))
+
+
+def read_from_cache(key):
+    """
+    Load the content of the cached data file for the given key.
+    Returns None if the file is not in the cache.
+
+    Parameters
+    ----------
+    key : str
+        Cache key of the data file.
+    """
+    cache_fn = _cache_fn(key)
+    try:
+        with open(cache_fn, 'r') as f:
+            dat = json.load(f)
+        # Mark file as recently used
+        os.utime(cache_fn)
+    except FileNotFoundError:
+        # Not in the cache or evicted by another process in the meantime
+        return None
+    return dat
+
+
+def read_base_from_cache(base_key):
+    """
+    Load the content of the most recently used cached data file
+    registered under the given base key. Returns None if there is
+    no such file in the cache.
+
+    Parameters
+    ----------
+    base_key : str
+        Base key of the data file, see data_cache_key.
+    """
+    prefix = 'Base_Model_{}_'.format(base_key)
+    try:
+        keys = [fn[len(prefix):] for fn in os.listdir(cache_dir) if fn.startswith(prefix)]
+    except FileNotFoundError:
+        return None
+    entries = []
+    for key in keys:
+        try:
+            entries.append((os.stat(_cache_fn(key)).st_mtime, key))
+        except FileNotFoundError:
+            continue
+    for mtime, key in sorted(entries, reverse=True):
+        dat = read_from_cache(key)
+        if dat is not None:
+            return dat
+    return None
+
+
+def load_from_cache(key, fn):
+    """
+    Copy the cached data file for the given key to fn.
+    Returns True if the file was found in the cache and False otherwise.
+
+    Parameters
+    ----------
+    key : str
+        Cache key of the data file.
+    fn : str
+        File name to copy the cached file to.
+    """
+    cache_fn = _cache_fn(key)
+    if os.path.exists(fn):
+        os.remove(fn)
+    try:
+        try:
+            os.link(cache_fn, fn)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # Hard links are not supported on every file system
+            shutil.copyfile(cache_fn, fn)
+        # Mark file as recently used
+        os.utime(cache_fn)
+    except FileNotFoundError:
+        # Not in the cache or evicted by another process in the meantime
+        return False
+    return True
+
+
+def store_in_cache(key, fn, max_size=None, base_key=None):
+    """
+    Store a data file in the cache. Afterwards, evict old files
+    if the cache exceeds its maximal size.
+
+    Parameters
+    ----------
+    key : str
+        Cache key of the data file.
+    fn : str or dict
+        File to be stored in the cache or the data to be stored
+        in the cache as json file.
+    max_size : int, optional
+        Maximal total size of the cache in bytes. Defaults to
+        `model_cache_size` which can be defined in config.py.
+    base_key : str, optional
+        Base key to register the data file under, see
+        read_base_from_cache. Defaults to None.
+    """
+    try:
+        os.makedirs(cache_dir)
+    except FileExistsError:
+        pass
+    # Write to a temporary file first and rename it afterwards because
+    # renaming is atomic
+    tmp_fn = os.path.join(cache_dir, '.tmp_{}_{}'.format(os.getpid(), key))
+    try:
+        if isinstance(fn, dict):
+            with open(tmp_fn, 'w') as f:
+                json.dump(fn, f)
+        else:
+            shutil.copyfile(fn, tmp_fn)
+        os.replace(tmp_fn, _cache_fn(key))
+    except BaseException:
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+        raise
+    if base_key is not None:
+        open(_base_fn(base_key, key), 'w').close()
+    evict_cache(max_size)
+
+
+def evict_cache(max_size=None):
+    """
+    Remove the least recently used files from the cache until its
+    total size is below max_size, and the base key entries of all
+    removed files.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximal total size of the cache in bytes. Defaults to
+        `model_cache_size` which can be defined in config.py.
+    """
+    if max_size is None:
+        max_size = model_cache_size
+    entries = []
+    base_entries = []
+    for fn in os.listdir(cache_dir):
+        if fn.startswith('Base_Model_'):
+            base_entries.append(fn)
+        if not fn.startswith('Data_Model_'):
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, fn))
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, fn))
+    total_size = sum(entry[1] for entry in entries)
+    for mtime, size, fn in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, fn))
+        except FileNotFoundError:
+            # Already evicted by another process
+            pass
+        total_size -= size
+    for fn in base_entries:
+        key = fn.split('_')[-1]
+        if not os.path.exists(_cache_fn(key)):
+            try:
+                os.remove(os.path.join(cache_dir, fn))
+            except FileNotFoundError:
+                pass
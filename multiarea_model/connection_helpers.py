@@ -0,0 +1,283 @@
+"""
+connection_helpers
+==============
+
+Helper functions to compile the connections between populations of a
+simulated network into a connection plan before creating them in
+NEST.
+
+A connection plan is a table of all projections with at least one
+synapse, stored as a dictionary of numpy arrays with one entry per
+projection. It contains the GID ranges of the source and target
+population, the number of synapses and the parameters of the
+distributions of weights and delays (see plan_columns). The
+projections are ordered by the GIDs of their target and source
+populations, so that consecutive calls of nest.Connect create
+synapses on the same target neurons.
+
+Functions
+---------
+
+delay_bounds : Determine the bounds of the delays from the simulation parameters
+connection_plan : Compile the projections between pairs of areas into a plan
+delay_report : Compute the shift of the delay distributions caused by their bounds
+concatenate_plans : Join several connection plans
+write_connection_plan : Write a connection plan to a text file
+read_connection_plan : Load a connection plan from a text file
+"""
+
+import numpy as np
+
+# Columns of a connection plan
+plan_columns = ['target_area', 'target_pop', 'source_area', 'source_pop',
+                'target_first', 'target_last', 'source_first', 'source_last',
+                'N', 'weight_mean', 'weight_sd', 'weight_low', 'weight_high',
+                'delay_mean', 'delay_sd', 'delay_low', 'delay_high']
+
+
+def delay_bounds(sim_params):
+    """
+    Determine the lower bounds of the delays of connections within
+    ('intra_area') and between ('inter_area') areas and the upper
+    bound of all delays from the simulation parameters delay_floor,
+    min_delay, max_delay and dt.
+
+    Parameters
+    ----------
+    sim_params : dict
+        Simulation parameters.
+
+    Returns
+    -------
+    bounds : dict
+        Dictionary with the keys 'intra_area', 'inter_area' (lower
+        bounds) and 'max' (upper bound, np.inf if max_delay is not
+        defined).
+    """
+    dt = sim_params['dt']
+    min_delay = sim_params['min_delay']
+    max_delay = sim_params['max_delay']
+    if (min_delay is None) != (max_delay is None):
+        raise ValueError("min_delay and max_delay have to be defined together.")
+    if min_delay is None:
+        lowest = dt
+        max_delay = np.inf
+    else:
+        if min_delay < dt or max_delay < min_delay:
+            raise ValueError("The delays have to fulfill dt <= min_delay <= max_delay.")
+        lowest = min_delay
+    bounds = {'max': max_delay}
+    for key in ['intra_area', 'inter_area']:
+        floor = sim_params['delay_floor'][key]
+        if floor is None:
+            floor = lowest
+        if floor < lowest or floor > max_delay:
+            raise ValueError("The delay floor {} has to lie between "
+                             "{} and {}.".format(key, lowest, max_delay))
+        bounds[key] = floor
+    return bounds
+
+
+def connection_plan(network, gids, pairs, sim_params):
+    """
+    Compile the projections between the populations of the given pairs
+    of areas into a connection plan.
+
+    Connections within an area have delays with mean delay_e or
+    delay_i depending on the type of the source population and
+    weights clipped at zero to preserve their sign. Connections
+    between areas have delays with mean distance / interarea_speed.
+    The delays are clipped at the bounds given by delay_bounds.
+
+    Parameters
+    ----------
+    network : MultiAreaModel or SubModel
+        Network defining synapse numbers, weights and delays.
+    gids : dict or None
+        Dictionary with levels area --> population containing the
+        first and last GID of the populations of all areas in pairs.
+        If None, the GID columns of the plan are set to -1.
+    pairs : list
+        List of (target area, source area) tuples.
+    sim_params : dict
+        Simulation parameters defining the bounds of the delays.
+
+    Returns
+    -------
+    plan : dict
+        Dictionary of arrays with the keys defined in plan_columns.
+    """
+    structure = network.structure
+    area_list = network.area_list
+    area_of_pop = np.array([i for i, area in enumerate(area_list)
+                            for pop in structure[area]], dtype=int)
+    pop_names = np.array([pop for area in area_list for pop in structure[area]])
+    area_names = np.array(area_list)
+    first = np.full(area_of_pop.size, -1, dtype=int)
+    last = np.full(area_of_pop.size, -1, dtype=int)
+    for i, (area, pop) in enumerate(zip(area_names[area_of_pop], pop_names)):
+        if gids is not None and area in gids:
+            first[i], last[i] = gids[area][pop]
+
+    area_index = {area: i for i, area in enumerate(area_list)}
+    pair_mask = np.zeros((len(area_list), len(area_list)), dtype=bool)
+    for target_area, source_area in pairs:
+        pair_mask[area_index[target_area], area_index[source_area]] = True
+
+    # Only integer numbers of synapses can be created
+    N = network.syn_matrix[:, :-1].astype(int)
+    mask = pair_mask[area_of_pop[:, np.newaxis], area_of_pop[np.newaxis, :]] & (N > 0)
+    targets, sources = np.nonzero(mask)
+    order = np.lexsort((first[sources], first[targets]))
+    targets = targets[order]
+    sources = sources[order]
+    if gids is not None and (np.any(first[targets] < 0) or np.any(first[sources] < 0)):
+        raise KeyError("GIDs of all areas in the connection plan have to be defined.")
+
+    W_sd_matrix = network.W_sd.to_matrix(structure)
+    delay_params = network.params['delay_params']
+    intra = area_of_pop[targets] == area_of_pop[sources]
+    excitatory = np.array(['E' in pop for pop in pop_names])[sources]
+    distances = np.array([[network.distances[target_area][source_area]
+                           if target_area != source_area else 0.
+                           for source_area in area_list] for target_area in area_list])
+    inter_delay = distances[area_of_pop[targets], area_of_pop[sources]] / \
+        delay_params['interarea_speed']
+    intra_delay = np.where(excitatory, delay_params['delay_e'], delay_params['delay_i'])
+    delay_mean = np.where(intra, intra_delay, inter_delay)
+    bounds = delay_bounds(sim_params)
+
+    plan = {'target_area': area_names[area_of_pop[targets]],
+            'target_pop': pop_names[targets],
+            'source_area': area_names[area_of_pop[sources]],
+            'source_pop': pop_names[sources],
+            'target_first': first[targets],
+            'target_last': last[targets],
+            'source_first': first[sources],
+            'source_last': last[sources],
+            'N': N[targets, sources],
+            'weight_mean': network.W_matrix[targets, sources],
+            'weight_sd': W_sd_matrix[targets, sources],
+            'weight_low': np.where(intra & excitatory, 0., -np.inf),
+            'weight_high': np.where(intra & ~excitatory, 0., np.inf),
+            'delay_mean': delay_mean,
+            'delay_sd': delay_mean * delay_params['delay_rel'],
+            'delay_low': np.where(intra, bounds['intra_area'], bounds['inter_area']),
+            'delay_high': np.full(targets.size, float(bounds['max']))}
+    return plan
+
+
+def delay_report(plan, dt):
+    """
+    Compute how much the bounds of the delays in a connection plan
+    shift the delay distributions of the connections within and
+    between areas compared to distributions clipped only at dt.
+
+    Parameters
+    ----------
+    plan : dict
+        Connection plan.
+    dt : float
+        Resolution of the simulation.
+
+    Returns
+    -------
+    report : dict
+        Dictionary with the smallest lower bound of all delays
+        ('min_delay') and, for 'intra_area' and 'inter_area', the
+        number of synapses ('synapses'), the lower bound ('floor'),
+        the fraction of delays drawn outside of the bounds
+        from the distributions clipped at dt ('fraction_shifted'), the
+        mean delay with the distributions clipped at dt
+        ('mean_delay_dt') and at the bounds ('mean_delay'), and their
+        difference ('shift'). Averages are weighted by the number of
+        synapses.
+    """
+    from scipy.stats import truncnorm
+
+    mu = plan['delay_mean']
+    # Avoid division by zero for deterministic delays
+    sd = np.maximum(plan['delay_sd'], np.finfo(float).tiny)
+    low = plan['delay_low']
+    high = plan['delay_high']
+    a_dt = (dt - mu) / sd
+    mean_dt = truncnorm.mean(a_dt, np.inf, loc=mu, scale=sd)
+    mean = truncnorm.mean((low - mu) / sd, (high - mu) / sd, loc=mu, scale=sd)
+    fraction = (truncnorm.cdf(low, a_dt, np.inf, loc=mu, scale=sd) +
+                truncnorm.sf(high, a_dt, np.inf, loc=mu, scale=sd))
+
+    report = {'min_delay': float(np.min(low)) if low.size > 0 else None}
+    intra = plan['target_area'] == plan['source_area']
+    for key, mask in [('intra_area', intra), ('inter_area', ~intra)]:
+        N = plan['N'][mask]
+        if N.sum() == 0:
+            report[key] = None
+            continue
+        report[key] = {'synapses': int(N.sum()),
+                       'floor': float(np.min(low[mask])),
+                       'fraction_shifted': float(np.average(fraction[mask], weights=N)),
+                       'mean_delay_dt': float(np.average(mean_dt[mask], weights=N)),
+                       'mean_delay': float(np.average(mean[mask], weights=N))}
+        report[key]['shift'] = report[key]['mean_delay'] - report[key]['mean_delay_dt']
+    return report
+
+
+def concatenate_plans(plans):
+    """
+    Join several connection plans into one, keeping the order of
+    the projections.
+
+    Parameters
+    ----------
+    plans : list
+        List of connection plans.
+    """
+    columns = list(plans[0].keys())
+    return {column: np.concatenate([plan[column] for plan in plans])
+            for column in columns}
+
+
+def write_connection_plan(plan, fn):
+    """
+    Write a connection plan to a text file with one line per
+    projection, so that plans of different runs can be compared
+    with a text diff.
+
+    Parameters
+    ----------
+    plan : dict
+        Connection plan.
+    fn : str
+        File name.
+    """
+    columns = list(plan.keys())
+    rows = zip(*[plan[column].tolist() for column in columns])
+    with open(fn, 'w') as f:
+        f.write(','.join(columns) + '\n')
+        for row in rows:
+            f.write(','.join(map(str, row)) + '\n')
+
+
+def read_connection_plan(fn):
+    """
+    Load a connection plan from a text file written by
+    write_connection_plan.
+
+    Parameters
+    ----------
+    fn : str
+        File name.
+    """
+    with open(fn, 'r') as f:
+        columns = f.readline().strip().split(',')
+        rows = [line.strip().split(',') for line in f]
+    plan = {}
+    for i, column in enumerate(columns):
+        values = [row[i] for row in rows]
+        if column in ['target_area', 'target_pop', 'source_area', 'source_pop']:
+            plan[column] = np.array(values)
+        elif column in ['target_first', 'target_last', 'source_first', 'source_last', 'N']:
+            plan[column] = np.array(values, dtype=int)
+        else:
+            plan[column] = np.array(values, dtype=float)
+    return plan
@@ -0,0 +1,468 @@
+"""
+connectivity_tensor
+===================
+
+Array-backed storage of the connectivity of the multi-area model.
+
+Classes
+-------
+
+ConnectivityTensor : Stores a quantity defined for every pair of
+populations in the network (indegrees, synapse numbers, synaptic
+weights) as an array indexed by (target area, target population,
+source area, source population), together with the corresponding
+quantity for the external input to each population. Provides
+dictionary-style access with the same layout as the nested
+dictionaries used throughout the code:
+tensor[target_area][target_pop][source_area][source_pop] and
+tensor[target_area][target_pop]['external']['external'].
+
+"""
+
+import numpy as np
+
+from collections.abc import Mapping, MutableMapping
+from .default_params import complete_area_list, population_list
+from .multiarea_helpers import structure_index
+
+
+class ConnectivityTensor:
+    def __init__(self, values, external=None, area_list=complete_area_list,
+                 pop_list=population_list):
+        """
+        Connectivity tensor class.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Array of shape (len(area_list), len(pop_list),
+            len(area_list), len(pop_list)) indexed by
+            (target area, target population, source area, source population).
+        external : numpy.ndarray, optional
+            Array of shape (len(area_list), len(pop_list)) indexed by
+            (target area, target population) holding the values for
+            the external input. Defaults to None, i.e. no external input.
+        area_list : list, optional
+            List of areas. Defines the order of areas along the
+            area axes. Defaults to the complete_area_list defined in
+            default_params.
+        pop_list : list, optional
+            List of populations. Defines the order of populations
+            along the population axes. Defaults to the
+            population_list defined in default_params.
+        """
+        self.area_list = list(area_list)
+        self.pop_list = list(pop_list)
+        self.values = np.asarray(values, dtype=float)
+        shape = (len(self.area_list), len(self.pop_list))
+        assert(self.values.shape == shape + shape)
+        if external is not None:
+            external = np.asarray(external, dtype=float)
+            assert(external.shape == shape)
+        self.external = external
+        self.area_index = {area: i for i, area in enumerate(self.area_list)}
+        self.pop_index = {pop: i for i, pop in enumerate(self.pop_list)}
+
+    @classmethod
+    def from_dict(cls, d, area_list=complete_area_list, pop_list=population_list):
+        """
+        Create a tensor from a nested dictionary with levels
+        target area --> target population --> source area --> source population.
+        If the dictionary contains an entry 'external' for the target
+        populations, this is stored as external input.
+
+        Parameters
+        ----------
+        d : dict
+            Dictionary to be converted.
+        area_list : list, optional
+            List of areas. Defaults to the complete_area_list defined
+            in default_params.
+        pop_list : list, optional
+            List of populations. Defaults to the population_list
+            defined in default_params.
+        """
+        values = np.array([[[[d[target_area][target_pop][source_area][source_pop]
+                              for source_pop in pop_list]
+                             for source_area in area_list]
+                            for target_pop in pop_list]
+                           for target_area in area_list], dtype=float)
+        if 'external' in d[area_list[0]][pop_list[0]]:
+            external = np.array([[d[target_area][target_pop]['external']['external']
+                                  for target_pop in pop_list]
+                                 for target_area in area_list], dtype=float)
+        else:
+            external = None
+        return cls(values, external=external, area_list=area_list, pop_list=pop_list)
+
+    @classmethod
+    def from_matrix(cls, m, area_list, structure, external=None,
+                    pop_list=population_list):
+        """
+        Create a tensor from a connectivity matrix of a network
+        defined by structure. Entries for populations that do not
+        exist in the network and entries with an absolute value
+        below 1e-20 are set to zero.
+
+        Parameters
+        ----------
+        m : numpy.ndarray
+            Matrix to be converted. Additional columns
+            beyond the number of populations, e.g. the column for the
+            external input, are ignored.
+        area_list : list
+            List of areas in the network. Defines the order of areas
+            in the given matrix.
+        structure : dict
+            Structure of the network. Define the populations for each single area.
+        external : numpy.ndarray, optional
+            If None, do not include external input in the tensor.
+            If a vector with one entry per row of the matrix or an
+            array of shape (len(area_list), len(pop_list)), use it as
+            the external input. Defaults to None.
+        pop_list : list, optional
+            List of populations. Defaults to the population_list
+            defined in default_params.
+        """
+        area_index, pop_index = structure_index(area_list, structure, pop_list)
+        shape = (len(area_list), len(pop_list))
+        m = np.asarray(m, dtype=float)[:, :area_index.size]
+        m = np.where(np.abs(m) < 1e-20, 0., m)
+        values = np.zeros(shape + shape)
+        values[area_index[:, np.newaxis], pop_index[:, np.newaxis],
+               area_index[np.newaxis, :], pop_index[np.newaxis, :]] = m
+        if external is not None:
+            external = np.asarray(external, dtype=float)
+            if external.ndim == 1:
+                ext = np.zeros(shape)
+                ext[area_index, pop_index] = external
+                external = ext
+        return cls(values, external=external, area_list=area_list, pop_list=pop_list)
+
+    def __getitem__(self, target_area):
+        return _TargetAreaView(self, self.area_index[target_area])
+
+    def __iter__(self):
+        return iter(self.area_list)
+
+    def __len__(self):
+        return len(self.area_list)
+
+    def __contains__(self, target_area):
+        return target_area in self.area_index
+
+    def keys(self):
+        return list(self.area_list)
+
+    def copy(self):
+        """
+        Return a copy of the tensor.
+        """
+        if self.external is not None:
+            external = self.external.copy()
+        else:
+            external = None
+        return ConnectivityTensor(self.values.copy(), external=external,
+                                  area_list=self.area_list, pop_list=self.pop_list)
+
+    def subset(self, areas):
+        """
+        Return a tensor restricted to the connections between the
+        given areas, with the areas in the given order.
+
+        Parameters
+        ----------
+        areas : list
+            List of areas to be kept.
+        """
+        index = [self.area_index[area] for area in areas]
+        if self.external is not None:
+            external = self.external[index]
+        else:
+            external = None
+        return ConnectivityTensor(self.values[index][:, :, index], external=external,
+                                  area_list=areas, pop_list=self.pop_list)
+
+    def to_dict(self):
+        """
+        Convert the tensor to a nested dictionary with levels
+        target area --> target population --> source area --> source population.
+        """
+        values = self.values.tolist()
+        if self.external is not None:
+            external = self.external.tolist()
+        d = {}
+        for i, target_area in enumerate(self.area_list):
+            d[target_area] = {}
+            for k, target_pop in enumerate(self.pop_list):
+                d_pop = {source_area: dict(zip(self.pop_list, values[i][k][j]))
+                         for j, source_area in enumerate(self.area_list)}
+                if self.external is not None:
+                    d_pop['external'] = {'external': external[i][k]}
+                d[target_area][target_pop] = d_pop
+        return d
+
+    def to_matrix(self, structure):
+        """
+        Convert the tensor to a connectivity matrix of a network defined by
+        structure. The last column of the matrix contains the external
+        input and is zero if the tensor does not contain external input.
+
+        Parameters
+        ----------
+        structure : dict
+            Structure of the network. Define the populations for each single area.
+        """
+        area_index, pop_index = structure_index(self.area_list, structure, self.pop_list)
+        M = np.zeros((area_index.size, area_index.size + 1))
+        M[:, :-1] = self.values[area_index[:, np.newaxis], pop_index[:, np.newaxis],
+                                area_index[np.newaxis, :], pop_index[np.newaxis, :]]
+        if self.external is not None:
+            M[:, -1] = self.external[area_index, pop_index]
+        return M
+
+    def block(self, target_area, source_area):
+        """
+        Return the array of shape (len(pop_list), len(pop_list))
+        holding the values for all pairs of populations of the
+        given target and source area.
+
+        Parameters
+        ----------
+        target_area : str
+            Target area of the projection
+        source_area : str
+            Source area of the projection
+        """
+        return self.values[self.area_index[target_area], :, self.area_index[source_area], :]
+
+    def area_dict(self, target_area, source_area, structure):
+        """
+        Return a dictionary with levels target population --> source
+        population for the given pair of areas, restricted to the
+        populations defined in structure. Equivalent to
+        multiarea_helpers.extract_area_dict.
+
+        Parameters
+        ----------
+        target_area : str
+            Target area of the projection
+        source_area : str
+            Source area of the projection
+        structure : dict
+            Structure of the network. Define the populations for each single area.
+        """
+        block = self.block(target_area, source_area)
+        source_pops = [(self.pop_index[pop], pop) for pop in structure[source_area]]
+        return {pop: {pop2: block[self.pop_index[pop], j].item() for j, pop2 in source_pops}
+                for pop in structure[target_area]}
+
+    def indegrees(self, neuron_numbers):
+        """
+        Return the tensor of indegrees, assuming that the tensor holds
+        synapse numbers. Indegrees onto non-existing populations are
+        set to zero.
+
+        Parameters
+        ----------
+        neuron_numbers : dict
+            Dictionary of population sizes.
+        """
+        N = population_array(neuron_numbers, self.area_list, self.pop_list)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where((N > 0.)[:, :, np.newaxis, np.newaxis],
+                              self.values / N[:, :, np.newaxis, np.newaxis], 0.)
+            if self.external is not None:
+                external = np.where(N > 0., self.external / N, 0.)
+            else:
+                external = None
+        return ConnectivityTensor(values, external=external,
+                                  area_list=self.area_list, pop_list=self.pop_list)
+
+    def outdegrees(self, neuron_numbers):
+        """
+        Return the tensor of outdegrees, assuming that the tensor holds
+        synapse numbers. Outdegrees from non-existing populations are
+        set to zero. The returned tensor does not contain external input.
+
+        Parameters
+        ----------
+        neuron_numbers : dict
+            Dictionary of population sizes.
+        """
+        N = population_array(neuron_numbers, self.area_list, self.pop_list)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where((N > 0.)[np.newaxis, np.newaxis, :, :],
+                              self.values / N[np.newaxis, np.newaxis, :, :], 0.)
+        return ConnectivityTensor(values, area_list=self.area_list, pop_list=self.pop_list)
+
+    def synapse_numbers(self, neuron_numbers):
+        """
+        Return the tensor of synapse numbers, assuming that the tensor
+        holds indegrees.
+
+        Parameters
+        ----------
+        neuron_numbers : dict
+            Dictionary of population sizes.
+        """
+        N = population_array(neuron_numbers, self.area_list, self.pop_list)
+        values = self.values * N[:, :, np.newaxis, np.newaxis]
+        if self.external is not None:
+            external = self.external * N
+        else:
+            external = None
+        return ConnectivityTensor(values, external=external,
+                                  area_list=self.area_list, pop_list=self.pop_list)
+
+    def area_level_dict(self, neuron_numbers):
+        """
+        Convert the tensor, assuming that it holds indegrees, to a
+        dictionary of area-level indegrees with levels target area -->
+        source area. Equivalent to multiarea_helpers.area_level_dict.
+
+        Parameters
+        ----------
+        neuron_numbers : dict
+            Dictionary of population sizes.
+        """
+        N = population_array(neuron_numbers, self.area_list, self.pop_list)
+        N_total = np.array([neuron_numbers[area]['total'] for area in self.area_list])
+        conns = np.einsum('ikjl,ik->ij', self.values, N) / N_total[:, np.newaxis]
+        d = {}
+        for i, target_area in enumerate(self.area_list):
+            d[target_area] = dict(zip(self.area_list, conns[i].tolist()))
+            if self.external is not None:
+                d[target_area]['external'] = (np.dot(self.external[i], N[i]) /
+                                              N_total[i]).item()
+        return d
+
+
+def as_tensor(x):
+    """
+    Return x if it is a ConnectivityTensor and convert it to one if
+    it is a nested dictionary.
+
+    Parameters
+    ----------
+    x : ConnectivityTensor or dict
+        Tensor or dictionary to be converted.
+    """
+    if isinstance(x, ConnectivityTensor):
+        return x
+    return ConnectivityTensor.from_dict(x)
+
+
+def population_array(d, area_list=complete_area_list, pop_list=population_list):
+    """
+    Convert a dictionary of population-specific values (e.g. population
+    sizes) to an array of shape (len(area_list), len(pop_list)).
+
+    Parameters
+    ----------
+    d : dict
+        Dictionary to be converted.
+    area_list : list, optional
+        List of areas. Defaults to the complete_area_list defined in
+        default_params.
+    pop_list : list, optional
+        List of populations. Defaults to the population_list defined
+        in default_params.
+    """
+    return np.array([[d[area][pop] for pop in pop_list] for area in area_list], dtype=float)
+
+
+class _TargetAreaView(Mapping):
+    """
+    View on the entries of a tensor for a single target area.
+    """
+    def __init__(self, tensor, i):
+        self._tensor = tensor
+        self._i = i
+
+    def __getitem__(self, target_pop):
+        return _TargetPopView(self._tensor, self._i, self._tensor.pop_index[target_pop])
+
+    def __iter__(self):
+        return iter(self._tensor.pop_list)
+
+    def __len__(self):
+        return len(self._tensor.pop_list)
+
+
+class _TargetPopView(Mapping):
+    """
+    View on the entries of a tensor for a single target population.
+    """
+    def __init__(self, tensor, i, k):
+        self._tensor = tensor
+        self._i = i
+        self._k = k
+
+    def __getitem__(self, source_area):
+        if source_area == 'external' and self._tensor.external is not None:
+            return _ExternalView(self._tensor, self._i, self._k)
+        return _SourceAreaView(self._tensor, self._i, self._k,
+                               self._tensor.area_index[source_area])
+
+    def __iter__(self):
+        for source_area in self._tensor.area_list:
+            yield source_area
+        if self._tensor.external is not None:
+            yield 'external'
+
+    def __len__(self):
+        return len(self._tensor.area_list) + int(self._tensor.external is not None)
+
+
+class _SourceAreaView(MutableMapping):
+    """
+    View on the entries of a tensor for a single target population
+    and source area.
+    """
+    def __init__(self, tensor, i, k, j):
+        self._tensor = tensor
+        self._index = (i, k, j)
+
+    def __getitem__(self, source_pop):
+        return self._tensor.values[self._index + (self._tensor.pop_index[source_pop],)].item()
+
+    def __setitem__(self, source_pop, value):
+        self._tensor.values[self._index + (self._tensor.pop_index[source_pop],)] = value
+
+    def __delitem__(self, source_pop):
+        raise TypeError('Cannot delete entries of a connectivity tensor.')
+
+    def __iter__(self):
+        return iter(self._tensor.pop_list)
+
+    def __len__(self):
+        return len(self._tensor.pop_list)
+
+
+class _ExternalView(MutableMapping):
+    """
+    View on the external input of a single target population.
+    """
+    def __init__(self, tensor, i, k):
+        self._tensor = tensor
+        self._index = (i, k)
+
+    def __getitem__(self, key):
+        if key != 'external':
+            raise KeyError(key)
+        return self._tensor.external[self._index].item()
+
+    def __setitem__(self, key, value):
+        if key != 'external':
+            raise KeyError(key)
+        self._tensor.external[self._index] = value
+
+    def __delitem__(self, key):
+        raise TypeError('Cannot delete entries of a connectivity tensor.')
+
+    def __iter__(self):
+        return iter(['external'])
+
+    def __len__(self):
+        return 1
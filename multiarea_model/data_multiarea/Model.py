@@ -22,21 +22,45 @@ import json
 import re
 import sys
 import os
-import scipy
-import scipy.integrate
 import pprint
+from collections import OrderedDict
 from copy import deepcopy
 from nested_dict import nested_dict
 from itertools import product
+from multiarea_model.connectivity_tensor import ConnectivityTensor
 from multiarea_model.default_params import network_params, nested_update
-from multiarea_model.data_multiarea.VisualCortex_Data import process_raw_data
 
-
-def compute_Model_params(out_label='', mode='default'):
+# Network parameters entering the different stages of the data
+# scripts, given as paths in the dictionary of network parameters.
+# compute_synapse_numbers, scale_external_inputs and
+# compute_synapse_weights only read the parameters of their stage.
+stage_params = OrderedDict([
+    ('synapse_numbers', [('surface',),
+                         ('connection_params', 'av_indegree_V1')]),
+    ('external_inputs', [('connection_params', 'fac_nu_ext_5E'),
+                         ('connection_params', 'fac_nu_ext_6E'),
+                         ('connection_params', 'fac_nu_ext_TH')]),
+    ('synapse_weights', [('neuron_params', 'single_neuron_dict', 'C_m'),
+                         ('neuron_params', 'single_neuron_dict', 'tau_m'),
+                         ('neuron_params', 'single_neuron_dict', 'tau_syn_ex'),
+                         ('neuron_params', 'single_neuron_dict', 'tau_syn_in'),
+                         ('connection_params', 'PSP_e'),
+                         ('connection_params', 'PSP_e_23_4'),
+                         ('connection_params', 'PSP_ext'),
+                         ('connection_params', 'g'),
+                         ('connection_params', 'PSC_rel_sd_normal'),
+                         ('connection_params', 'PSC_rel_sd_lognormal'),
+                         ('connection_params', 'cc_weights_factor'),
+                         ('connection_params', 'cc_weights_I_factor'),
+                         ('connection_params', 'lognormal_weights'),
+                         ('connection_params', 'lognormal_EE_only')])])
+
+
+def compute_Model_params(out_label='', mode='default', engine='tensor'):
     """
     Compute the parameters of the network, in particular the size
     of populations, external inputs to them, and number of synapses
-    in every connection.
+    in every connection, and write them to a json file.
 
     Parameters
     ----------
@@ -52,22 +76,245 @@ def compute_Model_params(out_label='', mode='default'):
           that has to be stored in 'custom_data_files' and named as
           'custom_$(out_label)_parameter_dict.json' where $(out_label)
          is the string defined in `out_label`.
+    engine : str
+        Engine to compute the cortico-cortical synapse numbers.
+        See compute_Model_data. Defaults to 'tensor'.
     """
     basepath = os.path.abspath(os.path.join(os.path.dirname(__file__)))
 
+    """
+    If run in custom mode, load custom parameter file.
+    """
+    if mode == 'default':
+        prefix = 'default'
+        custom_params = None
+    elif mode == 'custom':
+        prefix = 'custom_data_files/custom'
+        with open(os.path.join(basepath, '.'.join(('_'.join((prefix,
+                                                             out_label,
+                                                             'parameter_dict')),
+                                                   'json'))), 'r') as f:
+            custom_params = json.load(f)
+
+    collected_data = compute_Model_data(custom_params, engine=engine)
+
+    """
+    Output section
+    --------------
+    All data are saved to a json file with the name structure:
+    '$(prefix) + '_Data_Model' + $(out_label) + .json'.
+    """
+    with open(os.path.join(basepath,
+                           '.'.join(('_'.join((prefix,
+                                               'Data_Model',
+                                               out_label)),
+                                     'json'))), 'w') as f:
+        json.dump(collected_data, f)
+
+
+def compute_Model_data(custom_params=None, engine='tensor'):
+    """
+    Compute the parameters of the network, in particular the size
+    of populations, external inputs to them, and number of synapses
+    in every connection, and return them without writing any files.
+
+    Parameters
+    ----------
+    custom_params : dict, optional
+        Custom parameters overwriting the default values defined
+        in default_params.py. If None, all parameters are set to
+        their default values. Defaults to None.
+    engine : str
+        Engine to compute the cortico-cortical synapse numbers.
+        - tensor engine (engine='tensor')
+          Computes the synapse numbers as arrays of shape
+          (target area, target population, source area, source population).
+        - loop engine (engine='loop')
+          Computes the synapse numbers for each pair of populations separately.
+        Both engines yield numerically identical results.
+        Defaults to 'tensor'.
+
+    Returns
+    -------
+    collected_data : dict
+        Data of the network in the format of the json files written
+        by compute_Model_params, i.e. nested dictionaries of
+        builtin types.
+    """
+    return compute_Model_data_batch([custom_params], engine=engine)[0]
+
+
+def compute_Model_data_batch(custom_params_list, engine='tensor'):
+    """
+    Compute the data of several networks at once, e.g. for a
+    parameter sweep. The raw data are processed and loaded only once.
+    The synapse numbers and the synaptic weights are computed only
+    once for all networks that share the values of the parameters
+    entering them (see stage_params), so that networks differing
+    only in, e.g., g, cc_weights_factor or fac_nu_ext_5E are obtained
+    at little additional cost.
+
+    Parameters
+    ----------
+    custom_params_list : list
+        List of dictionaries of custom parameters, see
+        compute_Model_data.
+    engine : str
+        Engine to compute the cortico-cortical synapse numbers.
+        See compute_Model_data. Defaults to 'tensor'.
+
+    Returns
+    -------
+    data_list : list
+        Data of each network, see compute_Model_data. Entries that
+        are identical for several networks are shared between the
+        returned dictionaries and must not be modified in place.
+    """
+    # Imported here because processing the raw data requires pandas
+    # and scipy, which are not needed to load cached data
+    from multiarea_model.data_multiarea.VisualCortex_Data import process_raw_data
+
     # Load and process raw data
-    process_raw_data()
-    raw_fn = os.path.join(basepath, 'viscortex_raw_data.json')
-    proc_fn = os.path.join(basepath, 'viscortex_processed_data.json')
+    raw_data, processed_data = process_raw_data()
+
+    synapse_numbers = {}
+    synapse_weights = {}
+    data_list = []
+    for custom_params in custom_params_list:
+        """
+        Overwrite default by custom values for parameters specified
+        in custom_params.
+        """
+        net_params = deepcopy(network_params)
+        if custom_params is not None:
+            nested_update(net_params, custom_params)
+            # print information on overwritten parameters
+            print("\n")
+            print("========================================")
+            print("Customized parameters")
+            print("--------------------")
+            pprint.pprint(custom_params)
+            print("========================================")
+
+        key = stage_key(net_params, 'synapse_numbers')
+        if key not in synapse_numbers:
+            # compute_synapse_numbers modifies the processed data
+            synapse_numbers[key] = _to_builtin(compute_synapse_numbers(
+                net_params, raw_data, deepcopy(processed_data), engine=engine))
+        numbers = synapse_numbers[key]
+        synapses = scale_external_inputs(numbers['synapses'], net_params)
+
+        key = stage_key(net_params, 'synapse_weights')
+        if key not in synapse_weights:
+            synapse_weights[key] = compute_synapse_weights(net_params,
+                                                           numbers['area_list'],
+                                                           numbers['population_list'])
+        synapse_weights_mean, synapse_weights_sd = synapse_weights[key]
+
+        """
+        Output section
+        --------------
+        """
+        collected_data = {'area_list': numbers['area_list'],
+                          'av_indegree_V1': numbers['av_indegree_V1'],
+                          'population_list': numbers['population_list'],
+                          'structure': numbers['structure'],
+                          'synapses_orig': synapses,
+                          'synapses': synapses,
+                          'realistic_neuron_numbers': numbers['realistic_neuron_numbers'],
+                          'realistic_synapses': synapses,
+                          'neuron_numbers': numbers['neuron_numbers'],
+                          'synapses_type_I': numbers['synapses_type_I'],
+                          'synapses_type_II': numbers['synapses_type_II'],
+                          'distances': numbers['distances'],
+                          'binzegger_processed': numbers['binzegger_processed'],
+                          'Intrinsic_FLN_completed': numbers['Intrinsic_FLN_completed'],
+                          'synapse_weights_mean': synapse_weights_mean,
+                          'synapse_weights_sd': synapse_weights_sd
+                          }
+        data_list.append(collected_data)
+    return data_list
+
+
+def update_synapse_weights(dat, custom_params=None):
+    """
+    Recompute the synaptic weights in the data of a network for the
+    given custom parameters. This yields the data of a network that
+    only differs from the given one in the parameters listed in
+    stage_params['synapse_weights'] without recomputing the synapse
+    numbers.
+
+    Parameters
+    ----------
+    dat : dict
+        Data of a network, see compute_Model_data.
+    custom_params : dict, optional
+        Custom parameters overwriting the default values defined
+        in default_params.py. Defaults to None.
+
+    Returns
+    -------
+    collected_data : dict
+        Data of the network with the new synaptic weights. All other
+        entries are shared with dat.
+    """
+    net_params = deepcopy(network_params)
+    if custom_params is not None:
+        nested_update(net_params, custom_params)
+    collected_data = dict(dat)
+    (collected_data['synapse_weights_mean'],
+     collected_data['synapse_weights_sd']) = compute_synapse_weights(net_params,
+                                                                     dat['area_list'],
+                                                                     dat['population_list'])
+    return collected_data
+
 
+def stage_key(net_params, stage):
     """
-    Load data
+    Return a string identifying the values of the parameters entering
+    the given stage of the data scripts.
+
+    Parameters
+    ----------
+    net_params : dict
+        Complete network parameters.
+    stage : str
+        Stage of the data scripts, one of the keys of stage_params.
+    """
+    values = []
+    for path in stage_params[stage]:
+        val = net_params
+        for key in path:
+            val = val[key]
+        values.append(val)
+    return json.dumps(_to_builtin(values), sort_keys=True)
+
+
+def compute_synapse_numbers(net_params, raw_data, processed_data, engine='tensor'):
     """
-    with open(raw_fn, 'r') as f:
-        raw_data = json.load(f)
-    with open(proc_fn, 'r') as f:
-        processed_data = json.load(f)
+    Compute the size of populations, the number of synapses in every
+    connection and the number of external inputs to each population
+    before applying the factors fac_nu_ext_5E, fac_nu_ext_6E and
+    fac_nu_ext_TH. Only depends on the parameters listed in
+    stage_params['synapse_numbers'].
 
+    Parameters
+    ----------
+    net_params : dict
+        Complete network parameters.
+    raw_data : dict
+        Content of viscortex_raw_data.json.
+    processed_data : dict
+        Content of viscortex_processed_data.json. Modified in place.
+    engine : str
+        Engine to compute the cortico-cortical synapse numbers.
+        See compute_Model_data. Defaults to 'tensor'.
+
+    Returns
+    -------
+    collected_data : dict
+        Data of the network without the synaptic weights.
+    """
     FLN_EDR_completed = processed_data['FLN_completed']
     SLN_Data = processed_data['SLN_completed']
     Coco_Data = processed_data['cocomac_completed']
@@ -114,30 +361,6 @@ def compute_Model_params(out_label='', mode='default'):
             if neuronal_numbers_fullscale[area][pop] > 0.0:
                 structure[area].append(pop)
 
-    """
-    If run in custom mode, load custom parameter file and
-    overwrite default by custom values for parameters specified
-    in the parameter file.
-    """
-    net_params = deepcopy(network_params)
-    if mode == 'default':
-        prefix = 'default'
-    elif mode == 'custom':
-        prefix = 'custom_data_files/custom'
-        with open(os.path.join(basepath, '.'.join(('_'.join((prefix,
-                                                             out_label,
-                                                             'parameter_dict')),
-                                                   'json'))), 'r') as f:
-            custom_params = json.load(f)
-        nested_update(net_params, custom_params)
-        # print information on overwritten parameters
-        print("\n")
-        print("========================================")
-        print("Customized parameters")
-        print("--------------------")
-        pprint.pprint(custom_params)
-        print("========================================")
-
     """
     Define parameter values
     """
@@ -151,44 +374,6 @@ def compute_Model_params(out_label='', mode='default'):
     # taken to be constant across areas)
     av_indegree_V1 = conn_params['av_indegree_V1']
 
-    # Increase the external poisson indegree onto 5E and 6E
-    fac_nu_ext_5E = conn_params['fac_nu_ext_5E']
-    fac_nu_ext_6E = conn_params['fac_nu_ext_6E']
-    # to increase the ext. input to 23E and 5E in area TH
-    fac_nu_ext_TH = conn_params['fac_nu_ext_TH']
-
-    # Single neuron parameters, important to determine synaptic weights
-    single_neuron_dict = net_params['neuron_params']['single_neuron_dict']
-    C_m = single_neuron_dict['C_m']
-    tau_m = single_neuron_dict['tau_m']
-    tau_syn_ex = single_neuron_dict['tau_syn_ex']
-    tau_syn_in = single_neuron_dict['tau_syn_in']
-
-    # synapse weight parameters for current-based neurons
-    # excitatory intracortical synaptic weight (mV)
-    PSP_e = conn_params['PSP_e']
-    PSP_e_23_4 = conn_params['PSP_e_23_4']
-    # synaptic weight (mV) for external input
-    PSP_ext = conn_params['PSP_ext']
-    # relative strength of inhibitory versus excitatory synapses for CUBA neurons
-    g = conn_params['g']
-
-    # relative SD of normally distributed synaptic weights
-    PSC_rel_sd_normal = conn_params['PSC_rel_sd_normal']
-    # relative SD of lognormally distributed synaptic weights
-    PSC_rel_sd_lognormal = conn_params['PSC_rel_sd_lognormal']
-
-    # scaling factor for cortico-cortical connections (chi)
-    cc_weights_factor = conn_params['cc_weights_factor']
-    # factor to scale cortico-cortical inh. weights in relation to exc. weights (chi_I)
-    cc_weights_I_factor = conn_params['cc_weights_I_factor']
-
-    # switch whether to distribute weights lognormally
-    lognormal_weights = conn_params['lognormal_weights']
-    # switch whether to distribute only EE weight lognormally if
-    # switch_lognormal_weights = True
-    lognormal_EE_only = conn_params['lognormal_EE_only']
-
     # whether to redistribute CC synapse to meet literature value
     # of E-specificity
     E_specificity = True
@@ -254,19 +439,6 @@ def compute_Model_params(out_label='', mode='default'):
     C_prime_mean_PD14 = 2. / (r_PD14 ** 2) * C0 * sigma ** 2 * \
         (1. - np.exp(-r_PD14 ** 2 / (2 * sigma ** 2)))
 
-    # New calculation based on Sheng (1985), The distance between two random
-    # points in plane regions, Theorem 2.4 on the expectation value of
-    # arbitrary functions of distance between points in disks.
-    """
-    Define integrand for Gaussian averaging
-    """
-    def integrand(r, R, sig):
-        gauss = np.exp(-r ** 2 / (2 * sig ** 2))
-        x1 = scipy.arctan(np.sqrt((2 * R - r) / (2 * R + r)))
-        x2 = scipy.sin(4 * scipy.arctan(np.sqrt((2 * R - r) / (2 * R + r))))
-        factor = 4 * x1 - x2
-        return r * gauss * factor
-
     """
     Define approximation for function log(1-x) needed for large areas
     """
@@ -276,6 +448,32 @@ def compute_Model_params(out_label='', mode='default'):
             res += x ** (k + 1) * (-1.) ** k / (k + 1)
         return res
 
+    """
+    Define indegrees of all areas for given mean connection probabilities
+    and surfaces, vectorized across areas and pairs of populations
+    """
+    conn_prob_PD14 = np.array([[Intra_areal[target_pop][source_pop]
+                                for source_pop in population_list]
+                               for target_pop in population_list])
+    N_V1 = np.array([num_V1[pop]['neurons'] for pop in population_list])
+
+    def indegrees_prime(C_prime_mean, surfaces):
+        A = np.array([surfaces[area] for area in area_list])[:, np.newaxis, np.newaxis]
+        C = (conn_prob_PD14[np.newaxis] *
+             np.array([C_prime_mean[area] for area in area_list])[:, np.newaxis, np.newaxis] /
+             C_prime_mean_PD14)
+        p = 1. / (N_V1[np.newaxis, :, np.newaxis] * N_V1[np.newaxis, np.newaxis, :] * A ** 2)
+        with np.errstate(all='ignore'):
+            # Limit to choose between np.log and log_approx
+            K = np.where(A < 100.,
+                         np.log(1.0 - C) / np.log(1. - p),
+                         log_approx(C, 20) / log_approx(p, 20))
+        # Adding 0. turns the -0. of empty connections into 0.
+        K = (np.round(K) + 0.) / (N_V1[np.newaxis, :, np.newaxis] * A)
+        return {area: {target_pop: dict(zip(population_list, K[i, j].tolist()))
+                       for j, target_pop in enumerate(population_list)}
+                for i, area in enumerate(area_list)}
+
     """
     To determine the conversion from the microcircuit model to the
     area-specific composition in our model properly, we have to
@@ -287,26 +485,9 @@ def compute_Model_params(out_label='', mode='default'):
     Determine mean connection probability, indegrees and intrinsic FLN
     for full-scale areas.
     """
-    C_prime_fullscale_mean = {}
-    for area in area_list:
-        R_area = np.sqrt(Area_surfaces[area] / np.pi)
-        C_prime_fullscale_mean[area] = 2 * C0 / Area_surfaces[area] * \
-            scipy.integrate.quad(integrand, 0, 2 * R_area, args=(R_area, sigma))[0]
-
-    Indegree_prime_fullscale = nested_dict()
-    for area, target_pop, source_pop in product(area_list, population_list, population_list):
-        C = Intra_areal[target_pop][source_pop] * \
-            C_prime_fullscale_mean[area] / C_prime_mean_PD14
-        if Area_surfaces[area] < 100.:  # Limit to choose between np.log and log_approx
-            K = int(round(np.log(1.0 - C) / np.log(1. - 1. / (num_V1[target_pop][
-                'neurons'] * num_V1[source_pop]['neurons'] * Area_surfaces[area] ** 2)))) / (
-                    num_V1[target_pop]['neurons'] * Area_surfaces[area])
-        else:
-            K = int(round(log_approx(C, 20) / log_approx(1. / (num_V1[target_pop][
-                'neurons'] * num_V1[source_pop]['neurons'] * Area_surfaces[area] ** 2), 20))) / (
-                    num_V1[target_pop]['neurons'] * Area_surfaces[area])
-        Indegree_prime_fullscale[area][target_pop][source_pop] = K
-    Indegree_prime_fullscale = Indegree_prime_fullscale.to_dict()
+    C_prime_fullscale_mean = dict(zip(area_list, mean_connection_probability(
+        [Area_surfaces[area] for area in area_list], sigma, C0)))
+    Indegree_prime_fullscale = indegrees_prime(C_prime_fullscale_mean, Area_surfaces)
 
     # Assign the average intrinsic FLN to each area
     mean_Intrinsic_FLN = Intrinsic_FLN_Data['mean']['mean']
@@ -320,26 +501,9 @@ def compute_Model_params(out_label='', mode='default'):
     Determine mean connection probability, indegrees and intrinsic FLN
     for areas with 1mm2 surface area.
     """
-    C_prime_mean = {}
-    for area in area_list:
-        R_area = np.sqrt(surface / np.pi)
-        C_prime_mean[area] = 2 * C0 / surface * \
-            scipy.integrate.quad(integrand, 0, 2 * R_area, args=(R_area, sigma))[0]
-
-    Indegree_prime = nested_dict()
-    for area, target_pop, source_pop in product(area_list, population_list, population_list):
-        C = Intra_areal[target_pop][source_pop] * \
-            C_prime_mean[area] / C_prime_mean_PD14
-        if surface < 100.:  # Limit to choose between np.log and log_approx
-            K = int(round(np.log(1.0 - C) / np.log(1. - 1. / (num_V1[target_pop][
-                'neurons'] * num_V1[source_pop]['neurons'] * surface ** 2)))) / (
-                    num_V1[target_pop]['neurons'] * surface)
-        else:
-            K = int(round(log_approx(C, 20) / log_approx(1. / (num_V1[target_pop][
-                'neurons'] * num_V1[source_pop]['neurons'] * surface ** 2), 20))) / (
-                    num_V1[target_pop]['neurons'] * surface)
-        Indegree_prime[area][target_pop][source_pop] = K
-    Indegree_prime = Indegree_prime.to_dict()
+    C_prime_mean = dict(zip(area_list, mean_connection_probability(
+        [surface] * len(area_list), sigma, C0)))
+    Indegree_prime = indegrees_prime(C_prime_mean, {area: surface for area in area_list})
 
     Intrinsic_FLN_completed = {}
     mean_Intrinsic_FLN = Intrinsic_FLN_Data['mean']['mean']
@@ -607,6 +771,163 @@ def compute_Model_params(out_label='', mode='default'):
         if '4I' in synapse_to_cell_body['TH'][layer]:
             del synapse_to_cell_body['TH'][layer]['4I']
 
+    def origin_factors(target_area, source_area, source_pop):
+        """
+        Compute the fraction of the synapses of a cortico-cortical
+        connection that originates in the layer of the source population (X)
+        and the fraction of these synapses that originate from the source
+        population itself (Y).
+
+        Parameters
+        ----------
+        target_area : str
+            Target area of the connection
+        source_area : str
+            Source area of the connection
+        source_pop : str
+            Source population of the connection. Has to be one of
+            the populations in origin_patterns.
+
+        Returns
+        -------
+        X : float
+            Fraction of synapses originating in the layer of the source population
+        Y : float
+            Fraction of synapses originating from the source population
+            within its layer
+        """
+        num_source = neuronal_numbers_fullscale[source_area][source_pop]
+        # if there is laminar information in CoCoMac, use it
+        if Coco_Data[target_area][source_area]['source_pattern'] is not None:
+            sp = np.array(Coco_Data[target_area][source_area][
+                          'source_pattern'], dtype=np.float)
+
+            # Manually determine SLN, based on CoCoMac:
+            # from supragranular, then SLN=0.,
+            # no connections from infragranular --> SLN=1.
+            if np.all(sp[:3] == 0):
+                SLN_value = 0.
+            elif np.all(sp[-2:] == 0):
+                SLN_value = 1.
+            else:
+                SLN_value = SLN_Data[target_area][source_area]
+
+            if source_pop in origin_patterns['S']:
+                if np.any(sp[:3] != 0):
+                    X = SLN_value
+                    Y = 1.  # Only layer 2/3 is part of the supragranular pattern
+                else:
+                    X = 0.
+                    Y = 0.
+
+            elif source_pop in origin_patterns['I']:
+                if np.any(sp[-2:] != 0):
+                    # Distribute between 5 and 6 according to CocoMac values
+                    index = list(range(1, 7)).index(int(source_pop[:-1]))
+                    if sp[index] != 0:
+                        X = 1. - SLN_value
+                        Y = 10 ** (sp[index]) / np.sum(10 **
+                                                       sp[-2:][np.where(sp[-2:] != 0)])
+                    else:
+                        X = 0.
+                        Y = 0.
+                else:
+                    X = 0.
+                    Y = 0.
+        # otherwise, use neuronal numbers
+        else:
+            if source_pop in origin_patterns['S']:
+                X = SLN_Data[target_area][source_area]
+                Y = 1.0  # Only layer 2/3 is part of the supragranular pattern
+
+            elif source_pop in origin_patterns['I']:
+                X = 1.0 - SLN_Data[target_area][source_area]
+                infra_neurons = 0.0
+                for i in origin_patterns['I']:
+                    infra_neurons += neuronal_numbers_fullscale[
+                        source_area][i]
+                Y = num_source / infra_neurons
+        return X, Y
+
+    def termination_factors(target_area, source_area):
+        """
+        Compute the distribution of the synapses of a cortico-cortical
+        connection across the layers of the target area.
+
+        Parameters
+        ----------
+        target_area : str
+            Target area of the connection
+        source_area : str
+            Source area of the connection
+
+        Returns
+        -------
+        Z : list
+            List of tuples (syn_layer, Z) with the fraction Z of synapses
+            formed in layer syn_layer, sorted by layer.
+        """
+        Z_list = []
+        # if there is laminar data in CoCoMac, use this
+        if Coco_Data[target_area][source_area]['target_pattern'] is not None:
+            tp = np.array(Coco_Data[target_area][source_area][
+                          'target_pattern'], dtype=np.float)
+
+            # If there is a '?' (=-1) in the data, check if this layer is in
+            # the termination pattern induced by hierarchy and insert a 2 if
+            # yes
+            if -1 in tp:
+                if (SLN_Data[target_area][source_area] > 0.35 and
+                        SLN_Data[target_area][source_area] <= 0.65):
+                    T_hierarchy = termination_layers2['C']
+                elif SLN_Data[target_area][source_area] < 0.35:
+                    T_hierarchy = termination_layers2['M']
+                elif SLN_Data[target_area][source_area] > 0.65:
+                    T_hierarchy = termination_layers2['F']
+                for l in T_hierarchy:
+                    if tp[l - 1] == -1:
+                        tp[l - 1] = 2
+            T = np.where(tp > 0.)[0] + 1  # '+1' transforms indices to layers
+            # Here we treat the values as numbers of labeled neurons rather
+            # than densities for the sake of simplicity
+            p_T = np.sum(10 ** tp[np.where(tp > 0.)[0]])
+            for i in range(len(T)):
+                if T[i] in [2, 3]:
+                    syn_layer = '23'
+                else:
+                    syn_layer = str(T[i])
+                Z = 10 ** tp[np.where(tp > 0.)[0]][i] / p_T
+                Z_list.append((syn_layer, Z))
+
+        # otherwise use laminar thicknesses
+        else:
+            if (SLN_Data[target_area][source_area] > 0.35 and
+                    SLN_Data[target_area][source_area] <= 0.65):
+                T = termination_layers['C']
+            elif SLN_Data[target_area][source_area] < 0.35:
+                T = termination_layers['M']
+            elif SLN_Data[target_area][source_area] > 0.65:
+                T = termination_layers['F']
+
+            p_T = 0.0
+            for i in T:
+                if i != '1':
+                    p_T += laminar_thicknesses[target_area][i]
+
+            for syn_layer in T:
+                if syn_layer == '1':
+                    Z = 0.5
+                else:
+                    if '1' in T:
+                        Z = 0.5 * \
+                            laminar_thicknesses[
+                                target_area][syn_layer] / p_T
+                    else:
+                        Z = laminar_thicknesses[
+                            target_area][syn_layer] / p_T
+                Z_list.append((syn_layer, Z))
+        return Z_list
+
     def num_CC_synapses(target_area, target_pop, source_area, source_pop):
         """
         Compute number of synapses between two populations in different areas
@@ -636,133 +957,19 @@ def compute_Model_params(out_label='', mode='default'):
             neuronal_numbers[target_area][target_pop] != 0 and
                 source_pop not in ['23I', '4I', '5I', '6I']):
 
-            num_source = neuronal_numbers_fullscale[source_area][source_pop]
-
             # information on the area level
             FLN_BA = FLN_completed[target_area][source_area]
             Nsyn_tot = rho_syn[target_area] * \
                 Area_surfaces[target_area] * total_thicknesses[target_area]
 
             # source side
-            # if there is laminar information in CoCoMac, use it
-            if Coco_Data[target_area][source_area]['source_pattern'] is not None:
-                sp = np.array(Coco_Data[target_area][source_area][
-                              'source_pattern'], dtype=np.float)
-
-                # Manually determine SLN, based on CoCoMac:
-                # from supragranular, then SLN=0.,
-                # no connections from infragranular --> SLN=1.
-                if np.all(sp[:3] == 0):
-                    SLN_value = 0.
-                elif np.all(sp[-2:] == 0):
-                    SLN_value = 1.
-                else:
-                    SLN_value = SLN_Data[target_area][source_area]
-
-                if source_pop in origin_patterns['S']:
-                    if np.any(sp[:3] != 0):
-                        X = SLN_value
-                        Y = 1.  # Only layer 2/3 is part of the supragranular pattern
-                    else:
-                        X = 0.
-                        Y = 0.
-
-                elif source_pop in origin_patterns['I']:
-                    if np.any(sp[-2:] != 0):
-                        # Distribute between 5 and 6 according to CocoMac values
-                        index = list(range(1, 7)).index(int(source_pop[:-1]))
-                        if sp[index] != 0:
-                            X = 1. - SLN_value
-                            Y = 10 ** (sp[index]) / np.sum(10 **
-                                                           sp[-2:][np.where(sp[-2:] != 0)])
-                        else:
-                            X = 0.
-                            Y = 0.
-                    else:
-                        X = 0.
-                        Y = 0.
-            # otherwise, use neuronal numbers
-            else:
-                if source_pop in origin_patterns['S']:
-                    X = SLN_Data[target_area][source_area]
-                    Y = 1.0  # Only layer 2/3 is part of the supragranular pattern
-
-                elif source_pop in origin_patterns['I']:
-                    X = 1.0 - SLN_Data[target_area][source_area]
-                    infra_neurons = 0.0
-                    for i in origin_patterns['I']:
-                        infra_neurons += neuronal_numbers_fullscale[
-                            source_area][i]
-                    Y = num_source / infra_neurons
+            X, Y = origin_factors(target_area, source_area, source_pop)
 
             # target side
-            # if there is laminar data in CoCoMac, use this
-            if Coco_Data[target_area][source_area]['target_pattern'] is not None:
-                tp = np.array(Coco_Data[target_area][source_area][
-                              'target_pattern'], dtype=np.float)
-
-                # If there is a '?' (=-1) in the data, check if this layer is in
-                # the termination pattern induced by hierarchy and insert a 2 if
-                # yes
-                if -1 in tp:
-                    if (SLN_Data[target_area][source_area] > 0.35 and
-                            SLN_Data[target_area][source_area] <= 0.65):
-                        T_hierarchy = termination_layers2['C']
-                    elif SLN_Data[target_area][source_area] < 0.35:
-                        T_hierarchy = termination_layers2['M']
-                    elif SLN_Data[target_area][source_area] > 0.65:
-                        T_hierarchy = termination_layers2['F']
-                    for l in T_hierarchy:
-                        if tp[l - 1] == -1:
-                            tp[l - 1] = 2
-                T = np.where(tp > 0.)[0] + 1  # '+1' transforms indices to layers
-                # Here we treat the values as numbers of labeled neurons rather
-                # than densities for the sake of simplicity
-                p_T = np.sum(10 ** tp[np.where(tp > 0.)[0]])
-                Nsyn = 0.0
-                su = 0.
-                for i in range(len(T)):
-                    if T[i] in [2, 3]:
-                        syn_layer = '23'
-                    else:
-                        syn_layer = str(T[i])
-                    Z = 10 ** tp[np.where(tp > 0.)[0]][i] / p_T
-                    if target_pop in synapse_to_cell_body[target_area][syn_layer]:
-                        Nsyn += synapse_to_cell_body[target_area][syn_layer][
-                            target_pop] * Nsyn_tot * FLN_BA * X * Y * Z
-
-                    su += Z
-
-            # otherwise use laminar thicknesses
-            else:
-                if (SLN_Data[target_area][source_area] > 0.35 and
-                        SLN_Data[target_area][source_area] <= 0.65):
-                    T = termination_layers['C']
-                elif SLN_Data[target_area][source_area] < 0.35:
-                    T = termination_layers['M']
-                elif SLN_Data[target_area][source_area] > 0.65:
-                    T = termination_layers['F']
-
-                p_T = 0.0
-                for i in T:
-                    if i != '1':
-                        p_T += laminar_thicknesses[target_area][i]
-
-                Nsyn = 0.0
-                for syn_layer in T:
-                    if target_pop in synapse_to_cell_body[target_area][syn_layer]:
-                        if syn_layer == '1':
-                            Z = 0.5
-                        else:
-                            if '1' in T:
-                                Z = 0.5 * \
-                                    laminar_thicknesses[
-                                        target_area][syn_layer] / p_T
-                            else:
-                                Z = laminar_thicknesses[
-                                    target_area][syn_layer] / p_T
-                        Nsyn += synapse_to_cell_body[target_area][syn_layer][
-                            target_pop] * Nsyn_tot * FLN_BA * X * Y * Z
+            for syn_layer, Z in termination_factors(target_area, source_area):
+                if target_pop in synapse_to_cell_body[target_area][syn_layer]:
+                    Nsyn += synapse_to_cell_body[target_area][syn_layer][
+                        target_pop] * Nsyn_tot * FLN_BA * X * Y * Z
 
         return Nsyn
 
@@ -776,56 +983,182 @@ def compute_Model_params(out_label='', mode='default'):
     neuronal_numbers_fullscale['TH']['4I'] = 0.0
     neuronal_numbers['TH']['4I'] = 0.0
 
-    for target_area, target_pop, source_area, source_pop in product(area_list, population_list,
-                                                                    area_list, population_list):
-        if target_area != source_area:
-            N_fullscale = neuronal_numbers_fullscale[target_area][target_pop]
-            N = neuronal_numbers[target_area][target_pop]
-            if N != 0:
-                N_syn = num_CC_synapses(target_area, target_pop,
-                                        source_area, source_pop) / N_fullscale * N
-            else:
-                N_syn = 0.0
-            synapse_numbers[target_area][target_pop][source_area][source_pop] = N_syn
+    E_specific_factor = 0.93
+    if engine == 'loop':
+        for target_area, target_pop, source_area, source_pop in product(area_list,
+                                                                        population_list,
+                                                                        area_list,
+                                                                        population_list):
+            if target_area != source_area:
+                N_fullscale = neuronal_numbers_fullscale[target_area][target_pop]
+                N = neuronal_numbers[target_area][target_pop]
+                if N != 0:
+                    N_syn = num_CC_synapses(target_area, target_pop,
+                                            source_area, source_pop) / N_fullscale * N
+                else:
+                    N_syn = 0.0
+                synapse_numbers[target_area][target_pop][source_area][source_pop] = N_syn
 
-    synapse_numbers = synapse_numbers.to_dict()
+        synapse_numbers = synapse_numbers.to_dict()
 
-    """
-    If switch_E_specificity is True, redistribute
-    the synapses of feedback connections to achieve
-    the E_specific_factor of 0.93
-    """
-    if E_specificity:
-        E_specific_factor = 0.93
+        """
+        If switch_E_specificity is True, redistribute
+        the synapses of feedback connections to achieve
+        the E_specific_factor of 0.93
+        """
+        if E_specificity:
+            for target_area in area_list:
+                for source_area in area_list:
+                    if (target_area != source_area and source_area in Coco_Data[target_area] and
+                            SLN_Data[target_area][source_area] < 0.35):
+                        syn_I = 0.0
+                        syn_E = 0.0
+                        for target_pop in synapse_numbers[target_area]:
+                            for source_pop in synapse_numbers[target_area][target_pop][
+                                    source_area]:
+                                if target_pop.find('E') > -1:
+                                    syn_E += synapse_numbers[target_area][
+                                        target_pop][source_area][source_pop]
+                                else:
+                                    syn_I += synapse_numbers[target_area][
+                                        target_pop][source_area][source_pop]
+                        if syn_E > 0.0 or syn_I > 0.0:
+                            alpha_E = syn_E / (syn_E + syn_I)
+                            alpha_I = syn_I / (syn_E + syn_I)
+                            if alpha_I != 0.0 and alpha_E != 0.0:
+                                for target_pop in synapse_numbers[target_area]:
+                                    for source_pop in synapse_numbers[target_area][
+                                            target_pop][source_area]:
+                                        N_syn = synapse_numbers[target_area][target_pop][
+                                            source_area][source_pop]
+                                        if target_pop.find('E') > -1:
+                                            synapse_numbers[target_area][target_pop][
+                                                source_area][source_pop] = (
+                                                    E_specific_factor / alpha_E * N_syn)
+                                        else:
+                                            synapse_numbers[target_area][target_pop][
+                                                source_area][source_pop] = (
+                                                    (1. - E_specific_factor) / alpha_I * N_syn)
+
+        CC_synapses = {}
         for target_area in area_list:
-            for source_area in area_list:
-                if (target_area != source_area and source_area in Coco_Data[target_area] and
-                        SLN_Data[target_area][source_area] < 0.35):
-                    syn_I = 0.0
-                    syn_E = 0.0
-                    for target_pop in synapse_numbers[target_area]:
-                        for source_pop in synapse_numbers[target_area][target_pop][source_area]:
-                            if target_pop.find('E') > -1:
-                                syn_E += synapse_numbers[target_area][
-                                    target_pop][source_area][source_pop]
-                            else:
-                                syn_I += synapse_numbers[target_area][
-                                    target_pop][source_area][source_pop]
-                    if syn_E > 0.0 or syn_I > 0.0:
-                        alpha_E = syn_E / (syn_E + syn_I)
-                        alpha_I = syn_I / (syn_E + syn_I)
-                        if alpha_I != 0.0 and alpha_E != 0.0:
-                            for target_pop in synapse_numbers[target_area]:
-                                for source_pop in synapse_numbers[target_area][
-                                        target_pop][source_area]:
-                                    N_syn = synapse_numbers[target_area][target_pop][
-                                        source_area][source_pop]
-                                    if target_pop.find('E') > -1:
-                                        synapse_numbers[target_area][target_pop][source_area][
-                                            source_pop] = E_specific_factor / alpha_E * N_syn
-                                    else:
-                                        synapse_numbers[target_area][target_pop][source_area][
-                                            source_pop] = (1. - E_specific_factor) / alpha_I * N_syn
+            CC_synapses[target_area] = 0.0
+            for target_pop, source_area, source_pop in product(population_list, area_list,
+                                                               population_list):
+                if source_area != target_area:
+                    CC_synapses[target_area] += synapse_numbers[target_area][
+                        target_pop][source_area][source_pop]
+
+    elif engine == 'tensor':
+        """
+        The tensor engine computes the same quantities as the loop
+        engine as arrays indexed by (target area, target population,
+        source area, source population). All products are evaluated in
+        the same order as in num_CC_synapses and all sums are evaluated
+        sequentially with np.cumsum to obtain numerically identical
+        results.
+        """
+        n_areas = len(area_list)
+        n_pops = len(population_list)
+        syn_layers = list(num_cc_synapses.keys())
+        # Area-level tables
+        Nsyn_tot = np.array([rho_syn[area] * Area_surfaces[area] * total_thicknesses[area]
+                             for area in area_list])
+        FLN = np.zeros((n_areas, n_areas))
+        SLN = np.ones((n_areas, n_areas))
+        connected = np.zeros((n_areas, n_areas), dtype=bool)
+        # Origin and termination patterns for each pair of areas, termination
+        # patterns are padded to the maximal number of layers (6) with Z = 0
+        X = np.zeros((n_areas, n_areas, n_pops))
+        Y = np.zeros((n_areas, n_areas, n_pops))
+        Z = np.zeros((n_areas, n_areas, 6))
+        Z_layer = np.zeros((n_areas, n_areas, 6), dtype=int)
+        source_pops = [i for i, pop in enumerate(population_list) if
+                       pop not in ['23I', '4I', '4E', '5I', '6I']]
+        for (i, target_area), (j, source_area) in product(enumerate(area_list),
+                                                          enumerate(area_list)):
+            if target_area != source_area and source_area in Coco_Data[target_area]:
+                connected[i, j] = True
+                FLN[i, j] = FLN_completed[target_area][source_area]
+                SLN[i, j] = SLN_Data[target_area][source_area]
+                for k in source_pops:
+                    X[i, j, k], Y[i, j, k] = origin_factors(target_area, source_area,
+                                                            population_list[k])
+                for k, (syn_layer, Z_value) in enumerate(termination_factors(target_area,
+                                                                             source_area)):
+                    Z[i, j, k] = Z_value
+                    Z_layer[i, j, k] = syn_layers.index(syn_layer)
+        # Conditional probabilities of synapse to cell body,
+        # shape (area, layer, target_pop)
+        s2cb = np.array([[[synapse_to_cell_body[area][layer].get(pop, 0.)
+                           for pop in population_list]
+                          for layer in syn_layers]
+                         for area in area_list])
+        N = np.array([[neuronal_numbers[area][pop] for pop in population_list]
+                      for area in area_list])
+        N_fullscale = np.array([[neuronal_numbers_fullscale[area][pop]
+                                 for pop in population_list]
+                                for area in area_list])
+
+        # Contribution of each termination layer, shape
+        # (target_area, target_pop, source_area, source_pop, layer)
+        ind_area = np.arange(n_areas)[:, np.newaxis, np.newaxis]
+        s2cb_layer = s2cb[ind_area, Z_layer, :]  # (target_area, source_area, layer, target_pop)
+        syn_layer_terms = (s2cb_layer.transpose(0, 3, 1, 2)[:, :, :, np.newaxis, :] *
+                           Nsyn_tot[:, np.newaxis, np.newaxis, np.newaxis, np.newaxis] *
+                           FLN[:, np.newaxis, :, np.newaxis, np.newaxis] *
+                           X[:, np.newaxis, :, :, np.newaxis] *
+                           Y[:, np.newaxis, :, :, np.newaxis] *
+                           Z[:, np.newaxis, :, np.newaxis, :])
+        Nsyn = np.cumsum(syn_layer_terms, axis=-1)[..., -1]
+        exists = (connected[:, np.newaxis, :, np.newaxis] &
+                  (N != 0)[:, :, np.newaxis, np.newaxis])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            syn = np.where(exists,
+                           Nsyn / N_fullscale[:, :, np.newaxis, np.newaxis] *
+                           N[:, :, np.newaxis, np.newaxis],
+                           0.)
+
+        """
+        If switch_E_specificity is True, redistribute
+        the synapses of feedback connections to achieve
+        the E_specific_factor of 0.93
+        """
+        if E_specificity:
+            E_pops = np.array([pop.find('E') > -1 for pop in population_list])
+            syn_pairs = syn.transpose(0, 2, 1, 3).reshape((n_areas, n_areas, n_pops ** 2))
+            E_mask = np.repeat(E_pops, n_pops)
+            syn_E = np.cumsum(np.where(E_mask, syn_pairs, 0.), axis=-1)[..., -1]
+            syn_I = np.cumsum(np.where(E_mask, 0., syn_pairs), axis=-1)[..., -1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                alpha_E = syn_E / (syn_E + syn_I)
+                alpha_I = syn_I / (syn_E + syn_I)
+                factor_E = E_specific_factor / alpha_E
+                factor_I = (1. - E_specific_factor) / alpha_I
+            redistribute = (connected & (SLN < 0.35) & ((syn_E > 0.0) | (syn_I > 0.0)) &
+                            (alpha_I != 0.0) & (alpha_E != 0.0))
+            factor = np.where(E_pops[np.newaxis, :, np.newaxis],
+                              factor_E[:, np.newaxis, :],
+                              factor_I[:, np.newaxis, :])
+            syn = np.where(redistribute[:, np.newaxis, :, np.newaxis],
+                           factor[:, :, :, np.newaxis] * syn,
+                           syn)
+
+        # Copy to dictionary, intrinsic synapses are already stored
+        for (i, target_area), (k, target_pop) in product(enumerate(area_list),
+                                                         enumerate(population_list)):
+            for j, source_area in enumerate(area_list):
+                if source_area != target_area:
+                    synapse_numbers[target_area][target_pop][source_area] = dict(
+                        zip(population_list, syn[i, k, j].tolist()))
+        synapse_numbers = synapse_numbers.to_dict()
+
+        CC_syn = syn.copy()
+        CC_syn[np.arange(n_areas), :, np.arange(n_areas)] = 0.
+        CC_syn = np.cumsum(CC_syn.reshape((n_areas, -1)), axis=1)[:, -1]
+        CC_synapses = dict(zip(area_list, CC_syn.tolist()))
+    else:
+        raise ValueError('Unknown engine: {}'.format(engine))
 
     """
     External inputs
@@ -845,13 +1178,8 @@ def compute_Model_params(out_label='', mode='default'):
     External_synapses = {}
     for target_area in area_list:
         N_syn_tot = surface * total_thicknesses[target_area] * rho_syn[target_area]
-        CC_synapses = 0.0
-        for target_pop, source_area, source_pop in product(population_list, area_list,
-                                                           population_list):
-            if source_area != target_area:
-                CC_synapses += synapse_numbers[target_area][
-                    target_pop][source_area][source_pop]
-        ext_syn = N_syn_tot * (1. - Intrinsic_FLN_completed[target_area]['mean']) - CC_synapses
+        ext_syn = (N_syn_tot * (1. - Intrinsic_FLN_completed[target_area]['mean']) -
+                   CC_synapses[target_area])
         External_synapses[target_area] = ext_syn
 
     """
@@ -884,30 +1212,117 @@ def compute_Model_params(out_label='', mode='default'):
     synapse_numbers['TH']['4E']['external'] = {'external': 0.0}
     synapse_numbers['TH']['4I']['external'] = {'external': 0.0}
 
+    collected_data = {'area_list': area_list,
+                      'av_indegree_V1': av_indegree_V1,
+                      'population_list': population_list,
+                      'structure': structure,
+                      'synapses': synapse_numbers,
+                      'realistic_neuron_numbers': neuronal_numbers_fullscale,
+                      'neuron_numbers': neuronal_numbers,
+                      'synapses_type_I': synapses_type_I,
+                      'synapses_type_II': synapses_type_II,
+                      'distances': Distance_Data,
+                      'binzegger_processed': synapse_to_cell_body,
+                      'Intrinsic_FLN_completed': Intrinsic_FLN_completed}
+    return collected_data
+
+
+def scale_external_inputs(synapse_numbers, net_params):
     """
-    Modify external inputs according to additional factors
+    Modify external inputs according to additional factors.
+
+    Parameters
+    ----------
+    synapse_numbers : dict
+        Synapse numbers as computed by compute_synapse_numbers.
+    net_params : dict
+        Complete network parameters.
+
+    Returns
+    -------
+    synapse_numbers : dict
+        Modified synapse numbers. Only the entries of the external
+        inputs are copied, all other entries are shared with the
+        input dictionary.
     """
-    for target_area in area_list:
+    conn_params = net_params['connection_params']
+    # Increase the external poisson indegree onto 5E and 6E
+    fac_nu_ext_5E = conn_params['fac_nu_ext_5E']
+    fac_nu_ext_6E = conn_params['fac_nu_ext_6E']
+    # to increase the ext. input to 23E and 5E in area TH
+    fac_nu_ext_TH = conn_params['fac_nu_ext_TH']
+
+    scaled_numbers = {}
+    for target_area in synapse_numbers:
+        scaled_numbers[target_area] = {}
         for target_pop in synapse_numbers[target_area]:
+            ext = synapse_numbers[target_area][target_pop]['external']['external']
             if target_pop in ['5E']:
-                synapse_numbers[target_area][target_pop]['external'][
-                    'external'] = fac_nu_ext_5E * synapse_numbers[target_area][target_pop][
-                        'external']['external']
+                ext = fac_nu_ext_5E * ext
             if target_pop in ['6E']:
-                synapse_numbers[target_area][target_pop]['external'][
-                    'external'] = fac_nu_ext_6E * synapse_numbers[target_area][target_pop][
-                        'external']['external']
+                ext = fac_nu_ext_6E * ext
+            if target_area == 'TH' and target_pop in ['23E', '5E']:
+                ext *= fac_nu_ext_TH
+            scaled_numbers[target_area][target_pop] = dict(
+                synapse_numbers[target_area][target_pop], external={'external': ext})
+    return scaled_numbers
 
-    synapse_numbers['TH']['23E']['external']['external'] *= fac_nu_ext_TH
-    synapse_numbers['TH']['5E']['external']['external'] *= fac_nu_ext_TH
 
+def compute_synapse_weights(net_params, area_list, population_list):
     """
-    Synaptic weights
-    ----------------
     Create dictionaries with the mean and standard deviation
     of the synaptic weight of each connection in the network.
     Depends on the chosen neuron model.
+
+    Parameters
+    ----------
+    net_params : dict
+        Complete network parameters.
+    area_list : list
+        List of areas.
+    population_list : list
+        List of populations.
+
+    Returns
+    -------
+    synapse_weights_mean : dict
+        Mean synaptic weights, including the external input.
+    synapse_weights_sd : dict
+        Standard deviations of the synaptic weights.
     """
+    conn_params = net_params['connection_params']
+
+    # Single neuron parameters, important to determine synaptic weights
+    single_neuron_dict = net_params['neuron_params']['single_neuron_dict']
+    C_m = single_neuron_dict['C_m']
+    tau_m = single_neuron_dict['tau_m']
+    tau_syn_ex = single_neuron_dict['tau_syn_ex']
+    tau_syn_in = single_neuron_dict['tau_syn_in']
+
+    # synapse weight parameters for current-based neurons
+    # excitatory intracortical synaptic weight (mV)
+    PSP_e = conn_params['PSP_e']
+    PSP_e_23_4 = conn_params['PSP_e_23_4']
+    # synaptic weight (mV) for external input
+    PSP_ext = conn_params['PSP_ext']
+    # relative strength of inhibitory versus excitatory synapses for CUBA neurons
+    g = conn_params['g']
+
+    # relative SD of normally distributed synaptic weights
+    PSC_rel_sd_normal = conn_params['PSC_rel_sd_normal']
+    # relative SD of lognormally distributed synaptic weights
+    PSC_rel_sd_lognormal = conn_params['PSC_rel_sd_lognormal']
+
+    # scaling factor for cortico-cortical connections (chi)
+    cc_weights_factor = conn_params['cc_weights_factor']
+    # factor to scale cortico-cortical inh. weights in relation to exc. weights (chi_I)
+    cc_weights_I_factor = conn_params['cc_weights_I_factor']
+
+    # switch whether to distribute weights lognormally
+    lognormal_weights = conn_params['lognormal_weights']
+    # switch whether to distribute only EE weight lognormally if
+    # switch_lognormal_weights = True
+    lognormal_EE_only = conn_params['lognormal_EE_only']
 
     # for current-based neurons
     PSC_e_over_PSP_e = ((C_m**(-1) * tau_m * tau_syn_ex / (tau_syn_ex - tau_m) *
@@ -917,91 +1332,118 @@ def compute_Model_params(out_label='', mode='default'):
                          ((tau_m / tau_syn_in) ** (- tau_m / (tau_m - tau_syn_in)) -
                           (tau_m / tau_syn_in) ** (- tau_syn_in / (tau_m - tau_syn_in)))) ** (-1))
 
-    synapse_weights_mean = nested_dict()
-    for target_area, target_pop, source_area, source_pop in product(area_list, population_list,
-                                                                    area_list, population_list):
-        if 'E' in source_pop:
-            synapse_weights_mean[target_area][target_pop][source_area][
-                source_pop] = PSC_e_over_PSP_e * PSP_e
-        else:
-            synapse_weights_mean[target_area][target_pop][source_area][
-                source_pop] = PSC_i_over_PSP_i * g * PSP_e
-
-    synapse_weights_mean = synapse_weights_mean.to_dict()
-    synapse_weights_sd = nested_dict()
-    for target_area, target_pop, source_area, source_pop in product(area_list, population_list,
-                                                                    area_list, population_list):
-        mean = abs(synapse_weights_mean[target_area][target_pop][source_area][source_pop])
-        if ((lognormal_weights and 'E' in target_pop and 'E' in source_pop) or
-                lognormal_weights and not lognormal_EE_only):
-            sd = PSC_rel_sd_lognormal * mean
-        else:
-            sd = PSC_rel_sd_normal * mean
-        synapse_weights_sd[target_area][target_pop][source_area][source_pop] = sd
-    synapse_weights_sd = synapse_weights_sd.to_dict()
+    # The weights are computed as arrays of shape
+    # (target area, target population, source area, source population)
+    n_areas = len(area_list)
+    n_pops = len(population_list)
+    shape = (n_areas, n_pops, n_areas, n_pops)
+    E_pops = np.array(['E' in pop for pop in population_list])
+    I_pops = np.array(['I' in pop for pop in population_list])
+
+    mean = np.where(E_pops, PSC_e_over_PSP_e * PSP_e, PSC_i_over_PSP_i * g * PSP_e)
+    synapse_weights_mean = np.array(np.broadcast_to(mean[np.newaxis, np.newaxis, np.newaxis],
+                                                    shape), dtype=float)
+
+    lognormal = (bool(lognormal_weights) &
+                 (np.logical_and.outer(E_pops, E_pops) | (not lognormal_EE_only)))
+    rel_sd = np.where(lognormal, PSC_rel_sd_lognormal, PSC_rel_sd_normal)
+    synapse_weights_sd = (rel_sd[np.newaxis, :, np.newaxis, :] *
+                          np.abs(synapse_weights_mean))
 
     # Apply specific weight for intra_areal 4E-->23E connections
-    for area in area_list:
-        synapse_weights_mean[area]['23E'][area]['4E'] = PSP_e_23_4 * PSC_e_over_PSP_e
-        synapse_weights_sd[area]['23E'][area]['4E'] = (PSC_rel_sd_normal * PSP_e_23_4
-                                                       * PSC_e_over_PSP_e)
+    areas = np.arange(n_areas)
+    i_23E = population_list.index('23E')
+    i_4E = population_list.index('4E')
+    synapse_weights_mean[areas, i_23E, areas, i_4E] = PSP_e_23_4 * PSC_e_over_PSP_e
+    synapse_weights_sd[areas, i_23E, areas, i_4E] = (PSC_rel_sd_normal * PSP_e_23_4
+                                                     * PSC_e_over_PSP_e)
 
     # Apply cc_weights_factor for all CC connections
-    for target_area, source_area in product(area_list, area_list):
-        if source_area != target_area:
-            for target_pop, source_pop in product(population_list, population_list):
-                synapse_weights_mean[target_area][target_pop][
-                    source_area][source_pop] *= cc_weights_factor
-                synapse_weights_sd[target_area][target_pop][
-                    source_area][source_pop] *= cc_weights_factor
+    cc = ~np.eye(n_areas, dtype=bool)[:, np.newaxis, :, np.newaxis]
+    synapse_weights_mean = np.where(cc, synapse_weights_mean * cc_weights_factor,
+                                    synapse_weights_mean)
+    synapse_weights_sd = np.where(cc, synapse_weights_sd * cc_weights_factor,
+                                  synapse_weights_sd)
 
     # Apply cc_weights_I_factor for all CC connections
-    for target_area, source_area in product(area_list, area_list):
-        if source_area != target_area:
-            for target_pop, source_pop in product(population_list, population_list):
-                if 'I' in target_pop:
-                    synapse_weights_mean[target_area][target_pop][
-                        source_area][source_pop] *= cc_weights_I_factor
-                    synapse_weights_sd[target_area][target_pop][
-                        source_area][source_pop] *= cc_weights_I_factor
+    cc_I = cc & I_pops[np.newaxis, :, np.newaxis, np.newaxis]
+    synapse_weights_mean = np.where(cc_I, synapse_weights_mean * cc_weights_I_factor,
+                                    synapse_weights_mean)
+    synapse_weights_sd = np.where(cc_I, synapse_weights_sd * cc_weights_I_factor,
+                                  synapse_weights_sd)
 
     # Synaptic weights for external input
-    for target_area in area_list:
-        for target_pop in population_list:
-            synapse_weights_mean[target_area][target_pop]['external'] = {
-                'external': PSC_e_over_PSP_e * PSP_ext}
+    external = np.full((n_areas, n_pops), PSC_e_over_PSP_e * PSP_ext, dtype=float)
 
-    """
-    Output section
-    --------------
-    All data are saved to a json file with the name structure:
-    '$(prefix) + '_Data_Model' + $(out_label) + .json'.
-    """
+    synapse_weights_mean = ConnectivityTensor(synapse_weights_mean, external=external,
+                                              area_list=area_list,
+                                              pop_list=population_list).to_dict()
+    synapse_weights_sd = ConnectivityTensor(synapse_weights_sd, area_list=area_list,
+                                            pop_list=population_list).to_dict()
+    return synapse_weights_mean, synapse_weights_sd
 
-    collected_data = {'area_list': area_list,
-                      'av_indegree_V1': av_indegree_V1,
-                      'population_list': population_list,
-                      'structure': structure,
-                      'synapses_orig': synapse_numbers,
-                      'synapses': synapse_numbers,
-                      'realistic_neuron_numbers': neuronal_numbers_fullscale,
-                      'realistic_synapses': synapse_numbers,
-                      'neuron_numbers': neuronal_numbers,
-                      'synapses_type_I': synapses_type_I,
-                      'synapses_type_II': synapses_type_II,
-                      'distances': Distance_Data,
-                      'binzegger_processed': synapse_to_cell_body,
-                      'Intrinsic_FLN_completed': Intrinsic_FLN_completed,
-                      'synapse_weights_mean': synapse_weights_mean,
-                      'synapse_weights_sd': synapse_weights_sd
-                      }
 
-    with open(os.path.join(basepath,
-                           '.'.join(('_'.join((prefix,
-                                               'Data_Model',
-                                               out_label)),
-                                     'json'))), 'w') as f:
-        json.dump(collected_data, f)
+def mean_connection_probability(surfaces, sigma, C0, order=64, cutoff=12.):
+    """
+    Compute the mean connection probability of pairs of neurons
+    placed randomly in disk-shaped areas of the given surfaces, for a
+    connection probability C0 * exp(-r ** 2 / (2 * sigma ** 2)) decaying
+    with the distance r of the neurons, for all areas at once.
+
+    The mean is computed based on Sheng (1985), The distance between
+    two random points in plane regions, Theorem 2.4 on the expectation
+    value of arbitrary functions of distance between points in disks.
+    The integral over distances is evaluated with a fixed-order
+    Gauss-Legendre quadrature after substituting
+    r = 2 * R * cos(2 * u), which removes the singularity of the
+    integrand at r = 2 * R. Distances beyond cutoff * sigma are
+    neglected.
+
+    Parameters
+    ----------
+    surfaces : array_like
+        Surfaces of the areas in mm2.
+    sigma : float
+        Width of the Gaussian connection probability in mm.
+    C0 : float
+        Connection probability at zero distance.
+    order : int, optional
+        Order of the Gauss-Legendre quadrature. Defaults to 64.
+    cutoff : float, optional
+        Maximal distance in units of sigma. Defaults to 12.
+
+    Returns
+    -------
+    C_mean : numpy.ndarray
+        Mean connection probability of each area.
+    """
+    surfaces = np.asarray(surfaces, dtype=float)
+    R = np.sqrt(surfaces / np.pi)[..., np.newaxis]
+    x, w = np.polynomial.legendre.leggauss(order)
+    u_min = 0.5 * np.arccos(np.minimum(1., cutoff * sigma / (2 * R)))
+    half_width = 0.5 * (np.pi / 4. - u_min)
+    u = u_min + half_width * (x + 1.)
+    r = 2 * R * np.cos(2 * u)
+    integrand = (r * np.exp(-r ** 2 / (2 * sigma ** 2)) * (4 * u - np.sin(4 * u)) *
+                 4 * R * np.sin(2 * u))
+    return 2 * C0 / surfaces * half_width[..., 0] * np.dot(integrand, w)
+
+
+def _to_builtin(obj):
+    """
+    Convert nested dictionaries, lists and numpy scalars to builtin
+    types as obtained by writing to and loading from a json file.
+    """
+    if isinstance(obj, dict):
+        return {key: _to_builtin(val) for key, val in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_to_builtin(val) for val in obj]
+    elif isinstance(obj, np.ndarray):
+        return _to_builtin(obj.tolist())
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    else:
+        return obj
 
 
 if __name__ == '__main__':
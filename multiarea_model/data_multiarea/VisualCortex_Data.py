@@ -65,6 +65,17 @@ will be stored in the corresponding dictionaries:
     bodies
 16. Average In-Degree from Cragg 1967 ---> AvInDegree
 
+Processing stages
+-----------------
+Loading and processing are split into stages, which are registered
+in the `stages` dictionary in the order of execution. Each stage is a
+function that declares its outputs, the outputs of other stages it
+uses as inputs and the raw data files it reads. The outputs of each
+stage are cached in stage_cache/ and identified by a hash of the
+code of the stage, the content of its raw data files and the hashes
+of the stages providing its inputs. Thus, after changing a raw data
+file, only the stages depending on it are executed again.
+
 
 Authors
 --------
@@ -75,52 +86,269 @@ Sacha van Albada
 import numpy as np
 import re
 import copy
+import hashlib
+import inspect
 import json
 import csv
 import os
 import pandas as pd
-import subprocess
 
+from collections import OrderedDict
 from itertools import product
-from config import base_path
 from nested_dict import nested_dict
 from scipy import stats
-from scipy import integrate
+from scipy import special
+from multiarea_model.multiarea_helpers import write_json
 
+area_list = ['V1', 'V2', 'VP', 'V3', 'PIP', 'V3A', 'MT', 'V4t', 'V4',
+             'PO', 'VOT', 'DP', 'MIP', 'MDP', 'MSTd', 'VIP', 'LIP',
+             'PITv', 'PITd', 'AITv', 'MSTl', 'FST', 'CITv', 'CITd',
+             '7a', 'STPp', 'STPa', 'FEF', '46', 'TF', 'TH', 'AITd']
 
-def process_raw_data():
-    """
-    Load and process raw data from literature.
-    """
+area_set = set(area_list)
+
+"""
+Set input and output paths
+"""
+basepath = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+datapath = os.path.join(basepath, 'raw_data')
+stage_cache_path = os.path.join(basepath, 'stage_cache')
+
+# Registry of all stages in the order of execution
+stages = OrderedDict()
 
+
+def stage(outputs, inputs=[], raw_files=[]):
     """
-    Helper variables and functions
+    Decorator registering a function as a stage of process_raw_data.
+    The function is called with the inputs as keyword arguments and
+    returns the outputs as a tuple (or a single value if the stage has
+    only one output).
+
+    Parameters
+    ----------
+    outputs : list
+        Names of the outputs of the stage.
+    inputs : list, optional
+        Names of outputs of other stages used by the stage.
+    raw_files : list, optional
+        Files read by the stage, relative to data_multiarea/.
     """
-    area_list = ['V1', 'V2', 'VP', 'V3', 'PIP', 'V3A', 'MT', 'V4t', 'V4',
-                 'PO', 'VOT', 'DP', 'MIP', 'MDP', 'MSTd', 'VIP', 'LIP',
-                 'PITv', 'PITd', 'AITv', 'MSTl', 'FST', 'CITv', 'CITd',
-                 '7a', 'STPp', 'STPa', 'FEF', '46', 'TF', 'TH', 'AITd']
+    def register(func):
+        stages[func.__name__] = {'function': func,
+                                 'outputs': list(outputs),
+                                 'inputs': list(inputs),
+                                 'raw_files': list(raw_files)}
+        return func
+    return register
 
-    area_set = set(area_list)
 
-    # to skip the explanatory headers in the .csv-files
-    def skip_header():
-        next(myreader)
-        next(myreader)
+"""
+Helper functions
+"""
 
-    # to ignore the external sources in data
-    def without_ext(l):
-        s_l = set(l) & area_set
-        return s_l
 
-    """
-    Set input and output paths
-    """
-    basepath = os.path.abspath(os.path.join(os.path.dirname(__file__)))
-    datapath = os.path.join(basepath, 'raw_data')
-    out_label = ''
-    out_path = basepath
+# to skip the explanatory headers in the .csv-files
+def skip_header(myreader):
+    next(myreader)
+    next(myreader)
+
+
+# to ignore the external sources in data
+def without_ext(l):
+    s_l = set(l) & area_set
+    return s_l
+
+
+def probit(x):
+    """
+    Cumulative distribution function of the standard normal
+    distribution, i.e., the inverse of the probit link function.
+    """
+    return special.ndtr(x)
+
+
+def betabin_probit_fit(S, I, x, reltol=np.sqrt(np.finfo(float).eps), maxit=100000):
+    """
+    Maximum-likelihood fit of a beta-binomial regression with probit
+    link, p = probit(b0 + b1 * x), and a constant overdispersion
+    parameter phi to S successes and I failures.
+
+    This is a reimplementation of the fit performed by the R function
+    betabin of the aod package (see SLN_logdensities.R and bbAlt.R):
+    The fit is initialized with the coefficients of a binomial probit
+    regression and phi = 0.1 and the likelihood is maximized with the
+    Nelder-Mead method as implemented in the optim function of R.
+
+    Parameters
+    ----------
+    S : numpy.ndarray
+        Number of successes.
+    I : numpy.ndarray
+        Number of failures.
+    x : numpy.ndarray
+        Explanatory variable.
+    reltol : float, optional
+        Relative convergence tolerance of the Nelder-Mead
+        method. Defaults to the default value of optim.
+    maxit : int, optional
+        Maximal number of evaluations of the likelihood.
+        Defaults to 100000.
+
+    Returns
+    -------
+    params : numpy.ndarray
+        Fitted parameters b0, b1 and phi.
+    """
+    S = np.asarray(S, dtype=float)
+    I = np.asarray(I, dtype=float)
+    n = S + I
+    X = np.column_stack((np.ones(len(x)), np.asarray(x, dtype=float)))
+    lchoose = special.gammaln(n + 1) - special.gammaln(S + 1) - special.gammaln(I + 1)
+
+    def minuslogL(params):
+        p = probit(np.dot(X, params[:2]))
+        phi = params[2]
+        with np.errstate(all='ignore'):
+            a = p * (1. - phi) / phi
+            b = (1. - p) * (1. - phi) / phi
+            logL = np.sum(lchoose + special.betaln(a + S, b + I) - special.betaln(a, b))
+        if not np.isfinite(logL):
+            logL = -1e20
+        return -logL
+
+    params = np.append(_glm_probit(S, I, X), 0.1)
+    return _nelder_mead(minuslogL, params, reltol, maxit)
+
+
+def _glm_probit(S, I, X, epsilon=1e-8, maxit=25):
+    """
+    Binomial probit regression by iteratively reweighted least
+    squares, as performed by the glm function of R.
+    """
+    n = S + I
+    y = S / n
+    mu = (S + 0.5) / (n + 1.)
+    eta = special.ndtri(mu)
+    dev_old = None
+    for i in range(maxit):
+        dmu = np.exp(-0.5 * eta ** 2) / np.sqrt(2. * np.pi)
+        z = eta + (y - mu) / dmu
+        w = np.sqrt(n * dmu ** 2 / (mu * (1. - mu)))
+        coef = np.linalg.lstsq(X * w[:, np.newaxis], z * w, rcond=None)[0]
+        eta = np.dot(X, coef)
+        mu = probit(eta)
+        dev = 2. * np.sum(special.xlogy(S, y / mu) + special.xlogy(I, (1. - y) / (1. - mu)))
+        if dev_old is not None and abs(dev - dev_old) / (abs(dev) + 0.1) < epsilon:
+            break
+        dev_old = dev
+    return coef
+
+
+def _nelder_mead(f, par, reltol, maxit, alpha=1., beta=0.5, gamma=2., big=1e35):
+    """
+    Minimize f with the Nelder-Mead method. This follows the
+    implementation in the optim function of R (nmmin in optim.c) to
+    reproduce its results exactly. The simplex is stored column-wise
+    in P together with the function values in the last row.
+    """
+    def fn(p):
+        val = f(p)
+        return val if np.isfinite(val) else big
+
+    n = len(par)
+    P = np.zeros((n + 1, n + 2))
+    P[:n, 0] = par
+    P[n, 0] = fn(par)
+    funcount = 1
+    convtol = reltol * (abs(P[n, 0]) + reltol)
+    # Build the initial simplex
+    step = max(0.1 * np.max(np.abs(par)), 0.) or 0.1
+    size = 0.
+    for j in range(1, n + 1):
+        P[:n, j] = par
+        trystep = step
+        while P[j - 1, j] == par[j - 1]:
+            P[j - 1, j] = par[j - 1] + trystep
+            trystep *= 10
+        size += trystep
+    oldsize = size
+    L = 0
+    calcvert = True
+    while True:
+        if calcvert:
+            for j in range(n + 1):
+                if j != L:
+                    P[n, j] = fn(P[:n, j])
+                    funcount += 1
+            calcvert = False
+        # Find lowest and highest vertex
+        VL = VH = P[n, L]
+        H = L
+        for j in range(n + 1):
+            if j != L:
+                if P[n, j] < VL:
+                    L = j
+                    VL = P[n, j]
+                if P[n, j] > VH:
+                    H = j
+                    VH = P[n, j]
+        if VH <= VL + convtol or funcount > maxit:
+            break
+        # Centroid of all vertices except the highest one
+        P[:n, n + 1] = (np.sum(P[:n, :n + 1], axis=1) - P[:n, H]) / n
+        # Reflection
+        trial = (1. + alpha) * P[:n, n + 1] - alpha * P[:n, H]
+        VR = fn(trial)
+        funcount += 1
+        if VR < VL:
+            # Extension
+            P[n, n + 1] = VR
+            extension = gamma * trial + (1. - gamma) * P[:n, n + 1]
+            P[:n, n + 1] = trial
+            val = fn(extension)
+            funcount += 1
+            if val < VR:
+                P[:n, H] = extension
+                P[n, H] = val
+            else:
+                P[:n, H] = P[:n, n + 1]
+                P[n, H] = VR
+        else:
+            # Reduction
+            if VR < VH:
+                P[:n, H] = trial
+                P[n, H] = VR
+            trial = (1. - beta) * P[:n, H] + beta * P[:n, n + 1]
+            val = fn(trial)
+            funcount += 1
+            if val < P[n, H]:
+                P[:n, H] = trial
+                P[n, H] = val
+            elif VR >= VH:
+                # Shrink towards the lowest vertex
+                calcvert = True
+                size = 0.
+                for j in range(n + 1):
+                    if j != L:
+                        P[:n, j] = beta * (P[:n, j] - P[:n, L]) + P[:n, L]
+                        size += np.sum(np.abs(P[:n, j] - P[:n, L]))
+                if size < oldsize:
+                    oldsize = size
+                else:
+                    break
+    return P[:n, L].copy()
+
 
+"""
+Loading of experimental data
+============================
+"""
+
+
+@stage(outputs=['hierarchy', 'hierarchy_markov'],
+       raw_files=['raw_data/hierarchy_Reid.csv', 'raw_data/hierarchy_Markov.csv'])
+def load_hierarchy():
     """
     1. Define the hierarchy (continuous version from Reid et al. (2009))
     """
@@ -145,7 +373,13 @@ def process_raw_data():
     for i in range(len(hier_temp)):
         hierarchy_markov[hier_temp.iloc[i]['area']] = {'level': hier_temp.iloc[i][
             'level'], 'rescaled level': hier_temp.iloc[i]['rescaled level']}
+    return hierarchy, hierarchy_markov
 
+
+@stage(outputs=['neuronal_density_data', 'neuronal_density_data_updated'],
+       raw_files=['raw_data/NeuronalDensities_NeuN.csv',
+                  'raw_data/NeuronalDensities_Nissl.csv'])
+def load_neuronal_densities():
     """
     2. Neuronal densities
     """
@@ -173,7 +407,7 @@ def process_raw_data():
     with open(os.path.join(datapath, 'NeuronalDensities_Nissl.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter=',')
         neuronal_density_data_updated = {}
-        skip_header()
+        skip_header(myreader)
         for temp in myreader:
             try:
                 if temp[0] == 'V5/MT':
@@ -190,7 +424,12 @@ def process_raw_data():
                     neuronal_density_data_updated[temp[0]] = float(temp[2])
             except ValueError:
                 pass
+    return neuronal_density_data, neuronal_density_data_updated
+
 
+@stage(outputs=['architecture'],
+       raw_files=['raw_data/ArchitecturalTypes.csv'])
+def load_architecture():
     """
     3. Architectural Types
     """
@@ -202,13 +441,21 @@ def process_raw_data():
     for i in architecture:
         if architecture[i] != '?':
             architecture[i] = int(architecture[i])
+    return architecture
+
 
+@stage(outputs=['median_distance_data', 'thom_distance_data',
+                'thom_distance_data_markov', 'euclidean_distance_data'],
+       raw_files=['raw_data/Median_Distances_81areas.csv', 'raw_data/Thom_Distances.csv',
+                  'raw_data/Thom_Distances_MERetal12.csv',
+                  'raw_data/Euclidean_Distances.csv'])
+def load_distances():
     """
     4. Distances
     """
     with open(os.path.join(datapath, 'Median_Distances_81areas.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         temp = next(myreader)
         areas = temp
         median_distance_data = {}
@@ -221,7 +468,7 @@ def process_raw_data():
 
     with open(os.path.join(datapath, 'Thom_Distances.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         temp = next(myreader)
         areas = temp
         thom_distance_data = {}
@@ -235,7 +482,7 @@ def process_raw_data():
     # Distances for area in the parcellation used by Markov et al. (2014)
     with open(os.path.join(datapath, 'Thom_Distances_MERetal12.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         temp = next(myreader)
         areas = temp
         thom_distance_data_markov = {}
@@ -248,7 +495,7 @@ def process_raw_data():
 
     with open(os.path.join(datapath, 'Euclidean_Distances.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         temp = next(myreader)
         areas = temp
         euclidean_distance_data = {}
@@ -258,7 +505,13 @@ def process_raw_data():
             for j in range(1, 33, 1):
                 dict_[areas[j]] = float(temp[j])
             euclidean_distance_data[areas[i]] = dict_
+    return (median_distance_data, thom_distance_data,
+            thom_distance_data_markov, euclidean_distance_data)
 
+
+@stage(outputs=['surface_data'],
+       raw_files=['raw_data/cortical_surface.csv'])
+def load_surfaces():
     """
     5. Surface areas
     """
@@ -266,7 +519,14 @@ def process_raw_data():
                        sep='\t', skiprows=2,
                        names=['area', 'surface'])
     surface_data = {area: surface for area, surface in temp.values}
+    return surface_data
+
 
+@stage(outputs=['cocomac_data'],
+       raw_files=['raw_data/CoCoMac_complete_81.json',
+                  'raw_data/cocomac_confirmative_studies.json',
+                  'raw_data/cocomac_negative_studies.json'])
+def load_cocomac():
     """
     6. CoCoMac data
     """
@@ -326,7 +586,13 @@ def process_raw_data():
                 if target.split('-')[-1] in area_list:
                     cocomac_data[target.split('-')[-1]][source.split('-')[-1]] = {
                         'source_pattern': source_pattern, 'target_pattern': target_pattern}
+    return cocomac_data
+
 
+@stage(outputs=['FLN_Data', 'NLN_Data', 'injection_sites'],
+       raw_files=['raw_data/Markov2014_FLN_rawdata.csv',
+                  'raw_data/Markov2014_InjectionSites.csv'])
+def load_FLN():
     """
     7. FLN data
     """
@@ -380,19 +646,29 @@ def process_raw_data():
     for i in range(0, len(temp)):
         injection_sites[temp.iloc[i]['monkey']] = {'injected_area': temp.iloc[
             i]['injected area'], 'FV91_area': temp.iloc[i]['FV91 area']}
+    return FLN_Data, NLN_Data, injection_sites
 
+
+@stage(outputs=['Intrinsic_FLN_Data'],
+       raw_files=['raw_data/Intrinsic_FLN_Data.csv'])
+def load_intrinsic_FLN():
     """
     8. Intrinsic FLN_Data
     """
     with open(os.path.join(datapath, 'Intrinsic_FLN_Data.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         Intrinsic_FLN_Data = {}
         for i in range(4):
             temp = next(myreader)
             dict_ = {'mean': float(temp[1]), 'error': float(temp[2])}
             Intrinsic_FLN_Data[temp[0]] = dict_
+    return Intrinsic_FLN_Data
+
 
+@stage(outputs=['SLN_Data'],
+       raw_files=['raw_data/SLN_Data.csv'])
+def load_SLN():
     """
     9. SLN data
     """
@@ -428,13 +704,18 @@ def process_raw_data():
                                           'I': int(I),
                                           'TOT': int(TOT),
                                           'SLN': float(SLN)}}}
+    return SLN_Data
+
 
+@stage(outputs=['intrinsic_connectivity'],
+       raw_files=['raw_data/Intrinsic_Connectivity.csv'])
+def load_intrinsic_connectivity():
     """
     10. Intrinsic Connectivity from Potjans & Diesmann (2014)
     """
     with open(os.path.join(datapath, 'Intrinsic_Connectivity.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         intrinsic_connectivity = {}
 
         temp = next(myreader)
@@ -447,26 +728,37 @@ def process_raw_data():
             for j in range(1, 10, 1):
                     dict_[areas[j]] = float(temp[j])
             intrinsic_connectivity[areas[i]] = dict_
+    return intrinsic_connectivity
 
+
+@stage(outputs=['num_V1'],
+       raw_files=['raw_data/Numbers_V1.csv'])
+def load_num_V1():
     """
     11. Numbers of neurons and external inputs in V1
     """
     with open(os.path.join(datapath, 'Numbers_V1.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         num_V1 = {}
         for i in range(0, 9, 1):
             temp = next(myreader)
             num_V1[temp[0]] = {'neurons': float(
                 temp[1]), 'ext_inputs': float(temp[2])}
+    return num_V1
+
 
+@stage(outputs=['Laminar_Thickness_cat', 'laminar_thicknesses'],
+       raw_files=['raw_data/Laminar_Thickness_cat.csv',
+                  'raw_data/laminar_thicknesses_macaque.csv'])
+def load_laminar_thicknesses():
     """
     Two alternatives for determining laminar thicknesses:
     """
     # 12a. Laminar thicknesses of cat area 17
     with open(os.path.join(datapath, 'Laminar_Thickness_cat.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         Laminar_Thickness_cat = {}
 
         for i in range(10):
@@ -478,7 +770,7 @@ def process_raw_data():
     # micrographs from the literature
     with open(os.path.join(datapath, 'laminar_thicknesses_macaque.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         names = next(myreader)[1:16]
         for i in range(0, len(names)):
             names[i] = re.sub('L', '', names[i])
@@ -515,13 +807,18 @@ def process_raw_data():
                                             ][names[j]] = float(temp[j + 1])
                     else:
                         laminar_thicknesses[temp[0]][names[j]] = np.nan
+    return Laminar_Thickness_cat, laminar_thicknesses
+
 
+@stage(outputs=['total_thickness_data'],
+       raw_files=['raw_data/CorticalThickness.csv'])
+def load_total_thicknesses():
     """
     13. Total cortical thicknesses from Barbas lab
     """
     with open(os.path.join(datapath, 'CorticalThickness.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
         next(myreader)
         total_thickness_data = {}
         for area in area_list:
@@ -532,7 +829,12 @@ def process_raw_data():
             if temp[4]:
                 total_thickness_data[temp[0]] = float(
                     temp[4]) * 1000.  # convert to micrometer
+    return total_thickness_data
 
+
+@stage(outputs=['translation', 'overlap'],
+       raw_files=['raw_data/SchemeTranslation.csv', 'raw_data/overlap.json'])
+def load_translation():
     """
     14.Translation from Barbas' scheme to FV91 scheme
     """
@@ -552,13 +854,18 @@ def process_raw_data():
     f = open(os.path.join(datapath, 'overlap.json'), 'r')
     overlap = json.load(f)
     f.close()
+    return translation, overlap
+
 
+@stage(outputs=['binzegger_data'],
+       raw_files=['raw_data/BinzeggerData.csv'])
+def load_binzegger():
     """
     15. Binzegger Data about relating synapse location to cell body location
     """
     with open(os.path.join(datapath, 'BinzeggerData.csv'), 'rt') as f:
         myreader = csv.reader(f, delimiter='\t')
-        skip_header()
+        skip_header(myreader)
 
         pre_cells = next(myreader)
         binzegger_data = {}
@@ -581,7 +888,13 @@ def process_raw_data():
                 else:
                     binzegger_data[temp[0]] = {'occurrence': float(
                         temp[2]), 'syn_dict': {syn_layer: subdict}}
+    return binzegger_data
+
 
+@stage(outputs=['av_indegree_Cragg', 'av_indegree_OKusky'],
+       raw_files=['raw_data/SynapticDensity_Cragg.csv',
+                  'raw_data/SynapticDensity_OKusky.csv'])
+def load_av_indegree():
     """
     16. Average In-Degree
     """
@@ -592,44 +905,20 @@ def process_raw_data():
     temp = np.loadtxt(os.path.join(datapath, 'SynapticDensity_OKusky.csv'),
                       delimiter='\t', skiprows=2)
     av_indegree_OKusky = float(temp)
+    return av_indegree_Cragg, av_indegree_OKusky
 
+
+"""
+Processing of experimental data
+===============================
+"""
+
+
+@stage(outputs=['hierarchy_completed', 'architecture_completed'],
+       inputs=['hierarchy', 'architecture'])
+def complete_hierarchy_architecture(hierarchy, architecture):
     """
-    Store experimental data in json file
-    """
-    raw_data = {'area_list': area_list,
-                'hierarchy': hierarchy,
-                'neuronal_density_data': neuronal_density_data,
-                'architecture': architecture,
-                'euclidean_distance_data': euclidean_distance_data,
-                'thom_distance_data': thom_distance_data,
-                'thom_distance_data_markov': thom_distance_data_markov,
-                'median_distance_data': median_distance_data,
-                'surface_data': surface_data,
-                'cocomac_data': cocomac_data,
-                'FLN_Data': FLN_Data,
-                'Intrinsic_FLN_Data': Intrinsic_FLN_Data,
-                'SLN_Data': SLN_Data,
-                'NLN_Data': NLN_Data,
-                'Intrinsic_Connectivity': intrinsic_connectivity,
-                'num_V1': num_V1,
-                'Laminar_Thickness_cat': Laminar_Thickness_cat,
-                'laminar_thicknesses': laminar_thicknesses,
-                'Binzegger_Data': binzegger_data,
-                'av_indegree_Cragg': av_indegree_Cragg,
-                'av_indegree_OKusky': av_indegree_OKusky,
-                'hierarchy_markov': hierarchy_markov,
-                'Translation': translation,
-                'overlap': overlap,
-                'total_thickness_data': total_thickness_data}
-
-    with open(os.path.join(out_path,
-                           ''.join(('viscortex_raw_data' + out_label + '.json'))),
-              'w') as f:
-        json.dump(raw_data, f)
-
-    """
-    Process experimental data
-    =========================
+    Completion of hierarchy and architecture
     """
     # Assumption: MDP and MIP are on hierarchy levels 0.5 like
     # their neighboring areas PO,MT,V4t. With the same argument,
@@ -641,7 +930,15 @@ def process_raw_data():
     hierarchy_completed['MDP'] = .5
     architecture_completed['MIP'] = 5
     architecture_completed['MDP'] = 5
+    return hierarchy_completed, architecture_completed
+
 
+@stage(outputs=['neuronal_densities', 'neuronal_density_data_FV91_4layers',
+                'category_density'],
+       inputs=['neuronal_density_data', 'neuronal_density_data_updated', 'translation',
+               'architecture_completed'])
+def compute_neuronal_densities(neuronal_density_data, neuronal_density_data_updated,
+                               translation, architecture_completed):
     """
     Neuronal numbers
     ----------------
@@ -775,7 +1072,12 @@ def process_raw_data():
         else:
             neuronal_densities[area] = '?'
     neuronal_densities = neuronal_densities.to_dict()
+    return neuronal_densities, neuronal_density_data_FV91_4layers, category_density
 
+
+@stage(outputs=['total_thicknesses', 'laminar_thicknesses_completed'],
+       inputs=['total_thickness_data', 'laminar_thicknesses', 'neuronal_densities'])
+def compute_thicknesses(total_thickness_data, laminar_thicknesses, neuronal_densities):
     """
     ### Thicknesses
 
@@ -909,7 +1211,14 @@ def process_raw_data():
             # have the sum of the relative thicknesses equal to 1
             laminar_thicknesses_completed[area][layer] = 0.001 * relative_layer_thicknesses[
                 area][layer] * total_thicknesses[area] / sum_rel_thick
+    return total_thicknesses, laminar_thicknesses_completed
+
 
+@stage(outputs=['realistic_neuronal_numbers'],
+       inputs=['num_V1', 'surface_data', 'laminar_thicknesses_completed',
+               'neuronal_densities'])
+def compute_neuronal_numbers(num_V1, surface_data, laminar_thicknesses_completed,
+                             neuronal_densities):
     """
     Finally, we compute neuron numbers for each population.
     We assume a laminar-specific ratio of excitatory
@@ -953,7 +1262,12 @@ def process_raw_data():
         realistic_neuronal_numbers[area]['total'] = sum(
             realistic_neuronal_numbers[area].values())
     realistic_neuronal_numbers = realistic_neuronal_numbers.to_dict()
+    return realistic_neuronal_numbers
+
 
+@stage(outputs=['FLN_Data_FV91', 'FLN_Data_FV91_mapped'],
+       inputs=['FLN_Data', 'injection_sites', 'overlap'])
+def map_FLN(FLN_Data, injection_sites, overlap):
     """
     Cortico-cortical connectivity
     -----------------------------
@@ -1071,7 +1385,12 @@ def process_raw_data():
     for a in area_list:
         if a not in FLN_Data_FV91:
             FLN_Data_FV91_mapped.update({a: {}})
+    return FLN_Data_FV91, FLN_Data_FV91_mapped
 
+
+@stage(outputs=['cocomac_completed'],
+       inputs=['cocomac_data', 'FLN_Data_FV91_mapped'])
+def complete_cocomac(cocomac_data, FLN_Data_FV91_mapped):
     """
     3. Process CoCoMac information
        In the laminar patterns, make replacements:
@@ -1121,7 +1440,14 @@ def process_raw_data():
         if area not in cocomac_completed[area]:
             cocomac_completed[area][area] = {
                 'target_pattern': None, 'source_pattern': None}
+    return cocomac_completed
+
 
+@stage(outputs=['FLN_completed'],
+       inputs=['FLN_Data_FV91_mapped', 'cocomac_completed', 'thom_distance_data',
+               'median_distance_data'])
+def complete_FLN(FLN_Data_FV91_mapped, cocomac_completed, thom_distance_data,
+                 median_distance_data):
     """
     4. Fill missing data with fitted values from
        exponential distance rule.
@@ -1181,7 +1507,12 @@ def process_raw_data():
                 ext_FLN += FLN_completed[target_area][source_area]
                 del FLN_completed[target_area][source_area]
         FLN_completed[target_area]['external'] = ext_FLN
+    return FLN_completed
+
 
+@stage(outputs=['SLN_Data_FV91_mapped'],
+       inputs=['SLN_Data', 'injection_sites', 'overlap', 'FLN_Data_FV91'])
+def map_SLN(SLN_Data, injection_sites, overlap, FLN_Data_FV91):
     """
     ### SLN values
 
@@ -1305,56 +1636,245 @@ def process_raw_data():
             SLN_Data_FV91_mapped[target][source] = SLN_Data_FV91_mapped[target][source][
                 'S'] / (SLN_Data_FV91_mapped[target][source]['S'] +
                         SLN_Data_FV91_mapped[target][source]['I'])
+    return SLN_Data_FV91_mapped
 
+
+@stage(outputs=['SLN_fit'],
+       raw_files=['raw_data/RData_prepared_logdensities.txt'])
+def fit_SLN():
     """
     3. Sigmoidal fit of SLN vs. logarithmic ratio of neuron densities.
+       The numbers of supragranular and infragranular labeled neurons
+       are fitted with a beta-binomial model with probit link.
     """
+    temp = pd.read_csv(os.path.join(datapath, 'RData_prepared_logdensities.txt'),
+                       sep=' ', skiprows=1,
+                       names=['index', 'target_area', 'source_area', 'S', 'I',
+                              'TOT', 'DIST', 'DENS', 'monkey', 'lFLN', 'SLN',
+                              'INJ', 'FLN', 'cSLN'])
+    params = betabin_probit_fit(temp['S'].values, temp['I'].values, temp['DENS'].values)
+    # Round to the precision of the coefficients printed by the R
+    # script SLN_logdensities.R, which was used before.
+    SLN_fit = [float('{:.7g}'.format(p)) for p in params[:2]]
+    return SLN_fit
 
-    def integrand(x, mu, sigma):
-        return 1 / (sigma * np.sqrt(2 * np.pi)) * np.exp(-(x - mu) ** 2 / (2. * sigma ** 2))
-
-    def probit(x,):
-        if isinstance(x, np.ndarray):
-            res = [integrate.quad(integrand, -1000., i,
-                                  args=(0., 1.))[0] for i in x]
-        else:
-            res = integrate.quad(integrand, -1000., x, args=(0., 1.))[0]
-        return res
-
-    # Call R script to perform SLN fit
-    try:
-        proc = subprocess.Popen(["Rscript",
-                                 os.path.join(basepath, 'SLN_logdensities.R'),
-                                 base_path],
-                                stdout=subprocess.PIPE)
-        out = proc.communicate()[0].decode('utf-8')
-        R_fit = [float(out.split('\n')[1].split(' ')[1]),
-                     float(out.split('\n')[1].split(' ')[3])]
-    except OSError:
-        print("No R installation, taking hard-coded SLN fit parameters.")
-        R_fit = [-0.1516142, -1.5343200]
 
+@stage(outputs=['SLN_completed'],
+       inputs=['SLN_Data_FV91_mapped', 'cocomac_completed', 'neuronal_densities', 'SLN_fit'])
+def complete_SLN(SLN_Data_FV91_mapped, cocomac_completed, neuronal_densities, SLN_fit):
     """
     4. Fill missing data with fitted values.
     """
     SLN_completed = {}
-    s = 0.
-    s2 = 0.
+    missing = []
+    x = []
     for target in area_list:
         SLN_completed[target] = {}
         for source in list(cocomac_completed[target].keys()):
             if source in area_list and source != target:
                 if target in SLN_Data_FV91_mapped and source in SLN_Data_FV91_mapped[target]:
-                    value = SLN_Data_FV91_mapped[target][source]
-                    s += 1
+                    SLN_completed[target][source] = SLN_Data_FV91_mapped[target][source]
                 else:
                     nd_target = neuronal_densities[target]
                     nd_source = neuronal_densities[source]
-                    x = R_fit[1] * float(np.log(nd_target['overall']) -
-                                         np.log(nd_source['overall'])) + R_fit[0]
-                    value = probit(x)
-                    s2 += 1
-                SLN_completed[target][source] = value
+                    x.append(SLN_fit[1] * float(np.log(nd_target['overall']) -
+                                                np.log(nd_source['overall'])) + SLN_fit[0])
+                    # Placeholder to preserve the order of the sources
+                    SLN_completed[target][source] = None
+                    missing.append((target, source))
+    # Evaluate the fitted values for all missing connections at once
+    for (target, source), value in zip(missing, probit(np.array(x))):
+        SLN_completed[target][source] = float(value)
+
+    return SLN_completed
+
+
+"""
+Execution of stages
+===================
+"""
+
+
+def _stage_producers():
+    return {output: name for name, spec in stages.items() for output in spec['outputs']}
+
+
+def _code_version(func, _seen=None):
+    """
+    Return the source code of a function and of all helper functions
+    of this module it calls.
+    """
+    if _seen is None:
+        _seen = set()
+    _seen.add(func.__name__)
+    code = [inspect.getsource(func)]
+    for name in func.__code__.co_names:
+        obj = globals().get(name)
+        if (inspect.isfunction(obj) and obj.__module__ == __name__ and
+                name not in _seen and name not in stages):
+            code.append(_code_version(obj, _seen))
+    return ''.join(code)
+
+
+def stage_key(name, _keys=None):
+    """
+    Return the hash identifying the outputs of a stage. The hash is
+    computed from the code of the stage, the content of its raw data
+    files and the hashes of the stages providing its inputs.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    """
+    if _keys is None:
+        _keys = {}
+    if name not in _keys:
+        spec = stages[name]
+        producers = _stage_producers()
+        md5 = hashlib.md5()
+        md5.update(_code_version(spec['function']).encode('utf-8'))
+        for fn in spec['raw_files']:
+            md5.update(fn.encode('utf-8'))
+            with open(os.path.join(basepath, fn), 'rb') as f:
+                md5.update(f.read())
+        for upstream in sorted(set(producers[x] for x in spec['inputs'])):
+            md5.update(stage_key(upstream, _keys).encode('utf-8'))
+        _keys[name] = md5.hexdigest()
+    return _keys[name]
+
+
+def run_stages(outputs=None, use_cache=True):
+    """
+    Execute the stages required to compute the given outputs and
+    return the outputs. Stages whose outputs are found in the cache
+    are not executed.
+
+    Parameters
+    ----------
+    outputs : list, optional
+        Names of the outputs to compute. Defaults to the outputs of
+        all stages.
+    use_cache : bool, optional
+        Whether to load outputs of stages from the cache. If False,
+        all required stages are executed and their cached outputs are
+        replaced. Defaults to True.
+
+    Returns
+    -------
+    results : dict
+        Outputs of all executed stages, including the requested ones.
+    """
+    producers = _stage_producers()
+    if outputs is None:
+        outputs = list(producers.keys())
+    results = {}
+    keys = {}
+
+    def run(name):
+        spec = stages[name]
+        if spec['outputs'][0] in results:
+            return
+        for x in spec['inputs']:
+            run(producers[x])
+        key = stage_key(name, keys)
+        fn = os.path.join(stage_cache_path, '{}_{}.json'.format(name, key))
+        dat = None
+        if use_cache:
+            try:
+                with open(fn, 'r') as f:
+                    dat = json.load(f)
+            except FileNotFoundError:
+                pass
+        if dat is None:
+            # Stages must not modify the outputs of other stages
+            res = spec['function'](**{x: copy.deepcopy(results[x]) for x in spec['inputs']})
+            if len(spec['outputs']) == 1:
+                res = (res,)
+            # The json representation is used for the further
+            # processing to ensure that cached and freshly computed
+            # outputs are identical.
+            s = json.dumps(dict(zip(spec['outputs'], res)))
+            dat = json.loads(s)
+            _store_stage(name, fn, s)
+        results.update(dat)
+
+    for x in outputs:
+        run(producers[x])
+    return results
+
+
+def _store_stage(name, fn, s):
+    try:
+        os.makedirs(stage_cache_path)
+    except FileExistsError:
+        pass
+    tmp_fn = '{}.tmp_{}'.format(fn, os.getpid())
+    with open(tmp_fn, 'w') as f:
+        f.write(s)
+    os.replace(tmp_fn, fn)
+    # Remove outdated outputs of the same stage
+    for old_fn in os.listdir(stage_cache_path):
+        if (re.match(name + r'_[0-9a-f]{32}\.json$', old_fn) and
+                old_fn != os.path.basename(fn)):
+            try:
+                os.remove(os.path.join(stage_cache_path, old_fn))
+            except FileNotFoundError:
+                pass
+
+
+def process_raw_data(use_cache=True):
+    """
+    Load and process raw data from literature.
+
+    Parameters
+    ----------
+    use_cache : bool, optional
+        Whether to use cached outputs of the stages. Defaults to True.
+
+    Returns
+    -------
+    raw_data : dict
+        Experimental data, stored in viscortex_raw_data.json.
+    processed_data : dict
+        Processed data, stored in viscortex_processed_data.json.
+    """
+    res = run_stages(use_cache=use_cache)
+    out_label = ''
+    out_path = basepath
+
+    """
+    Store experimental data in json file
+    """
+    raw_data = {'area_list': list(area_list),
+                'hierarchy': res['hierarchy'],
+                'neuronal_density_data': res['neuronal_density_data'],
+                'architecture': res['architecture'],
+                'euclidean_distance_data': res['euclidean_distance_data'],
+                'thom_distance_data': res['thom_distance_data'],
+                'thom_distance_data_markov': res['thom_distance_data_markov'],
+                'median_distance_data': res['median_distance_data'],
+                'surface_data': res['surface_data'],
+                'cocomac_data': res['cocomac_data'],
+                'FLN_Data': res['FLN_Data'],
+                'Intrinsic_FLN_Data': res['Intrinsic_FLN_Data'],
+                'SLN_Data': res['SLN_Data'],
+                'NLN_Data': res['NLN_Data'],
+                'Intrinsic_Connectivity': res['intrinsic_connectivity'],
+                'num_V1': res['num_V1'],
+                'Laminar_Thickness_cat': res['Laminar_Thickness_cat'],
+                'laminar_thicknesses': res['laminar_thicknesses'],
+                'Binzegger_Data': res['binzegger_data'],
+                'av_indegree_Cragg': res['av_indegree_Cragg'],
+                'av_indegree_OKusky': res['av_indegree_OKusky'],
+                'hierarchy_markov': res['hierarchy_markov'],
+                'Translation': res['translation'],
+                'overlap': res['overlap'],
+                'total_thickness_data': res['total_thickness_data']}
+
+    _write_if_changed(raw_data,
+                      os.path.join(out_path,
+                                   ''.join(('viscortex_raw_data' + out_label + '.json'))))
 
     """
     Write output files
@@ -1362,25 +1882,41 @@ def process_raw_data():
 
     Store processed values to json file.
     """
-    processed_data = {'cocomac_completed': cocomac_completed,
-                      'architecture_completed': architecture_completed,
-                      'hierarchy_completed': hierarchy_completed,
-                      'SLN_completed': SLN_completed,
-                      'SLN_Data_FV91': SLN_Data_FV91_mapped,
-                      'FLN_Data_FV91': FLN_Data_FV91_mapped,
-                      'FLN_completed': FLN_completed,
-                      'neuronal_densities': neuronal_densities,
-                      'neuronal_density_data_FV91_4layers': neuronal_density_data_FV91_4layers,
-                      'realistic_neuronal_numbers': realistic_neuronal_numbers,
-                      'total_thicknesses': total_thicknesses,
-                      'laminar_thicknesses': laminar_thicknesses_completed,
-                      'category_density': category_density
+    processed_data = {'cocomac_completed': res['cocomac_completed'],
+                      'architecture_completed': res['architecture_completed'],
+                      'hierarchy_completed': res['hierarchy_completed'],
+                      'SLN_completed': res['SLN_completed'],
+                      'SLN_Data_FV91': res['SLN_Data_FV91_mapped'],
+                      'FLN_Data_FV91': res['FLN_Data_FV91_mapped'],
+                      'FLN_completed': res['FLN_completed'],
+                      'neuronal_densities': res['neuronal_densities'],
+                      'neuronal_density_data_FV91_4layers': res[
+                          'neuronal_density_data_FV91_4layers'],
+                      'realistic_neuronal_numbers': res['realistic_neuronal_numbers'],
+                      'total_thicknesses': res['total_thicknesses'],
+                      'laminar_thicknesses': res['laminar_thicknesses_completed'],
+                      'category_density': res['category_density']
                       }
 
-    with open(os.path.join(out_path,
-                           ''.join(('viscortex_processed_data', out_label, '.json'))),
-              'w') as f:
-        json.dump(processed_data, f)
+    _write_if_changed(processed_data,
+                      os.path.join(out_path,
+                                   ''.join(('viscortex_processed_data', out_label, '.json'))))
+    return raw_data, processed_data
+
+
+def _write_if_changed(obj, fn):
+    """
+    Write an object to a json file unless the file already holds it,
+    so that processes reading the file concurrently are not disturbed
+    and its modification time is kept.
+    """
+    try:
+        with open(fn, 'r') as f:
+            if f.read() == json.dumps(obj):
+                return
+    except FileNotFoundError:
+        pass
+    write_json(obj, fn)
 
 
 if __name__ == '__main__':
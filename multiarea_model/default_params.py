@@ -11,10 +11,6 @@ Authors
 Maximilian Schmidt
 """
 
-from config import base_path
-import json
-import os
-
 import numpy as np
 
 complete_area_list = ['V1', 'V2', 'VP', 'V3', 'V3A', 'MT', 'V4t', 'V4', 'VOT', 'MSTd',
@@ -24,12 +20,11 @@ complete_area_list = ['V1', 'V2', 'VP', 'V3', 'V3A', 'MT', 'V4t', 'V4', 'VOT', '
 
 population_list = ['23E', '23I', '4E', '4I', '5E', '5I', '6E', '6I']
 
-f1 = open(os.path.join(base_path, 'multiarea_model/data_multiarea',
-                       'viscortex_raw_data.json'), 'r')
-raw_data = json.load(f1)
-f1.close()
-av_indegree_Cragg = raw_data['av_indegree_Cragg']
-av_indegree_OKusky = raw_data['av_indegree_OKusky']
+# Average indegrees in V1 from the raw data files SynapticDensity_Cragg.csv
+# and SynapticDensity_OKusky.csv (stored as 'av_indegree_Cragg' and
+# 'av_indegree_OKusky' in viscortex_raw_data.json)
+av_indegree_Cragg = 5600.
+av_indegree_OKusky = 2300.
 
 
 """
@@ -48,6 +43,26 @@ sim_params = {
     'local_num_threads': 1,
     # Areas represented in the network
     'areas_simulated': complete_area_list,
+    # Lower bounds of the synaptic delays (in ms) of connections
+    # within and between areas. The delays are drawn from a normal
+    # distribution clipped at these values. None means min_delay if
+    # defined, else dt. Raising the bounds increases the minimal delay
+    # and thus the interval between spike exchanges of MPI processes.
+    'delay_floor': {'intra_area': None,
+                    'inter_area': None},
+    # Minimal and maximal delay (in ms) set in the NEST kernel. Both
+    # have to be defined together. None lets NEST determine them from
+    # the created connections.
+    'min_delay': None,
+    'max_delay': None,
+    # Length of the segments (in ms) in which the simulation is run.
+    # None means that the whole time is simulated at once.
+    't_segment': None,
+    # Wall-clock time (in s) available for the simulation including
+    # the network construction. If the next segment would exceed the
+    # remaining time, the simulation stops after the current segment.
+    # None means no limit.
+    'time_budget': None
 }
 
 """
@@ -60,6 +75,10 @@ network_params = {
     'N_scaling': 1.,
     # Scaling of indegrees
     'K_scaling': 1.,
+    # Both scaling factors can be defined per area or per population
+    # as a dictionary, e.g. {'V1': 1., 'V2': {'23E': 1., '23I': 1.},
+    # 'FEF': 0.1}. Areas and populations missing in the dictionary
+    # are not scaled.
     # Absolute path to the file holding full-scale rates for scaling
     # synaptic weights
     'fullscale_rates': None
@@ -243,6 +262,12 @@ recording_dict = {
     # in each population if record_vm is True
     'Nrec_vm_fraction': 0.01,
 
+    # Whether to record the spikes of all populations with one spike
+    # detector writing text files ('network') or with one spike
+    # detector per population whose spikes are written to binary
+    # files ('population', see Simulation.write_spikes)
+    'spike_recording': 'network',
+
     # Parameters for the spike detectors
     'spike_dict': {
         'label': 'spikes',
@@ -284,7 +309,13 @@ theory_params = {'neuron_params': neuron_params,
                  'dt': 0.1,
                  # Time interval for recording the trajectory of the mean-field calcuation
                  # If None, then the interval is set to dt
-                 'rec_interval': None}
+                 'rec_interval': None,
+                 # Representation of the connectivity in mu_sigma,
+                 # gain_matrix and the stabilization: 'dense' (numpy
+                 # arrays) or 'sparse' (scipy.sparse CSR matrices
+                 # storing only existing connections). Both lead to
+                 # the same results.
+                 'backend': 'dense'}
 
 
 """
@@ -295,7 +326,7 @@ parameters
 
 def nested_update(d, d2):
     for key in d2:
-        if isinstance(d2[key], dict) and key in d:
+        if isinstance(d2[key], dict) and isinstance(d.get(key), dict):
             nested_update(d[key], d2[key])
         else:
             d[key] = d2[key]
@@ -303,7 +334,7 @@ def nested_update(d, d2):
 
 def check_custom_params(d, def_d):
     for key, val in d.items():
-        if isinstance(val, dict):
+        if isinstance(val, dict) and isinstance(def_d.get(key), dict):
             check_custom_params(d[key], def_d[key])
         else:
             try:
@@ -8,15 +8,22 @@ Functions
 ---------
 
 load_degree_data : Load indegrees and outdegrees from data file
+structure_index : Return the indices mapping the populations of a network
+                  to areas and populations
 area_level_dict : Create area-level dict from a population-level connectivity dict
 dict_to_matrix : Transform dictionary of connectivity to matrix
 matrix_to_dict : Transform connectivity matrix to dictionary
 vector_to_dict : Transform vector of population sizes to dictionary
 dict_to_vector : Transform dictionary of population sizes to vector
+scaling_vector : Transform global or area-specific scaling factors to vector
 create_vector_mask : Create a mask for a vector of population sizes
                      to filter for specific populations.
 create_mask : Create a mask for a connectivity matrix to filter for
               specific pairs of populations
+mask_indices : Return the indices of the entries of a connectivity matrix
+               selected by a mask
+area_slice : Return the slice of the rows of a vector or matrix
+             belonging to an area
 indegree_to_synapse_numbers : Transform a dictionary of indegrees to a
                               a dictionary of synapse numbers
 
@@ -26,18 +33,30 @@ extract_area_dict :     Extract the dictionary containing only information
                         specific to a given pair of areas from a nested dictionary
                         describing the entire network.
 convert_syn_weight : Convert a PSC amplitude into an integral of the PSP
+write_json : Atomically write an object to a json file
+generate_label : Compute a hash label from parameters and arrays
+simulation_label : Compute the label of a simulation
 """
 
+import hashlib
 import json
 import numpy as np
 import os
+import threading
+from functools import lru_cache
 from itertools import product
-import collections
+from collections.abc import Iterable, Mapping
 
 from config import base_path
-from .default_params import complete_area_list, population_list
+from .default_params import complete_area_list, population_list, sim_params
 from nested_dict import nested_dict
 
+# Floats entering labels are multiplied by this factor and truncated
+# to integers. A precision of 1e-4 is sufficient for indegrees and
+# neuron numbers and guarantees reproducibility of the labels despite
+# inevitably imprecise float calculations in the data scripts.
+LABEL_FLOAT_FACTOR = 1e4
+
 
 def load_degree_data(fn):
     """
@@ -152,6 +171,55 @@ def area_level_dict(dic, num, degree='indegree'):
     return area_level_dic.to_dict()
 
 
+# Cache of the indices computed by structure_index
+_structure_indices = {}
+
+
+def structure_index(area_list, structure, pop_list=population_list):
+    """
+    Return the indices mapping the populations of a network defined
+    by structure to areas and populations. The i-th entries of the two
+    returned arrays are the index in area_list and the index in
+    pop_list of the population in the i-th row of the vectors and
+    matrices of the network. The indices are computed once for each
+    structure and cached.
+
+    Parameters
+    ----------
+    area_list: list
+        List of areas in the network. Defines the order of areas
+        in the vectors and matrices.
+    structure : dict
+        Structure of the network. Define the populations for each single area.
+    pop_list : list, optional
+        List of populations. Defaults to the population_list
+        defined in default_params.
+
+    Returns
+    -------
+    area_index : numpy.ndarray
+        Area index of each population.
+    pop_index : numpy.ndarray
+        Population index of each population.
+    """
+    key = (tuple(area_list),
+           tuple(tuple(structure[area]) for area in area_list),
+           tuple(pop_list))
+    if key not in _structure_indices:
+        area_index = []
+        pop_index = []
+        for i, area in enumerate(area_list):
+            for pop in structure[area]:
+                area_index.append(i)
+                pop_index.append(pop_list.index(pop))
+        area_index = np.array(area_index, dtype=int)
+        pop_index = np.array(pop_index, dtype=int)
+        area_index.flags.writeable = False
+        pop_index.flags.writeable = False
+        _structure_indices[key] = (area_index, pop_index)
+    return _structure_indices[key]
+
+
 def dict_to_matrix(d, area_list, structure):
     """
     Convert a dictionary containing connectivity
@@ -167,21 +235,13 @@ def dict_to_matrix(d, area_list, structure):
     structure : dict
         Structure of the network. Define the populations for each single area.
     """
-    dim = 0
-    for area in structure.keys():
-        dim += len(structure[area])
-
-    M = np.zeros((dim, dim + 1))
-    i = 0
-    for target_area in area_list:
-        for target_pop in structure[target_area]:
-            j = 0
-            for source_area in area_list:
-                for source_pop in structure[source_area]:
-                    M[i][j] = d[target_area][target_pop][source_area][source_pop]
-                    j += 1
-            M[i][j] = d[target_area][target_pop]['external']['external']
-            i += 1
+    pops = [(area, pop) for area in area_list for pop in structure[area]]
+    M = np.zeros((len(pops), len(pops) + 1))
+    M[:, :-1] = [[d[target_area][target_pop][source_area][source_pop]
+                  for source_area, source_pop in pops]
+                 for target_area, target_pop in pops]
+    M[:, -1] = [d[target_area][target_pop]['external']['external']
+                for target_area, target_pop in pops]
     return M
 
 
@@ -206,52 +266,31 @@ def matrix_to_dict(m, area_list, structure, external=None):
         'external' for each population.
         Defaults to None.
     """
-    dic = nested_dict()
-    for area, area2 in product(area_list, area_list):
-        mask = create_mask(
-            structure, target_areas=[area], source_areas=[area2], external=False)
-        if external is not None:
-            x = m[mask[:, :-1]]
-        else:
-            x = m[mask]
-
-        if area == 'TH' and area2 == 'TH':
-            x = x.reshape((6, 6))
-            x = np.insert(x, 2, np.zeros((2, 6), dtype=float), axis=0)
-            x = np.insert(x, 2, np.zeros((2, 8), dtype=float), axis=1)
-        elif area2 == 'TH':
-            x = x.reshape((8, 6))
-            x = np.insert(x, 2, np.zeros((2, 8), dtype=float), axis=1)
-        elif area == 'TH':
-            x = x.reshape((6, 8))
-            x = np.insert(x, 2, np.zeros((2, 8), dtype=float), axis=0)
-        else:
-            x = x.reshape((8, 8))
-        for i, pop in enumerate(population_list):
-            for j, pop2 in enumerate(population_list):
-                if x[i][j] < 1e-20:
-                    x[i][j] = 0.
-                dic[area][pop][area2][pop2] = x[i][j]
-    if external is not None:
-        if isinstance(external, np.ndarray):
-            for area in dic:
-                for pop in population_list:
-                    if pop in structure[area]:
-                        mask = create_vector_mask(
-                            structure, areas=[area], pops=[pop])
-                        dic[area][pop]['external'] = {
-                            'external': external[mask][0]}
-                    else:
-                        dic[area][pop]['external'] = {
-                            'external': 0.}
-
-        if isinstance(external, dict):
-            for area in dic:
-                for pop in dic[area]:
-                    dic[area][pop]['external'] = external[
-                        area][pop]
-
-    return dic.to_dict()
+    area_index, pop_index = structure_index(area_list, structure)
+    dim = area_index.size
+    x = np.asarray(m, dtype=float)[:, :dim]
+    x = np.where(np.abs(x) < 1e-20, 0., x)
+    values = np.zeros((len(area_list), len(population_list),
+                       len(area_list), len(population_list)))
+    values[area_index[:, np.newaxis], pop_index[:, np.newaxis],
+           area_index[np.newaxis, :], pop_index[np.newaxis, :]] = x
+    values = values.tolist()
+    if isinstance(external, np.ndarray):
+        ext = np.zeros((len(area_list), len(population_list)))
+        ext[area_index, pop_index] = external[:dim]
+        ext = ext.tolist()
+
+    dic = {}
+    for i, area in enumerate(area_list):
+        dic[area] = {}
+        for k, pop in enumerate(population_list):
+            dic[area][pop] = {area2: dict(zip(population_list, values[i][k][j]))
+                              for j, area2 in enumerate(area_list)}
+            if isinstance(external, np.ndarray):
+                dic[area][pop]['external'] = {'external': ext[i][k]}
+            elif isinstance(external, dict):
+                dic[area][pop]['external'] = external[area][pop]
+    return dic
 
 
 def vector_to_dict(v, area_list, structure, external=None):
@@ -269,17 +308,14 @@ def vector_to_dict(v, area_list, structure, external=None):
     structure : dict
         Structure of the network. Define the populations for each single area.
     """
-    dic = nested_dict()
-    for area in area_list:
-        vmask = create_vector_mask(structure, areas=[area])
-        for i, pop in enumerate(structure[area]):
-            dic[area][pop] = v[vmask][i]
-        for pop in population_list:
-            if pop not in structure[area]:
-                dic[area][pop] = 0.
-
-        dic[area]['total'] = sum(v[vmask])
-    return dic.to_dict()
+    area_index, pop_index = structure_index(area_list, structure)
+    x = np.zeros((len(area_list), len(population_list)))
+    x[area_index, pop_index] = v
+    dic = {}
+    for i, area in enumerate(area_list):
+        dic[area] = dict(zip(population_list, x[i].tolist()))
+        dic[area]['total'] = sum(x[i][pop_index[area_index == i]].tolist())
+    return dic
 
 
 def dict_to_vector(d, area_list, structure):
@@ -306,7 +342,7 @@ def dict_to_vector(d, area_list, structure):
     for target_area in area_list:
         if target_area in structure:
             for target_pop in structure[target_area]:
-                if isinstance(d[target_area][target_pop], collections.Iterable):
+                if isinstance(d[target_area][target_pop], Iterable):
                     V[i] = d[target_area][target_pop][0]
                 else:
                     V[i] = d[target_area][target_pop]
@@ -314,6 +350,47 @@ def dict_to_vector(d, area_list, structure):
     return V
 
 
+def scaling_vector(scaling, area_list, structure):
+    """
+    Convert a scaling factor of population sizes or indegrees to a
+    vector with one factor per population of a network defined by
+    structure.
+
+    Parameters
+    ----------
+    scaling : float or dict
+        Global scaling factor or dictionary of scaling factors of
+        single areas, each given as one factor for all populations of
+        the area or as a dictionary of factors of its populations.
+        Areas and populations missing in the dictionary are not
+        scaled, unknown areas and populations raise a KeyError.
+    area_list: list
+        List of areas in the network. Defines the order of areas
+        in the vector to be created.
+    structure : dict
+        Structure of the network. Define the populations for each single area.
+    """
+    if not isinstance(scaling, dict):
+        return np.full(sum(len(structure[area]) for area in area_list), float(scaling))
+    for area in scaling:
+        if area not in area_list:
+            raise KeyError("Scaling defined for unknown area {}.".format(area))
+        if isinstance(scaling[area], dict):
+            for pop in scaling[area]:
+                if pop not in structure[area]:
+                    raise KeyError("Scaling defined for unknown population "
+                                   "{} of area {}.".format(pop, area))
+    factors = []
+    for area in area_list:
+        area_scaling = scaling.get(area, 1.)
+        for pop in structure[area]:
+            if isinstance(area_scaling, dict):
+                factors.append(area_scaling.get(pop, 1.))
+            else:
+                factors.append(area_scaling)
+    return np.array(factors, dtype=float)
+
+
 def create_vector_mask(structure, pops=population_list,
                        areas=complete_area_list, complete_area_list=complete_area_list):
     """
@@ -334,13 +411,8 @@ def create_vector_mask(structure, pops=population_list,
         List of areas in the network. Defines the order of areas
         in the given matrix. Defaults to the complete_area_list defined in default_params.
     """
-    mask = np.array([], dtype=bool)
-    for area in complete_area_list:
-        if area in areas:
-            mask = np.append(mask, np.in1d(np.array(structure[area]), pops))
-        else:
-            mask = np.append(mask, np.zeros_like(structure[area], dtype=bool))
-    return mask
+    return _vector_mask(_structure_key(structure, complete_area_list),
+                        tuple(pops), tuple(areas)).copy()
 
 
 def create_mask(structure, target_pops=population_list,
@@ -383,39 +455,116 @@ def create_mask(structure, target_pops=population_list,
         Whether to filter for internal connections only.
         Defaults to False.
     """
-    target_mask = create_vector_mask(structure, pops=target_pops,
-                                     areas=target_areas, complete_area_list=complete_area_list)
-    source_mask = create_vector_mask(structure, pops=source_pops,
-                                     areas=source_areas, complete_area_list=complete_area_list)
-    if external:
-        source_mask = np.append(source_mask, np.array([True]))
-    else:
-        source_mask = np.append(source_mask, np.array([False]))
+    return _mask(*_mask_key(structure, target_pops, source_pops, target_areas,
+                            source_areas, complete_area_list, external, keywords)).copy()
+
+
+def mask_indices(structure, target_pops=population_list,
+                 source_pops=population_list,
+                 target_areas=complete_area_list,
+                 source_areas=complete_area_list,
+                 complete_area_list=complete_area_list,
+                 external=True,
+                 **keywords):
+    """
+    Return the indices of the entries of the connection matrices
+    selected by the mask defined by the given parameters. Takes the
+    same parameters as create_mask. The indices are cached and
+    returned as read-only arrays.
+
+    Returns
+    -------
+    rows : numpy.ndarray
+        Row indices of the selected entries.
+    cols : numpy.ndarray
+        Column indices of the selected entries.
+    """
+    return _mask_indices(*_mask_key(structure, target_pops, source_pops, target_areas,
+                                    source_areas, complete_area_list, external, keywords))
+
+
+def area_slice(structure, area, complete_area_list=complete_area_list):
+    """
+    Return the slice of the rows (or columns) of the vectors and
+    matrices of a network defined by structure that belong to the
+    given area.
+
+    Parameters
+    ----------
+    structure : dict
+        Structure of the network. Define the populations for each single area.
+    area : str
+        Area to return the slice for.
+    complete_area_list : list, optional
+        List of areas in the network. Defines the order of areas
+        in the given matrix. Defaults to the complete_area_list defined in default_params.
+    """
+    start = 0
+    for area2 in complete_area_list:
+        if area2 == area:
+            return slice(start, start + len(structure[area]))
+        start += len(structure[area2])
+    raise KeyError(area)
+
+
+def _structure_key(structure, area_list):
+    return (tuple(area_list), tuple(tuple(structure[area]) for area in area_list))
+
+
+def _mask_key(structure, target_pops, source_pops, target_areas,
+              source_areas, complete_area_list, external, keywords):
+    cortico_cortical = 'cortico_cortical' in keywords and keywords['cortico_cortical']
+    internal = 'internal' in keywords and keywords['internal']
+    return (_structure_key(structure, complete_area_list),
+            tuple(target_pops), tuple(source_pops),
+            tuple(target_areas), tuple(source_areas),
+            bool(external), bool(cortico_cortical), bool(internal))
+
+
+@lru_cache(maxsize=256)
+def _vector_mask(structure_key, pops, areas):
+    area_list, area_pops = structure_key
+    area_index, pop_index = structure_index(area_list, dict(zip(area_list, area_pops)))
+    area_mask = np.array([area in areas for area in area_list], dtype=bool)
+    pop_mask = np.array([pop in pops for pop in population_list], dtype=bool)
+    mask = np.logical_and(area_mask[area_index], pop_mask[pop_index])
+    mask.flags.writeable = False
+    return mask
+
+
+@lru_cache(maxsize=256)
+def _mask(structure_key, target_pops, source_pops, target_areas, source_areas,
+          external, cortico_cortical, internal):
+    area_list, area_pops = structure_key
+    target_mask = _vector_mask(structure_key, target_pops, target_areas)
+    source_mask = np.append(_vector_mask(structure_key, source_pops, source_areas),
+                            external)
     mask = np.outer(target_mask, source_mask)
 
-    if 'cortico_cortical' in keywords and keywords['cortico_cortical']:
-        negative_mask = np.zeros_like(mask, dtype=np.bool)
-        for source in source_areas:
-            smask = create_mask(structure,
-                                target_pops=population_list,
-                                target_areas=[source], source_areas=[source],
-                                source_pops=population_list,
-                                external=True)
-            negative_mask = np.logical_or(negative_mask, smask)
-        mask = np.logical_and(np.logical_not(
-            np.logical_and(mask, negative_mask)), mask)
-    if 'internal' in keywords and keywords['internal']:
-        negative_mask = np.zeros_like(mask, dtype=np.bool)
-        for source in source_areas:
-            smask = create_mask(structure,
-                                target_pops=population_list,
-                                target_areas=[source], source_areas=[source],
-                                source_pops=population_list)
-            negative_mask = np.logical_or(negative_mask, smask)
-        mask = np.logical_and(mask, negative_mask)
+    if cortico_cortical or internal:
+        # Pairs of populations within the same area and the external
+        # input onto each population, restricted to the source areas
+        area_index, pop_index = structure_index(area_list, dict(zip(area_list, area_pops)))
+        same_area = np.ones_like(mask)
+        same_area[:, :-1] = area_index[:, np.newaxis] == area_index[np.newaxis, :]
+        in_source_areas = np.array([area in source_areas for area in area_list], dtype=bool)
+        same_area[np.logical_not(in_source_areas[area_index])] = False
+        if cortico_cortical:
+            mask = np.logical_and(mask, np.logical_not(same_area))
+        if internal:
+            mask = np.logical_and(mask, same_area)
+    mask.flags.writeable = False
     return mask
 
 
+@lru_cache(maxsize=256)
+def _mask_indices(*key):
+    rows, cols = np.nonzero(_mask(*key))
+    rows.flags.writeable = False
+    cols.flags.writeable = False
+    return rows, cols
+
+
 def indegree_to_synapse_numbers(indegrees, neuron_numbers):
     """
     Transform a dictionary of indegrees to synapse numbers using
@@ -543,3 +692,135 @@ def convert_syn_weight(W, neuron_params):
     PSP_transform = tau_syn_ex / C_m
 
     return PSP_transform * W
+
+
+def write_json(obj, fn):
+    """
+    Write an object to a json file. The object is written to a
+    temporary file first which is then renamed, so that other
+    processes never read a partially written file.
+
+    Parameters
+    ----------
+    obj : object
+        Object to be written.
+    fn : str
+        Name of the json file.
+    """
+    tmp_fn = '{}.tmp_{}_{}'.format(fn, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_fn, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp_fn, fn)
+    except BaseException:
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+        raise
+
+
+def generate_label(params, arrays=None, blacklist=None):
+    """
+    Compute an md5 hash label from a (nested) dictionary of parameters
+    and a dictionary of arrays.
+
+    The parameters are serialized canonically, i.e. with sorted keys
+    and tagged types, with floats multiplied by LABEL_FLOAT_FACTOR
+    and truncated to integers. Lists, tuples and arrays are treated
+    equally. The arrays are multiplied by LABEL_FLOAT_FACTOR as well,
+    truncated and hashed as little-endian 64-bit integer buffers
+    together with their shapes. Thus, labels are identical on all
+    platforms.
+
+    Parameters
+    ----------
+    params : dict
+        Dictionary of parameters.
+    arrays : dict, optional
+        Dictionary of numpy arrays (or None), e.g. the connectivity
+        of a network. Defaults to None.
+    blacklist : list, optional
+        Keys of params which are not used for the label. Keys of
+        subdictionaries are given as tuples of the full path of keys.
+        Defaults to None.
+
+    Returns
+    -------
+    label : str
+        Hexadecimal md5 hash.
+    """
+    if blacklist is not None:
+        params = _remove_keys(params, blacklist)
+    md5 = hashlib.md5()
+    md5.update(json.dumps(_canonical(params), separators=(',', ':')).encode('utf-8'))
+    if arrays is not None:
+        for name in sorted(arrays):
+            md5.update(name.encode('utf-8'))
+            if arrays[name] is None:
+                md5.update(b'None')
+                continue
+            x = np.asarray(arrays[name], dtype=float)
+            md5.update(str(x.shape).encode('utf-8'))
+            md5.update(np.trunc(x * LABEL_FLOAT_FACTOR).astype('<i8').tobytes())
+    return md5.hexdigest()
+
+
+def simulation_label(params, network_label):
+    """
+    Compute the label of a simulation.
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters, i.e. the default parameters updated
+        with the custom parameters of the simulation.
+    network_label : str
+        Label of the simulated network.
+    """
+    # The bounds of the delays, the segmentation and the time budget
+    # only enter the label if they are defined, to keep the labels of
+    # earlier simulations. Simulations which may stop early thus do
+    # not share the directory of complete ones.
+    blacklist = [('params', key) for key in ['delay_floor', 'min_delay', 'max_delay',
+                                             't_segment', 'time_budget']
+                 if params[key] == sim_params[key]]
+    if params['recording_dict']['spike_recording'] == 'network':
+        blacklist.append(('params', 'recording_dict', 'spike_recording'))
+    return generate_label({'params': params,
+                           'network_label': network_label},
+                          blacklist=blacklist)
+
+
+def _remove_keys(d, blacklist):
+    # Copy only the dictionaries along the paths of removed keys
+    d = dict(d)
+    for key in blacklist:
+        if isinstance(key, tuple) and len(key) > 1:
+            if key[0] in d:
+                d[key[0]] = _remove_keys(d[key[0]], [key[1:]])
+        else:
+            if isinstance(key, tuple):
+                key = key[0]
+            d.pop(key, None)
+    return d
+
+
+def _canonical(x):
+    if isinstance(x, Mapping):
+        return [[str(key), _canonical(x[key])] for key in sorted(x, key=str)]
+    elif isinstance(x, np.ndarray):
+        return [_canonical(val) for val in x.tolist()]
+    elif isinstance(x, (list, tuple)):
+        return [_canonical(val) for val in x]
+    elif isinstance(x, (bool, np.bool_)):
+        return 'b{}'.format(int(x))
+    elif isinstance(x, (float, np.floating)):
+        x = float(x)
+        if np.isfinite(x):
+            return 'f{}'.format(int(x * LABEL_FLOAT_FACTOR))
+        return 'f{}'.format(x)
+    elif isinstance(x, (int, np.integer)):
+        return 'i{}'.format(int(x))
+    elif x is None:
+        return 'n'
+    else:
+        return 's{}'.format(x)
@@ -29,35 +29,41 @@ import json
 import numpy as np
 import os
 import pprint
-import shutil
+import threading
 from .default_params import complete_area_list, nested_update, network_params
 from .default_params import check_custom_params
 from collections import OrderedDict
 from copy import deepcopy
-from .data_multiarea.Model import compute_Model_params
-from .analysis import Analysis
+from .data_multiarea.Model import (
+    compute_Model_data,
+    compute_Model_data_batch,
+    stage_params,
+    update_synapse_weights,
+)
+from .cache_helpers import (
+    data_cache_key,
+    is_cached,
+    load_from_cache,
+    read_base_from_cache,
+    read_from_cache,
+    store_in_cache,
+)
+from .connectivity_tensor import ConnectivityTensor, as_tensor
 from config import base_path
-from dicthash import dicthash
 from .multiarea_helpers import (
-    area_level_dict,
-    load_degree_data,
     convert_syn_weight,
-    dict_to_matrix,
     dict_to_vector,
-    indegree_to_synapse_numbers,
-    matrix_to_dict,
+    generate_label,
+    scaling_vector,
     vector_to_dict,
+    write_json,
 )
-from .simulation import Simulation
-from .theory import Theory
+from .storage_helpers import data_file_name, load_data, save_data
 
-# Set precision of dicthash library to 1e-4
-# because this is sufficient for indegrees
-# and neuron numbers and guarantees reproducibility
-# of the class label despite inevitably imprecise float calculations
-# in the data scripts.
-dicthash.FLOAT_FACTOR = 1e4
-dicthash.FLOOR_SMALL_FLOATS = True
+# Attributes set by MultiAreaModel.init_connectivity
+connectivity_attributes = ['synapses', 'W', 'W_sd', 'K', 'distances', 'N_vec',
+                           'syn_matrix', 'K_matrix', 'W_matrix', 'structure_vec',
+                           'add_DC_drive', 'N_scaling', 'K_scaling']
 
 
 class MultiAreaModel:
@@ -81,107 +87,158 @@ class MultiAreaModel:
             whether to create an instance of the simulation class as member.
         analysis : bool
             whether to create an instance of the analysis class as member.
-
+        use_cache : bool, optional
+            Whether to load the output of the data scripts from the
+            cache in config_files/model_cache if it has been computed
+            before for the same parameters, and to store it there
+            otherwise. If the cache only contains a network differing
+            in the parameters of the synaptic weights (see
+            data_multiarea.Model.stage_params), only the synaptic
+            weights are recomputed. Only used if network_spec is of
+            type dict. Defaults to True.
+        persist : bool or str, optional
+            Whether to write the parameter and data files of the
+            network to config_files, which is required to load the
+            network from its label later. If 'async', the files are
+            written in a background thread. Files that have not been
+            written yet can be written with `persist()`. Only used if
+            network_spec is of type dict. Defaults to True.
+        data_format : str, optional
+            Format of the data file written to config_files, 'json'
+            or 'npy' (see storage_helpers). Only used if network_spec
+            is of type dict. If network_spec is a label, the format
+            is determined from the existing file. Defaults to 'json'.
+        mmap_mode : str, optional
+            Memory-map mode used to load the connectivity from a data
+            file in 'npy' format, see numpy.load. Defaults to 'r'.
+        data : dict, optional
+            Output of the data scripts for the parameters given in
+            network_spec, as returned by
+            data_multiarea.Model.compute_Model_data. If given, the
+            data scripts are not executed and the cache is not read.
+            Only used if network_spec is of type dict.
+        lazy : bool, optional
+            If True and network_spec is a label, only load the structure
+            and the neuron numbers of the network. The connectivity
+            is then loaded from the data file on first access of any
+            of its attributes (K, synapses, K_matrix etc.). In this
+            case, the label is not verified. Data files in 'json'
+            format can only be parsed as a whole, so their content is
+            kept until the connectivity is set up and only the 'npy'
+            format defers reading the connectivity. Defaults to False.
+
+        Derived quantities (K_areas, K_out, J_matrix, W_sd_matrix) are
+        computed on first access.
         """
         self.params = deepcopy(network_params)
+        if 'lazy' not in keywords:
+            lazy = False
+        else:
+            lazy = keywords['lazy']
+        if 'data_format' not in keywords:
+            self.data_format = 'json'
+        else:
+            self.data_format = keywords['data_format']
+        if 'mmap_mode' not in keywords:
+            self.mmap_mode = 'r'
+        else:
+            self.mmap_mode = keywords['mmap_mode']
+        self._persist_thread = None
+        self._unpersisted_data = None
+        self._lazy_data = None
         if isinstance(network_spec, dict):
             print("Initializing network from dictionary.")
             check_custom_params(network_spec, self.params)
             self.custom_params = network_spec
-            p_ = 'multiarea_model/data_multiarea/custom_data_files'
-            # Draw random integer label for data script to avoid clashes with
-            # parallelly created class instances
-            rand_data_label = np.random.randint(10000)
-            print("RAND_DATA_LABEL", rand_data_label)
-            tmp_parameter_fn = os.path.join(base_path,
-                                            p_,
-                                            'custom_{}_parameter_dict.json'.format(rand_data_label))
-            tmp_data_fn = os.path.join(base_path,
-                                       p_,
-                                       'custom_Data_Model_{}.json'.format(rand_data_label))
-
-            with open(tmp_parameter_fn, 'w') as f:
-                json.dump(self.custom_params, f)
-            # Execute Data script
-            compute_Model_params(out_label=str(rand_data_label),
-                                 mode='custom')
+            if 'use_cache' not in keywords:
+                use_cache = True
+            else:
+                use_cache = keywords['use_cache']
+            cache_key = None
+            base_key = None
+            dat = None
+            if use_cache:
+                cache_key = data_cache_key(self.custom_params)
+                # Networks differing only in parameters of the synaptic
+                # weights share the same base key
+                base_key = data_cache_key(self.custom_params,
+                                          ignored_params=stage_params['synapse_weights'])
+            if 'data' in keywords:
+                # Data computed beforehand, e.g. by MultiAreaModel.batch
+                dat = keywords['data']
+                store_cache = use_cache
+            else:
+                if use_cache:
+                    dat = read_from_cache(cache_key)
+                if dat is not None:
+                    print("Loaded data from cache.")
+                    store_cache = False
+                else:
+                    if use_cache:
+                        dat = read_base_from_cache(base_key)
+                    if dat is not None:
+                        print("Loaded synapse numbers from cache.")
+                        dat = update_synapse_weights(dat, self.custom_params)
+                    else:
+                        # Execute Data script
+                        dat = compute_Model_data(self.custom_params)
+                    store_cache = use_cache
+            # The data file is written after computing the label
+            data_fn = None
         else:
             print("Initializing network from label.")
             parameter_fn = os.path.join(base_path,
                                         'config_files',
                                         '{}_config'.format(network_spec))
-            tmp_data_fn = os.path.join(base_path,
-                                       'config_files',
-                                       'custom_Data_Model_{}.json'.format(network_spec))
+            data_fn = data_file_name(network_spec)
             with open(parameter_fn, 'r') as f:
                 self.custom_params = json.load(f)
+            dat = load_data(data_fn, mmap_mode=self.mmap_mode, header_only=lazy)
         nested_update(self.params, self.custom_params)
-        with open(tmp_data_fn, 'r') as f:
-            dat = json.load(f)
 
         self.structure = OrderedDict()
         for area in dat['area_list']:
             self.structure[area] = dat['structure'][area]
-        self.N = dat['neuron_numbers']
-        self.synapses = dat['synapses']
-        self.W = dat['synapse_weights_mean']
-        self.W_sd = dat['synapse_weights_sd']
         self.area_list = complete_area_list
-        self.distances = dat['distances']
-
-        ind, inda, out, outa = load_degree_data(tmp_data_fn)
-        # If K_stable is specified in the params, load the stabilized matrix
-        # TODO: Extend this by calling the stabilization method
-        if self.params['connection_params']['K_stable'] is None:
-            self.K = ind
+        self.data_fn = data_fn
+
+        if lazy and isinstance(network_spec, str):
+            # Only load neuron numbers, the connectivity is loaded on
+            # first access
+            self.N = dat['neuron_numbers']
+            N_scaling = scaling_vector(self.params['N_scaling'], self.area_list, self.structure)
+            if np.any(N_scaling != 1.):
+                N_vec = dict_to_vector(self.N, self.area_list, self.structure)
+                self.N = vector_to_dict(N_vec * N_scaling,
+                                        self.area_list, self.structure)
+            self.label = network_spec
+            if 'synapses' in dat:
+                # The json file has been parsed completely, keep its
+                # content to set up the connectivity without parsing
+                # the file again
+                self._lazy_data = dat
         else:
-            if not isinstance(self.params['connection_params']['K_stable'], str):
-                raise TypeError("Not supported. Please store the "
-                                "matrix in a binary numpy file and define "
-                                "the path to the file as the parameter value.")
-            # Assume that the parameter defines a filename containing the matrix
-            K_stable = np.load(self.params['connection_params']['K_stable'])
-            ext = {area: {pop: ind[area][pop]['external'] for pop in
-                          self.structure['V1']} for area in self.area_list}
-            self.K = matrix_to_dict(
-                K_stable, self.area_list, self.structure, external=ext)
-            self.synapses = indegree_to_synapse_numbers(self.K, self.N)
-
-        self.vectorize()
-        if self.params['K_scaling'] != 1. or self.params['N_scaling'] != 1.:
-            if self.params['fullscale_rates'] is None:
-                raise KeyError('For downscaling, you have to define a file'
-                               ' with fullscale rates.')
-            self.scale_network()
-
-        self.K_areas = area_level_dict(self.K, self.N)
-        self.label = dicthash.generate_hash_from_dict({'params': self.params,
-                                                       'K': self.K,
-                                                       'N': self.N,
-                                                       'structure': self.structure},
-                                                      blacklist=[('params', 'fullscale_rates'),
-                                                                 ('params',
-                                                                  'connection_params',
-                                                                  'K_stable'),
-                                                                 ('params',
-                                                                  'connection_params',
-                                                                  'replace_cc_input_source')])
+            self.init_connectivity(dat)
+            self.label = self.compute_label()
 
         if isinstance(network_spec, dict):
-            parameter_fn = os.path.join(base_path,
-                                        'config_files',
-                                        '{}_config'.format(self.label))
-            data_fn = os.path.join(base_path,
-                                   'config_files',
-                                   'custom_Data_Model_{}.json'.format(self.label))
-
-            shutil.move(tmp_parameter_fn,
-                        parameter_fn)
-            shutil.move(tmp_data_fn,
-                        data_fn)
+            self.data_fn = data_file_name(self.label, self.data_format)
+            if 'persist' not in keywords:
+                persist = True
+            else:
+                persist = keywords['persist']
+            self._unpersisted_data = (dat, cache_key, base_key, store_cache)
+            if persist == 'async':
+                self._persist_thread = threading.Thread(target=self._write_data_files)
+                self._persist_thread.start()
+            elif persist:
+                self.persist()
 
         elif isinstance(network_spec, str):
-            assert(network_spec == self.label)
+            assert network_spec == self.label, (
+                "The network {} has label {}. Networks stored by earlier versions "
+                "can be relabeled with storage_helpers.migrate_labels.".format(network_spec,
+                                                                             self.label))
 
         # Initialize member classes
         if theory:
@@ -206,6 +263,174 @@ class MultiAreaModel:
                 ana_spec = keywords['ana_spec']
             self.init_analysis(ana_spec)
 
+    @classmethod
+    def batch(cls, base_params, variations, *args, **keywords):
+        """
+        Create several variants of a network, e.g. for a parameter
+        sweep. The data scripts are executed once for all variants
+        that are not in the cache, so that the synapse numbers are
+        only computed once for all variants sharing the same surface
+        and av_indegree_V1, and the synaptic weights only once for
+        all variants sharing the same weight parameters (see
+        data_multiarea.Model.stage_params).
+
+        Parameters
+        ----------
+        base_params : dict
+            Custom parameters shared by all variants.
+        variations : list
+            List of dictionaries of custom parameters of each variant,
+            which overwrite the parameters in base_params.
+        *args, **keywords
+            Further arguments passed to MultiAreaModel for each
+            variant, e.g. persist, data_format or theory.
+
+        Returns
+        -------
+        models : list
+            Network instances of all variants. Their connectivity can
+            be stacked, e.g., with np.array([M.K_matrix for M in models]).
+        """
+        if 'use_cache' not in keywords:
+            use_cache = True
+        else:
+            use_cache = keywords['use_cache']
+        params_list = []
+        for variation in variations:
+            params = deepcopy(base_params)
+            nested_update(params, variation)
+            check_custom_params(params, network_params)
+            params_list.append(params)
+
+        missing = [i for i, params in enumerate(params_list) if
+                   not (use_cache and is_cached(data_cache_key(params)))]
+        data = dict(zip(missing, compute_Model_data_batch([params_list[i]
+                                                           for i in missing])))
+        models = []
+        for i, params in enumerate(params_list):
+            if i in data:
+                models.append(cls(params, *args, data=data.pop(i), **keywords))
+            else:
+                models.append(cls(params, *args, **keywords))
+        return models
+
+    def persist(self):
+        """
+        Write the parameter and data files of the network to
+        config_files if they have not been written yet. If they are
+        being written asynchronously, wait until writing has finished.
+        """
+        if self._persist_thread is not None:
+            self._persist_thread.join()
+            self._persist_thread = None
+        if self._unpersisted_data is not None:
+            self._write_data_files()
+
+    def _write_data_files(self):
+        dat, cache_key, base_key, store_cache = self._unpersisted_data
+        parameter_fn = os.path.join(base_path,
+                                    'config_files',
+                                    '{}_config'.format(self.label))
+        write_json(self.custom_params, parameter_fn)
+        # Networks with the same label share the same data file
+        if not os.path.exists(self.data_fn):
+            if (self.data_format != 'json' or cache_key is None or
+                    not load_from_cache(cache_key, self.data_fn)):
+                save_data(dat, self.data_fn, self.data_format)
+        if store_cache:
+            if self.data_format == 'json':
+                store_in_cache(cache_key, self.data_fn, base_key=base_key)
+            else:
+                store_in_cache(cache_key, dat, base_key=base_key)
+        self._unpersisted_data = None
+
+    def compute_label(self):
+        """
+        Compute the label of the network from its parameters, its
+        structure, the indegrees and the neuron numbers.
+        """
+        return generate_label({'params': self.params,
+                               'structure': self.structure},
+                              arrays={'K': self.K.values,
+                                      'K_ext': self.K.external,
+                                      'N': self.N_vec},
+                              blacklist=[('params', 'fullscale_rates'),
+                                         ('params', 'connection_params', 'K_stable'),
+                                         ('params', 'connection_params',
+                                          'replace_cc_input_source')])
+
+    def init_connectivity(self, dat=None):
+        """
+        Load the connectivity of the network from the output of the
+        data scripts and scale it according to `N_scaling` and
+        `K_scaling`.
+
+        Parameters
+        ----------
+        dat : dict, optional
+            Content of the data file. If None, use the content kept
+            when loading the network lazily from a json file or load
+            the data file of the network. Defaults to None.
+        """
+        if dat is None:
+            dat, self._lazy_data = self._lazy_data, None
+        if dat is None:
+            dat = load_data(self.data_fn, mmap_mode=self.mmap_mode)
+        self.N = dat['neuron_numbers']
+        # Connectivity is stored as ConnectivityTensor, indexed by
+        # (target area, target pop, source area, source pop), which
+        # also provides dictionary-style access
+        self.synapses = as_tensor(dat['synapses'])
+        self.W = as_tensor(dat['synapse_weights_mean'])
+        self.W_sd = as_tensor(dat['synapse_weights_sd'])
+        self.distances = dat['distances']
+
+        ind = self.synapses.indegrees(self.N)
+        # If K_stable is specified in the params, load the stabilized matrix
+        # TODO: Extend this by calling the stabilization method
+        K_stable = self.params['connection_params']['K_stable']
+        if K_stable is None or K_stable is False:
+            self.K = ind
+        else:
+            if not isinstance(K_stable, str):
+                raise TypeError("Not supported. Please store the "
+                                "matrix in a binary numpy file and define "
+                                "the path to the file as the parameter value.")
+            # Assume that the parameter defines a filename containing the matrix
+            K_stable = np.load(K_stable)
+            self.K = ConnectivityTensor.from_matrix(
+                K_stable, self.area_list, self.structure, external=ind.external)
+            self.synapses = self.K.synapse_numbers(self.N)
+
+        self.vectorize()
+        self.N_scaling = scaling_vector(self.params['N_scaling'], self.area_list, self.structure)
+        self.K_scaling = scaling_vector(self.params['K_scaling'], self.area_list, self.structure)
+        if np.any(self.K_scaling != 1.) or np.any(self.N_scaling != 1.):
+            if self.params['fullscale_rates'] is None:
+                raise KeyError('For downscaling, you have to define a file'
+                               ' with fullscale rates.')
+            self.scale_network()
+
+    def __getattr__(self, name):
+        # Only called if the attribute does not exist (yet), i.e. for
+        # attributes that are computed on first access
+        if 'data_fn' not in self.__dict__:
+            raise AttributeError(name)
+        if name in connectivity_attributes:
+            self.init_connectivity()
+        elif name == 'K_areas':
+            self.K_areas = self.K.area_level_dict(self.N)
+        elif name == 'K_out':
+            self.K_out = self.synapses.outdegrees(self.N)
+        elif name == 'J_matrix':
+            self.J_matrix = convert_syn_weight(self.W_matrix,
+                                               self.params['neuron_params']['single_neuron_dict'])
+        elif name == 'W_sd_matrix':
+            self.W_sd_matrix = self.W_sd.to_matrix(self.structure)
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
     def __str__(self):
         s = "Multi-area network {} with custom parameters: \n".format(self.label)
         s += pprint.pformat(self.params, width=1)
@@ -217,13 +442,19 @@ class MultiAreaModel:
     def __hash__(self):
         return hash(self.label)
 
+    # The member classes are imported on first use because they
+    # import NEST, matplotlib and pandas
+
     def init_theory(self, theory_spec):
+        from .theory import Theory
         self.theory = Theory(self, theory_spec)
 
     def init_simulation(self, sim_spec):
+        from .simulation import Simulation
         self.simulation = Simulation(self, sim_spec)
 
     def init_analysis(self, ana_spec):
+        from .analysis import Analysis
         assert(hasattr(self, 'simulation'))
         if 'load_areas' in ana_spec:
             load_areas = ana_spec['load_areas']
@@ -240,43 +471,48 @@ class MultiAreaModel:
     def scale_network(self):
         """
         Scale the network if `N_scaling` and/or `K_scaling` differ from 1.
+        The scaling factors can differ between areas and populations.
 
         This function:
         - adjusts the synaptic weights such that the population-averaged
           stationary spike rates approximately match the given `full-scale_rates`.
         - scales the population sizes with `N_scaling` and indegrees with `K_scaling`.
         - scales the synapse numbers with `N_scaling`*`K_scaling`.
+        The indegrees and synapse numbers are scaled with the factors
+        of the target population.
         """
         # population sizes
-        self.N_vec *= self.params['N_scaling']
+        self.N_vec *= self.N_scaling
 
         # Scale the synaptic weights before the indegrees to use full-scale indegrees
         self.adj_W_to_K()
         # Then scale the indegrees and synapse numbers
-        self.K_matrix *= self.params['K_scaling']
-        self.syn_matrix *= self.params['K_scaling'] * self.params['N_scaling']
+        self.K_matrix *= self.K_scaling[:, np.newaxis]
+        self.syn_matrix *= (self.K_scaling * self.N_scaling)[:, np.newaxis]
 
-        # Finally recreate dictionaries
+        # Finally recreate dictionary and tensors
         self.N = vector_to_dict(self.N_vec, self.area_list, self.structure)
-        self.K = matrix_to_dict(self.K_matrix[:, :-1], self.area_list,
-                                self.structure, external=self.K_matrix[:, -1])
-        self.W = matrix_to_dict(self.W_matrix[:, :-1], self.area_list,
-                                self.structure, external=self.W_matrix[:, -1])
+        self.K = ConnectivityTensor.from_matrix(self.K_matrix, self.area_list,
+                                                self.structure, external=self.K_matrix[:, -1])
+        self.W = ConnectivityTensor.from_matrix(self.W_matrix, self.area_list,
+                                                self.structure, external=self.W_matrix[:, -1])
 
-        self.synapses = matrix_to_dict(self.syn_matrix, self.area_list, self.structure)
+        self.synapses = ConnectivityTensor.from_matrix(self.syn_matrix, self.area_list,
+                                                       self.structure)
 
     def vectorize(self):
         """
         Create matrix and vector version of neuron numbers, synapses
-        and synapse weight dictionaries.
+        and synapse weight tensors.
         """
+        # Discard derived quantities computed from previous matrices
+        for name in ['K_areas', 'K_out', 'J_matrix', 'W_sd_matrix']:
+            self.__dict__.pop(name, None)
 
         self.N_vec = dict_to_vector(self.N, self.area_list, self.structure)
-        self.syn_matrix = dict_to_matrix(self.synapses, self.area_list, self.structure)
-        self.K_matrix = dict_to_matrix(self.K, self.area_list, self.structure)
-        self.W_matrix = dict_to_matrix(self.W, self.area_list, self.structure)
-        self.J_matrix = convert_syn_weight(self.W_matrix,
-                                           self.params['neuron_params']['single_neuron_dict'])
+        self.syn_matrix = self.synapses.to_matrix(self.structure)
+        self.K_matrix = self.K.to_matrix(self.structure)
+        self.W_matrix = self.W.to_matrix(self.structure)
         self.structure_vec = ['-'.join((area, pop)) for area in
                               self.area_list for pop in self.structure[area]]
         self.add_DC_drive = np.zeros_like(self.N_vec)
@@ -306,8 +542,10 @@ class MultiAreaModel:
         K_ext = self.K_matrix[:, -1]
         x1_ext = 1e-3 * tau_m * J_ext * K_ext * rate_ext
         x1 = 1e-3 * tau_m * np.dot(self.J_matrix[:, :-1] * self.K_matrix[:, :-1], full_mean_rates)
-        K_scaling = self.params['K_scaling']
-        self.J_matrix /= np.sqrt(K_scaling)
+        # The mean and variance of the input to each population are
+        # preserved with the indegree scaling of the population
+        K_scaling = self.K_scaling
+        self.J_matrix /= np.sqrt(K_scaling)[:, np.newaxis]
         self.add_DC_drive = C_m / tau_m * ((1. - np.sqrt(K_scaling)) * (x1 + x1_ext))
         neuron_params = self.params['neuron_params']['single_neuron_dict']
         self.W_matrix = (1. / convert_syn_weight(1., neuron_params) * self.J_matrix)
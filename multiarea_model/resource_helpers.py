@@ -0,0 +1,489 @@
+"""
+resource_helpers
+==============
+
+Helper functions to estimate the resources needed by a simulation of
+a network before running it, i.e. the number of neurons, synapses and
+devices created in NEST, the number of recorded spikes, and the
+memory per MPI process and the wall-clock time.
+
+Memory and time are estimated with linear models of the counts
+divided by the number of MPI processes or virtual processes. The
+coefficients of the models can be calibrated against the log files
+(<label>_logfile_<rank>) written by Simulation.logging in past runs.
+
+Functions
+---------
+
+count_resources : Count neurons, synapses, devices and spikes of a simulation
+estimate_resources : Estimate counts, memory per process and wall-clock time
+read_logfiles : Load the log files of a past simulation
+simulated_time : Simulated time of a past simulation, which may have stopped early
+fit_calibration : Fit the coefficients of the linear models to measured resources
+calibrate : Fit the coefficients to the log files of past simulations
+size_job : Choose the number of nodes, processes and threads and the time limit of a job
+"""
+
+import glob
+import json
+import numpy as np
+import os
+
+from config import data_path
+from copy import deepcopy
+from .default_params import nested_update, sim_params
+from .analysis_helpers import spike_dtype
+from .multiarea_helpers import create_vector_mask, dict_to_vector
+from .sub_model import SubModel
+try:
+    from config import node_spec as default_node_spec
+except ImportError:
+    default_node_spec = {}
+try:
+    from config import resource_calibration
+except ImportError:
+    resource_calibration = None
+
+# Rate (spikes/s) assumed for all populations if no rates are given
+# and the network does not define fullscale_rates
+default_rate = 10.
+
+# Size of a spike in the ascii output of the spike detectors (bytes)
+bytes_per_spike = 16
+
+# Coefficients of the linear models for the memory per MPI process
+# (MB) and the wall-clock times (s). The default values are rough
+# values for NEST 2.14 and should be replaced by the result of
+# calibrate. See _features for the quantities the coefficients are
+# multiplied with.
+default_calibration = {
+    'memory': {'base': 500.,
+               'neuron': 1.5e-3,
+               'synapse': 5e-5,
+               'device': 1e-2},
+    'time_network': {'base': 1.,
+                     'neuron': 1e-5,
+                     'synapse': 1e-6},
+    'time_simulate': {'base': 0.,
+                      'update': 2e-8,
+                      'event': 1e-8}}
+
+# Specification of the compute nodes used by size_job. Entries can be
+# overwritten by the optional variable node_spec in config.py.
+node_spec_defaults = {
+    # Memory per node available to the job (MB)
+    'memory': 128 * 1024.,
+    # No. of cores per node
+    'cores': 48,
+    # Maximal no. of nodes of a job
+    'max_nodes': 256,
+    # Maximal wall-clock time of a job (s), None for no limit
+    'max_time': None,
+    # Factors applied to the estimated memory and time to obtain the
+    # requested memory and the time limit
+    'memory_margin': 1.2,
+    'time_margin': 1.5}
+
+
+def count_resources(network, sim_spec=None, rates=None):
+    """
+    Count the neurons, synapses and devices created in NEST by a
+    simulation of the network and the number of recorded spikes, in
+    the same way as Simulation.simulate creates them.
+
+    Parameters
+    ----------
+    network : MultiAreaModel
+        Network to be simulated.
+    sim_spec : dict, optional
+        Custom simulation parameters overwriting the default
+        parameters defined in default_params.py. Defaults to None.
+    rates : float or numpy.ndarray, optional
+        Rates of all populations in spikes/s, used to estimate the
+        number of spikes. Defaults to the fullscale_rates of the
+        network if defined and to default_rate otherwise.
+
+    Returns
+    -------
+    counts : dict
+        Number of neurons ('num_neurons'), synapses between neurons
+        ('num_synapses'), devices ('num_devices'), connections of
+        devices ('num_device_connections'), recorded spikes
+        ('num_spikes') and their size in bytes ('spike_output_bytes'),
+        spikes delivered to synapses ('num_spike_events') and time
+        steps ('num_steps'), together with the number of MPI processes
+        ('num_processes') and threads ('local_num_threads').
+    """
+    params = deepcopy(sim_params)
+    if sim_spec is not None:
+        nested_update(params, sim_spec)
+    structure = network.structure
+    area_list = network.area_list
+    conn_params = network.params['connection_params']
+    N = np.floor(network.N_vec)
+    syn = np.floor(network.syn_matrix[:, :-1])
+    if rates is None:
+        if network.params['fullscale_rates'] is not None:
+            with open(network.params['fullscale_rates'], 'r') as f:
+                rates = dict_to_vector(json.load(f), area_list, structure)
+        else:
+            rates = default_rate
+    rates = np.broadcast_to(np.asarray(rates, dtype=float), N.shape)
+
+    areas_simulated = params['areas_simulated']
+    areas_recorded = [area for area in params['recording_dict']['areas_recorded']
+                      if area in areas_simulated]
+    simulated = create_vector_mask(structure, areas=areas_simulated,
+                                   complete_area_list=area_list)
+    recorded = create_vector_mask(structure, areas=areas_recorded,
+                                  complete_area_list=area_list)
+    area_of_pop = np.array([area for area in area_list for pop in structure[area]])
+    same_area = area_of_pop[:, np.newaxis] == area_of_pop[np.newaxis, :]
+    simulated_pairs = simulated[:, np.newaxis] & simulated[np.newaxis, :]
+
+    # Connections between populations and input replacing
+    # cortico-cortical connections
+    if conn_params['replace_cc']:
+        created = simulated_pairs & same_area
+        replaced = simulated_pairs & ~same_area
+        replacement_type = conn_params['replace_cc']
+    else:
+        created = simulated_pairs
+        replaced = simulated[:, np.newaxis] & ~simulated[np.newaxis, :]
+        replacement_type = conn_params['replace_non_simulated_areas']
+        if np.any(replaced) and replacement_type is None:
+            raise KeyError("Please define a valid method to"
+                           " replace non-simulated areas.")
+    syn_created = np.where(created, syn, 0.)
+    T = params['t_sim']
+
+    # One generator for each pair of target population and replaced
+    # source population, or for each weight of the aggregated
+    # stationary Poisson input to a target population (see SubModel)
+    if np.any(replaced) and replacement_type in ['hom_poisson_stat', 'het_poisson_stat']:
+        submodel = SubModel(network, areas_simulated)
+        num_generators = np.array([submodel.replacement_input[area][pop]['rate'].size
+                                   for area in submodel.area_list
+                                   for pop in submodel.structure[area]])
+        num_devices = np.sum(num_generators)
+        num_device_connections = np.sum(num_generators * N[simulated])
+    else:
+        num_devices = np.sum(replaced)
+        num_device_connections = np.sum(replaced * N[:, np.newaxis])
+    # Spike detectors
+    if params['recording_dict']['spike_recording'] == 'population':
+        num_devices += np.sum(recorded)
+        spike_bytes = spike_dtype.itemsize
+    else:
+        num_devices += 1
+        spike_bytes = bytes_per_spike
+    num_device_connections += np.sum(N[recorded])
+    # Voltmeter
+    if params['recording_dict']['record_vm']:
+        num_devices += 1
+        nrec = np.floor(params['recording_dict']['Nrec_vm_fraction'] * network.N_vec)
+        num_device_connections += np.sum(nrec[simulated] + 1)
+    # Poisson generators for external input
+    if network.params['input_params']['poisson_input']:
+        num_devices += np.sum(simulated)
+        num_device_connections += np.sum(N[simulated])
+
+    num_spikes = np.sum(N[recorded] * rates[recorded]) * T * 1e-3
+    counts = {'num_neurons': int(np.sum(N[simulated])),
+              'num_synapses': int(np.sum(syn_created)),
+              'num_devices': int(num_devices),
+              'num_device_connections': int(num_device_connections),
+              'num_spikes': float(num_spikes),
+              'spike_output_bytes': float(num_spikes * spike_bytes),
+              'num_spike_events': float(np.sum(np.dot(syn_created, rates)) * T * 1e-3),
+              'num_steps': int(round(T / params['dt'])),
+              'num_processes': params['num_processes'],
+              'local_num_threads': params['local_num_threads']}
+    return counts
+
+
+def estimate_resources(network, sim_spec=None, calibration=None, rates=None):
+    """
+    Estimate the resources needed by a simulation of the network.
+
+    Parameters
+    ----------
+    network : MultiAreaModel
+        Network to be simulated.
+    sim_spec : dict, optional
+        Custom simulation parameters overwriting the default
+        parameters defined in default_params.py, in particular
+        num_processes, local_num_threads, areas_simulated, t_sim and
+        recording_dict. Defaults to None.
+    calibration : dict or str, optional
+        Coefficients of the linear models as returned by calibrate
+        or the name of a json file containing them. Defaults to the
+        file resource_calibration if defined in config.py and to
+        default_calibration otherwise.
+    rates : float or numpy.ndarray, optional
+        Rates of all populations in spikes/s. See count_resources.
+
+    Returns
+    -------
+    estimate : dict
+        Counts as returned by count_resources, and the estimated
+        memory per MPI process ('memory_per_rank') and in total
+        ('memory_total') in MB and the wall-clock times (s) for
+        preparing and creating the network ('time_network') and for
+        the simulation ('time_simulate').
+    """
+    counts = count_resources(network, sim_spec, rates=rates)
+    return _estimate(counts, _load_calibration(calibration))
+
+
+def read_logfiles(label):
+    """
+    Load the log files written by all MPI processes of a past
+    simulation.
+
+    Parameters
+    ----------
+    label : str
+        Label of the simulation.
+
+    Returns
+    -------
+    logs : list
+        List of dictionaries, one for each MPI process.
+    """
+    fp = os.path.join(data_path, label, 'recordings', '{}_logfile_*'.format(label))
+    logs = []
+    for fn in sorted(glob.glob(fp)):
+        with open(fn, 'r') as f:
+            logs.append(json.load(f))
+    return logs
+
+
+def simulated_time(logs, t_sim):
+    """
+    Return the time simulated by a past simulation, which is shorter
+    than t_sim if the simulation was stopped early because of the
+    time_budget or by a callback.
+
+    Parameters
+    ----------
+    logs : list
+        Log files of the simulation as returned by read_logfiles.
+    t_sim : float
+        Simulation time defined in the parameters of the simulation.
+        Returned if the log files do not contain the simulated time.
+
+    Returns
+    -------
+    t_simulated : float
+        Simulated time in ms.
+    """
+    times = [d['t_simulated'] for d in logs if 't_simulated' in d]
+    if len(times) == 0:
+        return t_sim
+    return min(times)
+
+
+def fit_calibration(counts_list, logs_list):
+    """
+    Fit the coefficients of the linear models for memory and
+    wall-clock times to the resources measured in past simulations,
+    using non-negative least squares.
+
+    Parameters
+    ----------
+    counts_list : list
+        Counts of each simulation as returned by count_resources for
+        the simulated time (see simulated_time).
+    logs_list : list
+        Log files of each simulation as returned by read_logfiles.
+
+    Returns
+    -------
+    calibration : dict
+        Fitted coefficients, in the format of default_calibration.
+    """
+    from scipy.optimize import nnls
+
+    measured = {'memory': [], 'time_network': [], 'time_simulate': []}
+    for logs in logs_list:
+        # The slowest and largest process determines the resources
+        # needed by the job. Memory is logged in kB.
+        measured['memory'].append(max(d['total_memory'] for d in logs) / 1024.)
+        measured['time_network'].append(max(d['time_prepare'] + d['time_network_local'] +
+                                            d['time_network_global'] for d in logs))
+        measured['time_simulate'].append(max(d['time_simulate'] for d in logs))
+
+    features = [_features(counts) for counts in counts_list]
+    calibration = {}
+    for quantity, coefficients in default_calibration.items():
+        names = list(coefficients)
+        A = np.array([[f[quantity][name] for name in names] for f in features])
+        # Normalize the columns to improve the conditioning
+        norm = np.max(np.abs(A), axis=0)
+        norm[norm == 0.] = 1.
+        x, residual = nnls(A / norm, np.array(measured[quantity]))
+        calibration[quantity] = dict(zip(names, (x / norm).tolist()))
+    return calibration
+
+
+def calibrate(labels, rates=None):
+    """
+    Fit the coefficients of the linear models for memory and
+    wall-clock times to the log files of past simulations. The
+    simulated networks have to be available in config_files.
+
+    Parameters
+    ----------
+    labels : list
+        Labels of the simulations.
+    rates : float or numpy.ndarray, optional
+        Rates of all populations in spikes/s. See count_resources.
+
+    Returns
+    -------
+    calibration : dict
+        Fitted coefficients, which can be passed to
+        estimate_resources or stored in a json file.
+    """
+    from .multiarea_model import MultiAreaModel
+
+    counts_list = []
+    logs_list = []
+    for label in labels:
+        fn = os.path.join(data_path, label, '_'.join(('custom_params', label)))
+        with open(fn, 'r') as f:
+            d = json.load(f)
+        network = MultiAreaModel(d['network_label'])
+        logs = read_logfiles(label)
+        # Count the resources of the simulated time, which is shorter
+        # than t_sim for simulations stopped early
+        sim_spec = dict(d['sim_params'])
+        sim_spec['t_sim'] = simulated_time(logs, sim_spec.get('t_sim', sim_params['t_sim']))
+        counts_list.append(count_resources(network, sim_spec, rates=rates))
+        logs_list.append(logs)
+    return fit_calibration(counts_list, logs_list)
+
+
+def size_job(network, sim_spec=None, node_spec=None, calibration=None, rates=None):
+    """
+    Choose the number of nodes, MPI processes and threads and the
+    time limit of a job simulating the network. The job uses the
+    smallest number of nodes for which the estimated memory fits into
+    the memory of the nodes and the estimated wall-clock time does not
+    exceed the maximal time. For this number of nodes, the number of
+    MPI processes per node with the shortest estimated time is chosen.
+
+    Parameters
+    ----------
+    network : MultiAreaModel
+        Network to be simulated.
+    sim_spec : dict, optional
+        Custom simulation parameters overwriting the default
+        parameters defined in default_params.py. The values of
+        num_processes and local_num_threads are ignored. Defaults to
+        None.
+    node_spec : dict, optional
+        Specification of the compute nodes overwriting the entries of
+        node_spec in config.py and node_spec_defaults. Defaults to
+        None.
+    calibration : dict or str, optional
+        Coefficients of the linear models. See estimate_resources.
+    rates : float or numpy.ndarray, optional
+        Rates of all populations in spikes/s. See count_resources.
+
+    Returns
+    -------
+    job : dict
+        Number of nodes ('num_nodes'), MPI processes
+        ('num_processes'), processes per node ('processes_per_node')
+        and threads per process ('local_num_threads'), the time limit
+        in seconds ('time_limit'), the memory to request per node in MB
+        ('memory_per_node'), and the estimate of the resources as
+        returned by estimate_resources ('estimate').
+    """
+    spec = deepcopy(node_spec_defaults)
+    spec.update(default_node_spec)
+    if node_spec is not None:
+        spec.update(node_spec)
+    calibration = _load_calibration(calibration)
+    counts = count_resources(network, sim_spec, rates=rates)
+
+    cores = spec['cores']
+    for num_nodes in range(1, spec['max_nodes'] + 1):
+        job = None
+        for processes_per_node in [n for n in range(1, cores + 1) if cores % n == 0]:
+            estimate = _estimate(dict(counts,
+                                      num_processes=num_nodes * processes_per_node,
+                                      local_num_threads=cores // processes_per_node),
+                                 calibration)
+            memory_per_node = (spec['memory_margin'] * processes_per_node *
+                               estimate['memory_per_rank'])
+            time_limit = spec['time_margin'] * (estimate['time_network'] +
+                                                estimate['time_simulate'])
+            if memory_per_node > spec['memory']:
+                continue
+            if spec['max_time'] is not None and time_limit > spec['max_time']:
+                continue
+            if job is None or time_limit < job['time_limit']:
+                job = {'num_nodes': num_nodes,
+                       'num_processes': estimate['num_processes'],
+                       'processes_per_node': processes_per_node,
+                       'local_num_threads': estimate['local_num_threads'],
+                       'time_limit': time_limit,
+                       'memory_per_node': memory_per_node,
+                       'estimate': estimate}
+        if job is not None:
+            return job
+    raise ValueError("The simulation does not fit into {} nodes with the "
+                     "given memory and time limits.".format(spec['max_nodes']))
+
+
+def _load_calibration(calibration):
+    """
+    Return the coefficients of the linear models given as dictionary
+    or json file, or the default coefficients if calibration is None.
+    """
+    if calibration is None:
+        calibration = resource_calibration
+    if calibration is None:
+        calibration = default_calibration
+    elif isinstance(calibration, str):
+        with open(calibration, 'r') as f:
+            calibration = json.load(f)
+    return calibration
+
+
+def _estimate(counts, calibration):
+    """
+    Apply the linear models to the counts.
+    """
+    features = _features(counts)
+    estimate = dict(counts)
+    for quantity, coefficients in calibration.items():
+        estimate[quantity] = sum(coefficients[name] * features[quantity][name]
+                                 for name in coefficients)
+    estimate['memory_per_rank'] = estimate.pop('memory')
+    estimate['memory_total'] = estimate['memory_per_rank'] * counts['num_processes']
+    return estimate
+
+
+def _features(counts):
+    """
+    Return the quantities the coefficients of the linear models are
+    multiplied with. Neurons and synapses are distributed across the
+    MPI and virtual processes, devices are created on every thread.
+    """
+    num_processes = counts['num_processes']
+    num_vps = num_processes * counts['local_num_threads']
+    num_connections = counts['num_synapses'] + counts['num_device_connections']
+    return {'memory': {'base': 1.,
+                       'neuron': counts['num_neurons'] / num_processes,
+                       'synapse': num_connections / num_processes,
+                       'device': counts['num_devices'] * counts['local_num_threads']},
+            'time_network': {'base': 1.,
+                             'neuron': counts['num_neurons'] / num_vps,
+                             'synapse': num_connections / num_vps},
+            'time_simulate': {'base': 1.,
+                              'update': counts['num_neurons'] * counts['num_steps'] / num_vps,
+                              'event': counts['num_spike_events'] / num_vps}}
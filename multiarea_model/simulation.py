@@ -23,13 +23,16 @@ import pprint
 import shutil
 import time
 
-from .analysis_helpers import _load_npy_to_dict, model_iter
+from .analysis_helpers import _load_npy_to_dict, model_iter, spike_dtype
 from config import base_path, data_path
 from copy import deepcopy
+from .connection_helpers import concatenate_plans, connection_plan, plan_columns
+from .connection_helpers import delay_bounds, delay_report, write_connection_plan
 from .default_params import nested_update, sim_params
 from .default_params import check_custom_params
-from dicthash import dicthash
-from .multiarea_helpers import extract_area_dict, create_vector_mask
+from .multiarea_helpers import create_vector_mask, simulation_label
+from .resource_helpers import estimate_resources
+from .sub_model import SubModel
 try:
     from .sumatra_helpers import register_runtime
     sumatra_found = True
@@ -67,10 +70,10 @@ class Simulation:
                 self.custom_params = json.load(f)['sim_params']
 
         nested_update(self.params, self.custom_params)
+        self.delay_bounds = delay_bounds(self.params)
 
         self.network = network
-        self.label = dicthash.generate_hash_from_dict({'params': self.params,
-                                                       'network_label': self.network.label})
+        self.label = simulation_label(self.params, self.network.label)
 
         print("Simulation label: {}".format(self.label))
         self.data_dir = os.path.join(data_path, self.label)
@@ -110,6 +113,8 @@ class Simulation:
         """
         Copy all relevant files for the simulation to its data directory.
         """
+        # Make sure that the data files of the network have been written
+        self.network.persist()
         files = [os.path.join('multiarea_model',
                               'data_multiarea',
                               'Model.py'),
@@ -120,10 +125,12 @@ class Simulation:
                               'multiarea_model.py'),
                  os.path.join('multiarea_model',
                               'simulation.py'),
+                 os.path.join('multiarea_model',
+                              'sub_model.py'),
+                 os.path.join('multiarea_model',
+                              'connection_helpers.py'),
                  os.path.join('multiarea_model',
                               'default_params.py'),
-                 os.path.join('config_files',
-                              ''.join(('custom_Data_Model_', self.network.label, '.json'))),
                  os.path.join('config_files',
                               '_'.join((self.network.label, 'config')))]
         if self.network.params['connection_params']['replace_cc_input_source'] is not None:
@@ -139,6 +146,14 @@ class Simulation:
         for f in files:
             shutil.copy2(os.path.join(base_path, f),
                          self.data_dir)
+        # The data file is a directory in the 'npy' format
+        if os.path.isdir(self.network.data_fn):
+            target = os.path.join(self.data_dir, os.path.basename(self.network.data_fn))
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            shutil.copytree(self.network.data_fn, target)
+        else:
+            shutil.copy2(self.network.data_fn, self.data_dir)
 
     def prepare(self):
         """
@@ -157,6 +172,18 @@ class Simulation:
                               'grng_seed': master_seed,
                               'rng_seeds': list(range(master_seed + 1,
                                                       master_seed + vp + 1))})
+        if self.params['min_delay'] is not None:
+            nest.SetKernelStatus({'min_delay': self.params['min_delay'],
+                                  'max_delay': self.params['max_delay']})
+        # Connections of devices and external inputs use the default
+        # delay. It has to lie within the bounds and is raised to the
+        # delay floors, since the smallest delay of all connections
+        # limits the interval between spike exchanges.
+        delay = nest.GetDefaults('static_synapse', 'delay')
+        lower = min(self.delay_bounds['intra_area'], self.delay_bounds['inter_area'])
+        device_delay = min(max(delay, lower), self.delay_bounds['max'])
+        if device_delay != delay:
+            nest.SetDefaults('static_synapse', {'delay': float(device_delay)})
 
         nest.SetDefaults(self.network.params['neuron_params']['neuron_model'],
                          self.network.params['neuron_params']['single_neuron_dict'])
@@ -167,15 +194,38 @@ class Simulation:
         """
         Create devices for all populations. Depending on the
         configuration, this will create:
-        - spike detector
+        - spike detector, or one spike detector per recorded population
         - voltmeter
         """
-        self.spike_detector = nest.Create('spike_detector', 1)
-        status_dict = deepcopy(self.params['recording_dict']['spike_dict'])
-        label = '-'.join((self.label,
-                          status_dict['label']))
-        status_dict.update({'label': label})
-        nest.SetStatus(self.spike_detector, status_dict)
+        spike_recording = self.params['recording_dict']['spike_recording']
+        if spike_recording == 'network':
+            self.spike_detector = nest.Create('spike_detector', 1)
+            status_dict = deepcopy(self.params['recording_dict']['spike_dict'])
+            label = '-'.join((self.label,
+                              status_dict['label']))
+            status_dict.update({'label': label})
+            nest.SetStatus(self.spike_detector, status_dict)
+        elif spike_recording == 'population':
+            # The spikes are kept in memory and written to binary
+            # files by write_spikes
+            self.spike_detectors = {}
+            for area in self.areas_simulated:
+                if area not in self.areas_recorded:
+                    continue
+                self.spike_detectors[area] = {}
+                for pop in self.network.structure[area]:
+                    sd = nest.Create('spike_detector', 1)
+                    status_dict = deepcopy(self.params['recording_dict']['spike_dict'])
+                    label = '-'.join((self.label,
+                                      status_dict['label'],
+                                      area,
+                                      pop))
+                    status_dict.update({'label': label,
+                                        'record_to': ['memory']})
+                    nest.SetStatus(sd, status_dict)
+                    self.spike_detectors[area][pop] = sd
+        else:
+            raise KeyError("Please define a valid spike recording mode.")
 
         if self.params['recording_dict']['record_vm']:
             self.voltmeter = nest.Create('voltmeter')
@@ -189,19 +239,59 @@ class Simulation:
         """
         Create all areas with their populations and internal connections.
         """
+        # Only the simulated part of the network is needed from here on
+        self.submodel = SubModel(self.network, self.areas_simulated)
+        self.connection_plans = []
         self.areas = []
         for area_name in self.areas_simulated:
-            a = Area(self, self.network, area_name)
+            a = Area(self, self.submodel, area_name)
             self.areas.append(a)
             print("Memory after {0} : {1:.2f} MB".format(area_name, self.memory() / 1024.))
 
+    def initialize_membrane_potentials(self):
+        """
+        Draw the initial membrane potentials of all local neurons from
+        a normal distribution. For each thread, the values of all its
+        neurons are drawn in one call from the random number generator
+        of the virtual process of the thread, in the order of the
+        GIDs. Thus, every neuron receives the same value as if the
+        populations were initialized one after another.
+        """
+        neuron_params = self.network.params['neuron_params']
+        local_nodes = []
+        for t in np.arange(nest.GetKernelStatus('local_num_threads')):
+            nodes = np.array(nest.GetNodes(
+                [0], {
+                    'model': neuron_params['neuron_model'],
+                    'thread': t
+                }, local_only=True
+            )[0])
+            if len(nodes) > 0:
+                # vp is the same for all local nodes on the same thread
+                vp = nest.GetStatus([nodes[0]], 'vp')[0]
+                nest.SetStatus(list(nodes), 'V_m', self.pyrngs[vp].normal(
+                    neuron_params['V0_mean'],
+                    neuron_params['V0_sd'],
+                    len(nodes)))
+                local_nodes.append(nodes)
+        if len(local_nodes) > 0:
+            local_nodes = np.sort(np.concatenate(local_nodes))
+        for area in self.areas:
+            first = min(gids[0] for gids in area.gids.values())
+            last = max(gids[1] for gids in area.gids.values())
+            area.num_local_nodes = int(np.searchsorted(local_nodes, last, side='right') -
+                                       np.searchsorted(local_nodes, first, side='left'))
+            print("Rank {}: area {} has {} local nodes".format(nest.Rank(),
+                                                               area.name,
+                                                               area.num_local_nodes))
+
     def cortico_cortical_input(self):
         """
         Create connections between areas.
         """
         replace_cc = self.network.params['connection_params']['replace_cc']
-        replace_non_simulated_areas = self.network.params['connection_params'][
-            'replace_non_simulated_areas']
+        input_type = self.submodel.replacement_type
+        replaced = any(len(areas) > 0 for areas in self.submodel.replaced_areas.values())
         if self.network.params['connection_params']['replace_cc_input_source'] is None:
             replace_cc_input_source = None
         else:
@@ -209,75 +299,53 @@ class Simulation:
                                                    self.network.params['connection_params'][
                                                        'replace_cc_input_source'])
 
-        if not replace_cc and set(self.areas_simulated) != set(self.network.area_list):
-            if replace_non_simulated_areas == 'het_current_nonstat':
+        # The stationary Poisson inputs are aggregated by the
+        # sub-model, the input of the other types is created for each
+        # replaced source area
+        if replaced and self.submodel.replacement_input is None:
+            if input_type == 'het_current_nonstat':
                 fn_iter = model_iter(mode='single', areas=self.network.area_list)
-                non_simulated_cc_input = _load_npy_to_dict(replace_cc_input_source, fn_iter)
-            elif replace_non_simulated_areas == 'het_poisson_stat':
-                fn = self.network.params['connection_params']['replace_cc_input_source']
-                with open(fn, 'r') as f:
-                    non_simulated_cc_input = json.load(f)
-            elif replace_non_simulated_areas == 'hom_poisson_stat':
-                non_simulated_cc_input = {source_area_name:
-                                          {source_pop:
-                                           self.network.params['input_params']['rate_ext']
-                                           for source_pop in
-                                           self.network.structure[source_area_name]}
-                                          for source_area_name in self.network.area_list}
+                cc_input = _load_npy_to_dict(replace_cc_input_source, fn_iter)
             else:
                 raise KeyError("Please define a valid method to"
                                " replace non-simulated areas.")
 
-        if replace_cc == 'het_current_nonstat':
-            fn_iter = model_iter(mode='single', areas=self.network.area_list)
-            cc_input = _load_npy_to_dict(replace_cc_input_source, fn_iter)
-        elif replace_cc == 'het_poisson_stat':
-            with open(self.network.params['connection_params'][
-                    'replace_cc_input_source'], 'r') as f:
-                cc_input = json.load(f)
-        elif replace_cc == 'hom_poisson_stat':
-            cc_input = {source_area_name:
-                        {source_pop:
-                         self.network.params['input_params']['rate_ext']
-                         for source_pop in
-                         self.network.structure[source_area_name]}
-                        for source_area_name in self.network.area_list}
-
         # Connections between simulated areas are not replaced
         if not replace_cc:
-            for target_area in self.areas:
-                # Loop source area though complete list of areas
-                for source_area_name in self.network.area_list:
-                    if target_area.name != source_area_name:
-                        # If source_area is part of the simulated network,
-                        # connect it to target_area
-                        if source_area_name in self.areas:
-                            source_area = self.areas[self.areas.index(source_area_name)]
-                            connect(self,
-                                    target_area,
-                                    source_area)
-                        # Else, replace the input from source_area with the
-                        # chosen method
-                        else:
-                            target_area.create_additional_input(replace_non_simulated_areas,
-                                                                source_area_name,
-                                                                non_simulated_cc_input[
-                                                                    source_area_name])
-        # Connections between all simulated areas are replaced
-        else:
-            for target_area in self.areas:
-                for source_area in self.areas:
-                    if source_area != target_area:
-                        target_area.create_additional_input(replace_cc,
-                                                            source_area.name,
-                                                            cc_input[source_area.name])
+            gids = {area.name: area.gids for area in self.areas}
+            pairs = [(target_area_name, source_area_name)
+                     for target_area_name in self.submodel.area_list
+                     for source_area_name in self.submodel.area_list
+                     if target_area_name != source_area_name]
+            plan = connection_plan(self.submodel, gids, pairs, self.params)
+            execute_connection_plan(plan)
+            self.connection_plans.append(plan)
+
+        for target_area in self.areas:
+            # Replace the input from the replaced source areas with
+            # the chosen method
+            if self.submodel.replacement_input is not None:
+                target_area.create_aggregated_input(
+                    self.submodel.replacement_input[target_area.name])
+            else:
+                for source_area_name in self.submodel.replaced_areas[target_area.name]:
+                    target_area.create_additional_input(input_type,
+                                                        source_area_name,
+                                                        cc_input[source_area_name])
 
-    def simulate(self):
+    def simulate(self, callbacks=None):
         """
         Create the network and execute simulation.
         Record used memory and wallclock time.
+
+        Parameters
+        ----------
+        callbacks : list, optional
+            Functions called after each segment of the simulation,
+            see run. Defaults to None.
         """
         t0 = time.time()
+        self.time_start = t0
         self.base_memory = self.memory()
         self.prepare()
         t1 = time.time()
@@ -286,6 +354,7 @@ class Simulation:
 
         self.create_recording_devices()
         self.create_areas()
+        self.initialize_membrane_potentials()
         t2 = time.time()
         self.time_network_local = t2 - t1
         print("Created areas and internal connections in {0:.2f} seconds.".format(
@@ -299,14 +368,120 @@ class Simulation:
             self.time_network_global))
 
         self.save_network_gids()
+        self.save_connection_plan()
 
-        nest.Simulate(self.T)
+        self.run(callbacks)
         t4 = time.time()
         self.time_simulate = t4 - t3
         self.total_memory = self.memory()
         print("Simulated network in {0:.2f} seconds.".format(self.time_simulate))
         self.logging()
 
+    def run(self, callbacks=None):
+        """
+        Simulate the network for t_sim ms.
+
+        If t_segment is defined, the simulation is run in segments of
+        t_segment ms with nest.Prepare, nest.Run and nest.Cleanup.
+        After each segment, the wall-clock time and the real-time
+        factor of the segment are appended to self.segments and the
+        callbacks are called with the simulation instance and the
+        segment record as arguments, e.g. to flush data or to compute
+        statistics online. The simulation stops after the current
+        segment if a callback returns True or if the next segment
+        would exceed the time_budget. The simulated time is stored in
+        self.t_simulated.
+
+        Parameters
+        ----------
+        callbacks : list, optional
+            Functions with signature callback(simulation, segment).
+            Defaults to None.
+        """
+        if callbacks is None:
+            callbacks = []
+        t_segment = self.params['t_segment']
+        if t_segment is None:
+            t_segment = self.T
+        elif t_segment <= 0.:
+            raise ValueError("t_segment has to be positive.")
+        time_budget = self.params['time_budget']
+        # The time budget includes the network construction if
+        # called from simulate
+        time_start = getattr(self, 'time_start', time.time())
+
+        self.segments = []
+        self.t_simulated = 0.
+        if self.params['recording_dict']['spike_recording'] == 'population':
+            # Start with empty spike files
+            for area in self.spike_detectors:
+                for pop in self.spike_detectors[area]:
+                    open(self.spike_file(area, pop), 'wb').close()
+        nest.Prepare()
+        try:
+            while self.T - self.t_simulated > 0.5 * self.params['dt']:
+                duration = min(t_segment, self.T - self.t_simulated)
+                t0 = time.time()
+                nest.Run(duration)
+                t1 = time.time()
+                segment = {'segment': len(self.segments),
+                           't_start': self.t_simulated,
+                           't_stop': self.t_simulated + duration,
+                           'time': t1 - t0,
+                           'real_time_factor': (t1 - t0) / (duration * 1e-3)}
+                self.segments.append(segment)
+                self.t_simulated += duration
+                if self.params['recording_dict']['spike_recording'] == 'population':
+                    self.write_spikes()
+                print("Simulated {0:.1f} of {1:.1f} ms, real-time factor {2:.2f}.".format(
+                    self.t_simulated, self.T, segment['real_time_factor']))
+
+                stop = False
+                for callback in callbacks:
+                    stop = bool(callback(self, segment)) or stop
+                if time_budget is not None:
+                    # Extrapolate the wall-clock time of the next segment
+                    next_duration = min(t_segment, self.T - self.t_simulated)
+                    remaining = time_budget - (time.time() - time_start)
+                    if segment['time'] * next_duration / duration > remaining:
+                        stop = True
+                if stop and self.T - self.t_simulated > 0.5 * self.params['dt']:
+                    print("Stopped simulation after {0:.1f} ms.".format(self.t_simulated))
+                    break
+        finally:
+            nest.Cleanup()
+
+    def spike_file(self, area, pop):
+        """
+        Return the name of the binary file holding the spikes of the
+        given population recorded by this MPI process.
+        """
+        fp = '-'.join((self.label,
+                       self.params['recording_dict']['spike_dict']['label'],
+                       area,
+                       pop,
+                       str(nest.Rank())))
+        return os.path.join(self.data_dir, 'recordings', '.'.join((fp, 'dat')))
+
+    def write_spikes(self):
+        """
+        Append the spikes recorded by the spike detectors of the
+        populations since the last call to their binary files and
+        clear the detectors. Each spike is stored as the GID of the
+        sender (uint32) and the time step of the spike (uint32), see
+        analysis_helpers.spike_dtype. With t_segment, this limits the
+        memory needed to store the spikes to one segment.
+        """
+        for area in self.spike_detectors:
+            for pop, sd in self.spike_detectors[area].items():
+                events = nest.GetStatus(sd, 'events')[0]
+                spikes = np.empty(len(events['senders']), dtype=spike_dtype)
+                spikes['senders'] = events['senders']
+                spikes['steps'] = np.round(events['times'] / self.params['dt'])
+                with open(self.spike_file(area, pop), 'ab') as f:
+                    spikes.tofile(f)
+                nest.SetStatus(sd, {'n_events': 0})
+
     def memory(self):
         """
         Use NEST's memory wrapper function to record used memory.
@@ -320,6 +495,30 @@ class Simulation:
         else:
             return mem
 
+    def delay_report(self):
+        """
+        Report how much the bounds of the delays defined by
+        delay_floor, min_delay and max_delay shift the delay
+        distributions of the simulated connections. See
+        connection_helpers.delay_report.
+        """
+        submodel = SubModel(self.network, self.areas_simulated)
+        if self.network.params['connection_params']['replace_cc']:
+            pairs = [(area, area) for area in submodel.area_list]
+        else:
+            pairs = [(target_area, source_area) for target_area in submodel.area_list
+                     for source_area in submodel.area_list]
+        plan = connection_plan(submodel, None, pairs, self.params)
+        return delay_report(plan, self.params['dt'])
+
+    def estimate_resources(self, calibration=None, rates=None):
+        """
+        Estimate the resources needed by the simulation. See
+        resource_helpers.estimate_resources.
+        """
+        return estimate_resources(self.network, self.params,
+                                  calibration=calibration, rates=rates)
+
     def logging(self):
         """
         Write runtime and memory for the first 30 MPI processes
@@ -330,6 +529,10 @@ class Simulation:
                  'time_network_local': self.time_network_local,
                  'time_network_global': self.time_network_global,
                  'time_simulate': self.time_simulate,
+                 't_simulated': self.t_simulated,
+                 'segments': self.segments,
+                 'min_delay': nest.GetKernelStatus('min_delay'),
+                 'max_delay': nest.GetKernelStatus('max_delay'),
                  'base_memory': self.base_memory,
                  'network_memory': self.network_memory,
                  'total_memory': self.total_memory}
@@ -352,6 +555,21 @@ class Simulation:
                                                               g0=area.gids[pop][0],
                                                               g1=area.gids[pop][1]))
 
+    def save_connection_plan(self):
+        """
+        Write the plan of all connections between populations created
+        by the first 30 MPI processes, including the wall-clock time
+        needed for each projection, to file.
+        """
+        self.connection_plan = concatenate_plans(self.connection_plans)
+        if nest.Rank() < 30:
+            fn = os.path.join(self.data_dir,
+                              'recordings',
+                              '_'.join((self.label,
+                                        'connection_plan',
+                                        str(nest.Rank()))))
+            write_connection_plan(self.connection_plan, fn)
+
     def register_runtime(self):
         if sumatra_found:
             register_runtime(self.label)
@@ -373,9 +591,9 @@ class Area:
         simulation : simulation
            An instance of the simulation class that specifies the
            simulation that the area is part of.
-        network : multiarea_model
-            An instance of the multiarea_model class that specifies
-            the network the area is part of.
+        network : multiarea_model or SubModel
+            An instance of the multiarea_model class or a sub-model
+            that specifies the network the area is part of.
         name : str
             Name of the area.
         """
@@ -384,18 +602,9 @@ class Area:
         self.simulation = simulation
         self.network = network
         self.neuron_numbers = network.N[name]
-        self.synapses = extract_area_dict(network.synapses,
-                                          network.structure,
-                                          self.name,
-                                          self.name)
-        self.W = extract_area_dict(network.W,
-                                   network.structure,
-                                   self.name,
-                                   self.name)
-        self.W_sd = extract_area_dict(network.W_sd,
-                                      network.structure,
-                                      self.name,
-                                      self.name)
+        self.synapses = network.synapses.area_dict(self.name, self.name, network.structure)
+        self.W = network.W.area_dict(self.name, self.name, network.structure)
+        self.W_sd = network.W_sd.area_dict(self.name, self.name, network.structure)
         self.populations = network.structure[name]
 
         self.external_synapses = {}
@@ -405,9 +614,7 @@ class Area:
         self.create_populations()
         self.connect_devices()
         self.connect_populations()
-        print("Rank {}: created area {} with {} local nodes".format(nest.Rank(),
-                                                                    self.name,
-                                                                    self.num_local_nodes))
+        print("Rank {}: created area {}".format(nest.Rank(), self.name))
 
     def __str__(self):
         s = "Area {} with {} neurons.".format(
@@ -428,11 +635,11 @@ class Area:
         Create all populations of the area.
         """
         self.gids = {}
-        self.num_local_nodes = 0
         for pop in self.populations:
             gid = nest.Create(self.network.params['neuron_params']['neuron_model'],
                               int(self.neuron_numbers[pop]))
-            mask = create_vector_mask(self.network.structure, areas=[self.name], pops=[pop])
+            mask = create_vector_mask(self.network.structure, areas=[self.name], pops=[pop],
+                                      complete_area_list=self.network.area_list)
             I_e = self.network.add_DC_drive[mask][0]
             if not self.network.params['input_params']['poisson_input']:
                 K_ext = self.external_synapses[pop]
@@ -445,29 +652,8 @@ class Area:
 
             # Store first and last GID of each population
             self.gids[pop] = (gid[0], gid[-1])
-
-            # Initialize membrane potentials
-            # This could also be done after creating all areas, which
-            # might yield better performance. Has to be tested.
-            for t in np.arange(nest.GetKernelStatus('local_num_threads')):
-                local_nodes = np.array(nest.GetNodes(
-                    [0], {
-                        'model': self.network.params['neuron_params']['neuron_model'],
-                        'thread': t
-                    }, local_only=True
-                )[0])
-                local_nodes_pop = local_nodes[(np.logical_and(local_nodes >= gid[0],
-                                                              local_nodes <= gid[-1]))]
-                if len(local_nodes_pop) > 0:
-                    vp = nest.GetStatus([local_nodes_pop[0]], 'vp')[0]
-                    # vp is the same for all local nodes on the same thread
-                    nest.SetStatus(
-                        list(local_nodes_pop), 'V_m', self.simulation.pyrngs[vp].normal(
-                            self.network.params['neuron_params']['V0_mean'],
-                            self.network.params['neuron_params']['V0_sd'],
-                            len(local_nodes_pop))
-                            )
-                    self.num_local_nodes += len(local_nodes_pop)
+        # The membrane potentials are initialized after all areas
+        # have been created, see Simulation.initialize_membrane_potentials
 
     def connect_populations(self):
         """
@@ -482,8 +668,12 @@ class Area:
             for pop in self.populations:
                 # Always record spikes from all neurons to get correct
                 # statistics
+                if self.simulation.params['recording_dict']['spike_recording'] == 'population':
+                    spike_detector = self.simulation.spike_detectors[self.name][pop]
+                else:
+                    spike_detector = self.simulation.spike_detector
                 nest.Connect(tuple(range(self.gids[pop][0], self.gids[pop][1] + 1)),
-                             self.simulation.spike_detector)
+                             spike_detector)
 
         if self.simulation.params['recording_dict']['record_vm']:
             for pop in self.populations:
@@ -525,17 +715,13 @@ class Area:
             Dictionary of cortico-cortical input of the process
             replacing the source area.
         """
-        synapses = extract_area_dict(self.network.synapses,
-                                     self.network.structure,
-                                     self.name,
-                                     source_area_name)
-        W = extract_area_dict(self.network.W,
-                              self.network.structure,
-                              self.name,
-                              source_area_name)
+        synapses = self.network.synapses.area_dict(self.name, source_area_name,
+                                                   self.network.structure)
+        W = self.network.W.area_dict(self.name, source_area_name, self.network.structure)
         v = self.network.params['delay_params']['interarea_speed']
         s = self.network.distances[self.name][source_area_name]
-        delay = s / v
+        delay = min(max(s / v, self.simulation.delay_bounds['inter_area']),
+                    self.simulation.delay_bounds['max'])
         for pop in self.populations:
             for source_pop in self.network.structure[source_area_name]:
                 syn_spec = {'weight': W[pop][source_pop],
@@ -564,6 +750,33 @@ class Area:
                                  syn_spec=syn_spec)
 
 
+    def create_aggregated_input(self, replacement_input):
+        """
+        Replace the input from all replaced source areas by the
+        aggregated stationary Poisson input computed by SubModel.
+
+        Parameters
+        ----------
+        replacement_input : dict
+            Dictionary with the rates, weights and delays of the
+            aggregated Poisson processes for each population of the
+            area.
+        """
+        for pop in self.populations:
+            d = replacement_input[pop]
+            delays = np.clip(d['delay'], self.simulation.delay_bounds['inter_area'],
+                             self.simulation.delay_bounds['max'])
+            for rate, weight, delay in zip(d['rate'], d['weight'], delays):
+                pg = nest.Create('poisson_generator', 1)
+                nest.SetStatus(pg, {'rate': float(rate)})
+                syn_spec = {'weight': float(weight),
+                            'delay': float(delay)}
+                nest.Connect(pg,
+                             tuple(
+                                 range(self.gids[pop][0], self.gids[pop][1] + 1)),
+                             syn_spec=syn_spec)
+
+
 def connect(simulation,
             target_area,
             source_area):
@@ -579,50 +792,53 @@ def connect(simulation,
     source_area : Area instance
         Source area of the projection
     """
-    network = simulation.network
-    synapses = extract_area_dict(network.synapses,
-                                 network.structure,
-                                 target_area.name,
-                                 source_area.name)
-    W = extract_area_dict(network.W,
-                          network.structure,
-                          target_area.name,
-                          source_area.name)
-    W_sd = extract_area_dict(network.W_sd,
-                             network.structure,
-                             target_area.name,
-                             source_area.name)
-    for target in target_area.populations:
-        for source in source_area.populations:
-            conn_spec = {'rule': 'fixed_total_number',
-                         'N': int(synapses[target][source])}
-
-            syn_weight = {'distribution': 'normal_clipped',
-                          'mu': W[target][source],
-                          'sigma': W_sd[target][source]}
-            if target_area == source_area:
-                if 'E' in source:
-                    syn_weight.update({'low': 0.})
-                    mean_delay = network.params['delay_params']['delay_e']
-                elif 'I' in source:
-                    syn_weight.update({'high': 0.})
-                    mean_delay = network.params['delay_params']['delay_i']
-            else:
-                v = network.params['delay_params']['interarea_speed']
-                s = network.distances[target_area.name][source_area.name]
-                mean_delay = s / v
-
-            syn_delay = {'distribution': 'normal_clipped',
-                         'low': simulation.params['dt'],
-                         'mu': mean_delay,
-                         'sigma': mean_delay * network.params['delay_params']['delay_rel']}
-            syn_spec = {'weight': syn_weight,
-                        'delay': syn_delay,
-                        'model': 'static_synapse'}
-
-            nest.Connect(tuple(range(source_area.gids[source][0],
-                                     source_area.gids[source][1] + 1)),
-                         tuple(range(target_area.gids[target][0],
-                                     target_area.gids[target][1] + 1)),
-                         conn_spec,
-                         syn_spec)
+    gids = {target_area.name: target_area.gids,
+            source_area.name: source_area.gids}
+    plan = connection_plan(target_area.network, gids,
+                           [(target_area.name, source_area.name)],
+                           simulation.params)
+    execute_connection_plan(plan)
+    simulation.connection_plans.append(plan)
+
+
+def execute_connection_plan(plan):
+    """
+    Create the connections of a connection plan compiled by
+    connection_helpers.connection_plan. The wall-clock time needed to
+    create each projection is stored in plan['time'].
+
+    Parameters
+    ----------
+    plan : dict
+        Connection plan.
+    """
+    rows = zip(*[plan[column].tolist() for column in plan_columns[4:]])
+    times = np.zeros(len(plan['N']))
+    for k, (target_first, target_last, source_first, source_last, N,
+            weight_mean, weight_sd, weight_low, weight_high,
+            delay_mean, delay_sd, delay_low, delay_high) in enumerate(rows):
+        t0 = time.time()
+        conn_spec = {'rule': 'fixed_total_number',
+                     'N': N}
+        syn_weight = {'distribution': 'normal_clipped',
+                      'mu': weight_mean,
+                      'sigma': weight_sd}
+        if np.isfinite(weight_low):
+            syn_weight.update({'low': weight_low})
+        if np.isfinite(weight_high):
+            syn_weight.update({'high': weight_high})
+        syn_delay = {'distribution': 'normal_clipped',
+                     'low': delay_low,
+                     'mu': delay_mean,
+                     'sigma': delay_sd}
+        if np.isfinite(delay_high):
+            syn_delay.update({'high': delay_high})
+        syn_spec = {'weight': syn_weight,
+                    'delay': syn_delay,
+                    'model': 'static_synapse'}
+        nest.Connect(tuple(range(source_first, source_last + 1)),
+                     tuple(range(target_first, target_last + 1)),
+                     conn_spec,
+                     syn_spec)
+        times[k] = time.time() - t0
+    plan['time'] = times
@@ -1,5 +1,5 @@
 import numpy as np
-from .multiarea_helpers import create_mask, create_vector_mask
+from .multiarea_helpers import create_vector_mask, mask_indices
 from copy import deepcopy
 from .theory_helpers import d_nu_d_mu_fb_numeric, d_nu_d_sigma_fb_numeric
 import copy
@@ -44,7 +44,14 @@ def stabilize(theo, theo_prime, fixed_point, a='fac_nu_ext_5E_6E', b='indegree')
     """
     S_vector, S, T_vector, T, M = S_T(theo, fixed_point)
     delta_bar_nu_star = fixed_point_shift(a, theo, theo_prime, fixed_point)
-    delta_nu_star = np.dot(np.linalg.inv(np.identity(M.shape[0]) - M), delta_bar_nu_star)
+    if theo.params['backend'] == 'sparse':
+        from scipy import sparse
+        from scipy.sparse.linalg import spsolve
+
+        delta_nu_star = spsolve(sparse.identity(M.shape[0], format='csc') - M,
+                                delta_bar_nu_star)
+    else:
+        delta_nu_star = np.dot(np.linalg.inv(np.identity(M.shape[0]) - M), delta_bar_nu_star)
 
     """
     Next, determine the change of the parameter b that is
@@ -83,15 +90,9 @@ def stabilize(theo, theo_prime, fixed_point, a='fac_nu_ext_5E_6E', b='indegree')
     2. No cortico-cortical connections from population 4E
     3. Indegree have to be > 0 -> Negative entries are set to zero.
     """
-    index = np.zeros_like(delta_K, dtype=np.bool)
-    for area in theo.network.area_list:
-        for area2 in theo.network.area_list:
-            if area2 != area:
-                mask = create_mask(theo.network.structure,
-                                   target_areas=[area],
-                                   source_areas=[area2],
-                                   source_pops=['23I', '4E', '4I', '5I', '6I'])
-                index = np.logical_or(index, mask[:, :-1])
+    index = mask_indices(theo.network.structure,
+                         source_pops=['23I', '4E', '4I', '5I', '6I'],
+                         cortico_cortical=True, external=False)
     delta_K[index] = 0.
     K_prime = copy.copy(theo.network.K_matrix)
     K_prime[:, :-1] += np.real(delta_K)
@@ -102,18 +103,26 @@ def stabilize(theo, theo_prime, fixed_point, a='fac_nu_ext_5E_6E', b='indegree')
 def S_T(theo, fixed_point):
     mu, sigma = theo.mu_sigma(fixed_point)
     S_vector, T_vector = theo.d_nu(mu, sigma)
-    S = np.array([S_vector[i] * np.ones(theo.network.K_matrix.shape[0])
-                  for i in range(theo.network.K_matrix.shape[0])])
-    T = np.array([T_vector[i] * np.ones(theo.network.K_matrix.shape[0])
-                  for i in range(theo.network.K_matrix.shape[0])])
+    # Each row of S and T contains the slope of the target population.
+    # Use read-only broadcast views instead of dense copies.
+    shape = (S_vector.size, S_vector.size)
+    S = np.broadcast_to(S_vector[:, np.newaxis], shape)
+    T = np.broadcast_to(T_vector[:, np.newaxis], shape)
     # fac = (theo.NP['tau_syn'] /
     #        theo.network.params['neuron_params']['single_neuron_dict']['C_m']) * 1.e3
-    # import pdb; pdb.set_trace()
     fac = 1.
-    W = theo.network.K_matrix[:, :-1] * theo.network.J_matrix[:, :-1]
-    W2 = theo.network.K_matrix[:, :-1] * theo.network.J_matrix[:, :-1]**2
-    M = (S * W * fac * theo.NP['tau_m'] * 1.e-3 +
-         T * W2 * fac ** 2 * theo.NP['tau_m'] * 1.e-3)
+    if theo.params['backend'] == 'sparse':
+        from scipy import sparse
+
+        KJ, KJ2 = theo.sparse_weights()
+        M = (sparse.diags(S_vector * fac * theo.NP['tau_m'] * 1.e-3).dot(KJ[:, :-1]) +
+             sparse.diags(T_vector * fac ** 2 * theo.NP['tau_m'] * 1.e-3).dot(KJ2[:, :-1]))
+        M = M.tocsr()
+    else:
+        W = theo.network.K_matrix[:, :-1] * theo.network.J_matrix[:, :-1]
+        W2 = theo.network.K_matrix[:, :-1] * theo.network.J_matrix[:, :-1]**2
+        M = (S * W * fac * theo.NP['tau_m'] * 1.e-3 +
+             T * W2 * fac ** 2 * theo.NP['tau_m'] * 1.e-3)
     return S_vector, S, T_vector, T, M
 
 
@@ -158,6 +167,9 @@ def fixed_point_shift(a, theo, theo_prime, fixed_point):
 
 
 def eigen_decomp_M(M):
+    if not isinstance(M, np.ndarray):
+        # The eigenvectors are dense
+        M = M.toarray()
     eig = np.linalg.eig(M)
     evec_left = np.linalg.inv(eig[1])
     evec_right = eig[1]
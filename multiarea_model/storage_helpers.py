@@ -0,0 +1,278 @@
+"""
+storage_helpers
+==============
+
+Helper functions to store the output of the data scripts
+(data_multiarea/Model.py) of a network instance in config_files.
+
+Two formats are supported:
+
+- 'json' : A single json file custom_Data_Model_<label>.json
+  containing nested dictionaries.
+
+- 'npy' : A directory custom_Data_Model_<label> containing one .npy
+  file for each connectivity table (synapse numbers, synaptic
+  weights) with shape (target area, target population, source area,
+  source population) and, if present, one for the corresponding
+  external input, together with a small json header holding all
+  other data. The arrays can be loaded as memory maps, so that
+  loading is fast and several processes on the same node share the
+  memory.
+
+Functions
+---------
+
+data_file_name : Return the name of the data file of a network instance
+save_data : Store the data of a network in the given format
+load_data : Load the data of a network from a file in any of the formats
+convert_data_file : Convert the data file of a network to another format
+migrate_labels : Relabel networks and simulations stored by earlier versions
+"""
+
+import glob
+import json
+import numpy as np
+import os
+import shutil
+
+from config import base_path, data_path
+from copy import deepcopy
+from .connectivity_tensor import ConnectivityTensor, as_tensor
+from .default_params import nested_update, sim_params
+from .multiarea_helpers import simulation_label, write_json
+
+data_formats = ['json', 'npy']
+
+# Connectivity tables stored as arrays in the 'npy' format
+tensor_fields = ['synapses_orig', 'synapses', 'realistic_synapses',
+                 'synapse_weights_mean', 'synapse_weights_sd']
+
+header_fn = 'header.json'
+
+
+def data_file_name(label, data_format=None):
+    """
+    Return the name of the data file of the network instance with
+    the given label in config_files.
+
+    Parameters
+    ----------
+    label : str
+        Label of the network.
+    data_format : str, optional
+        Format of the data file, 'json' or 'npy'. If None, return the
+        existing file, preferring the 'npy' format if the data are
+        stored in both formats. Defaults to None.
+    """
+    fn = os.path.join(base_path, 'config_files', 'custom_Data_Model_{}'.format(label))
+    if data_format is None:
+        if os.path.isdir(fn):
+            data_format = 'npy'
+        else:
+            data_format = 'json'
+    if data_format == 'json':
+        return fn + '.json'
+    elif data_format == 'npy':
+        return fn
+    else:
+        raise ValueError("Unknown data format {}. "
+                         "Choose one of {}.".format(data_format, data_formats))
+
+
+def save_data(dat, fn, data_format='json'):
+    """
+    Store the data of a network. In both formats, the data are
+    written to a temporary file (or directory) which is then renamed.
+
+    Parameters
+    ----------
+    dat : dict
+        Data of the network as returned by
+        data_multiarea.Model.compute_Model_data or load_data.
+    fn : str
+        Name of the file (json) or directory (npy) to be written.
+    data_format : str, optional
+        Format of the data file, 'json' or 'npy'. Defaults to 'json'.
+    """
+    if data_format == 'json':
+        write_json({key: _to_dict(val) for key, val in dat.items()}, fn)
+    elif data_format == 'npy':
+        tmp_fn = '{}.tmp_{}'.format(fn, os.getpid())
+        os.makedirs(tmp_fn)
+        try:
+            header = {key: val for key, val in dat.items() if key not in tensor_fields}
+            header['tensors'] = {}
+            for key in tensor_fields:
+                if key not in dat:
+                    continue
+                T = as_tensor(dat[key])
+                np.save(os.path.join(tmp_fn, '{}.npy'.format(key)), T.values)
+                if T.external is not None:
+                    np.save(os.path.join(tmp_fn, '{}_external.npy'.format(key)), T.external)
+                header['tensors'][key] = {'area_list': T.area_list,
+                                          'pop_list': T.pop_list,
+                                          'external': T.external is not None}
+            with open(os.path.join(tmp_fn, header_fn), 'w') as f:
+                json.dump(header, f)
+            if os.path.isdir(fn):
+                shutil.rmtree(fn)
+            os.rename(tmp_fn, fn)
+        except BaseException:
+            shutil.rmtree(tmp_fn, ignore_errors=True)
+            raise
+    else:
+        raise ValueError("Unknown data format {}. "
+                         "Choose one of {}.".format(data_format, data_formats))
+
+
+def load_data(fn, mmap_mode='r', header_only=False):
+    """
+    Load the data of a network. The format is determined from the
+    file name. Connectivity tables are returned as nested
+    dictionaries for the 'json' format and as ConnectivityTensor
+    instances for the 'npy' format.
+
+    Parameters
+    ----------
+    fn : str
+        Name of the json file or npy directory.
+    mmap_mode : str, optional
+        Memory-map mode used to load arrays of the 'npy' format, see
+        numpy.load. Defaults to 'r'.
+    header_only : bool, optional
+        If True, do not load the connectivity tables of the 'npy'
+        format. Has no effect for the 'json' format. Defaults to False.
+    """
+    if not os.path.isdir(fn):
+        with open(fn, 'r') as f:
+            return json.load(f)
+    with open(os.path.join(fn, header_fn), 'r') as f:
+        dat = json.load(f)
+    tensors = dat.pop('tensors')
+    if not header_only:
+        for key, spec in tensors.items():
+            values = np.load(os.path.join(fn, '{}.npy'.format(key)), mmap_mode=mmap_mode)
+            if spec['external']:
+                external = np.load(os.path.join(fn, '{}_external.npy'.format(key)),
+                                   mmap_mode=mmap_mode)
+            else:
+                external = None
+            dat[key] = ConnectivityTensor(values, external=external,
+                                          area_list=spec['area_list'],
+                                          pop_list=spec['pop_list'])
+    return dat
+
+
+def convert_data_file(label, data_format):
+    """
+    Convert the data file of the network instance with the given
+    label to another format. The original file is kept.
+
+    Parameters
+    ----------
+    label : str
+        Label of the network.
+    data_format : str
+        Format to convert the data file to, 'json' or 'npy'.
+
+    Returns
+    -------
+    fn : str
+        Name of the converted file.
+    """
+    dat = load_data(data_file_name(label), mmap_mode=None)
+    fn = data_file_name(label, data_format)
+    save_data(dat, fn, data_format)
+    return fn
+
+
+def migrate_labels(labels=None):
+    """
+    Relabel networks stored in config_files whose labels differ from
+    the labels computed by the current version, e.g. networks stored
+    by versions computing the labels with dicthash, and the
+    simulations of these networks stored in data_path. The files and
+    directories are renamed and the network label in the parameter
+    files of the simulations is updated. Files are not renamed if a
+    file with the new name exists.
+
+    Parameters
+    ----------
+    labels : list, optional
+        Labels of the networks to relabel. Defaults to all networks
+        in config_files.
+
+    Returns
+    -------
+    networks : dict
+        New labels of the relabeled networks indexed by their old
+        labels.
+    simulations : dict
+        New labels of the relabeled simulations indexed by their old
+        labels.
+    """
+    from .multiarea_model import MultiAreaModel
+
+    config_dir = os.path.join(base_path, 'config_files')
+    if labels is None:
+        labels = [fn[:-len('_config')] for fn in sorted(os.listdir(config_dir))
+                  if fn.endswith('_config')]
+    networks = {}
+    for label in labels:
+        # The label is not verified in lazy mode
+        new_label = MultiAreaModel(label, lazy=True).compute_label()
+        if new_label == label:
+            continue
+        networks[label] = new_label
+        _move(os.path.join(config_dir, '{}_config'.format(label)),
+              os.path.join(config_dir, '{}_config'.format(new_label)))
+        for data_format in data_formats:
+            _move(data_file_name(label, data_format), data_file_name(new_label, data_format))
+
+    simulations = {}
+    if data_path is None or not os.path.isdir(data_path):
+        return networks, simulations
+    for label in sorted(os.listdir(data_path)):
+        sim_dir = os.path.join(data_path, label)
+        fn = os.path.join(sim_dir, '_'.join(('custom_params', label)))
+        if not os.path.isfile(fn):
+            continue
+        with open(fn, 'r') as f:
+            network_label = json.load(f)['network_label']
+        if network_label not in networks:
+            continue
+        # Parameter file of the simulation and its copies for the MPI
+        # processes
+        for fn in glob.glob(os.path.join(sim_dir, '_'.join(('custom_params', label, '*')))) + [fn]:
+            with open(fn, 'r') as f:
+                d = json.load(f)
+            d['network_label'] = networks[network_label]
+            write_json(d, fn)
+        params = deepcopy(sim_params)
+        nested_update(params, d['sim_params'])
+        new_label = simulation_label(params, networks[network_label])
+        simulations[label] = new_label
+        # Recordings, log files and the copy of the network parameters
+        # are named after the labels
+        for root, dirs, files in os.walk(sim_dir, topdown=False):
+            for name in files + dirs:
+                new_name = name.replace(label, new_label).replace(network_label,
+                                                                  networks[network_label])
+                _move(os.path.join(root, name), os.path.join(root, new_name))
+        _move(sim_dir, os.path.join(data_path, new_label))
+    return networks, simulations
+
+
+def _move(fn, new_fn):
+    if fn == new_fn or not os.path.exists(fn):
+        return
+    if os.path.exists(new_fn):
+        print("Not renaming {} because {} exists.".format(fn, new_fn))
+        return
+    os.rename(fn, new_fn)
+
+
+def _to_dict(x):
+    if isinstance(x, ConnectivityTensor):
+        return x.to_dict()
+    return x
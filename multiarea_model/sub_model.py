@@ -0,0 +1,140 @@
+"""
+sub_model
+==============
+
+Reduced view of an instance of the multi-area model restricted to a
+subset of its areas, as simulated if `areas_simulated` does not
+contain all areas.
+
+Classes
+-------
+SubModel : Provides the population sizes and the connectivity between
+the areas of the subset with the same interface as MultiAreaModel, and
+the input replacing the connections from the remaining areas
+(`replace_non_simulated_areas`) or between the areas of the subset
+(`replace_cc`).
+
+"""
+import json
+import numpy as np
+
+from .multiarea_helpers import create_vector_mask
+
+
+class SubModel:
+    def __init__(self, network, areas):
+        """
+        Sub-model class.
+        A view of a multi-area model that only contains the given
+        areas.
+
+        If the replaced connections are replaced by stationary Poisson
+        input ('hom_poisson_stat' or 'het_poisson_stat'), the input to
+        each target population is aggregated: the Poisson processes of
+        all replaced source populations with the same synaptic weight
+        are merged into one process with the summed rate, delayed by
+        the rate-weighted mean of their delays. The aggregated input
+        has the same statistics as the separate processes except for
+        the onset of the input at the beginning of the simulation.
+
+        Parameters
+        ----------
+        network : MultiAreaModel
+            Network to take the subset from.
+        areas : list
+            Areas of the sub-model.
+        """
+        self.network = network
+        self.label = network.label
+        self.params = network.params
+        # Keep the order of areas in the network
+        self.area_list = [area for area in network.area_list if area in areas]
+        self.structure = {area: network.structure[area] for area in self.area_list}
+        self.structure_vec = ['-'.join((area, pop)) for area in
+                              self.area_list for pop in self.structure[area]]
+        self.distances = network.distances
+
+        self.mask = create_vector_mask(network.structure, areas=self.area_list,
+                                       complete_area_list=network.area_list)
+        self.N = {area: network.N[area] for area in self.area_list}
+        self.N_vec = network.N_vec[self.mask]
+        self.add_DC_drive = network.add_DC_drive[self.mask]
+        self.synapses = network.synapses.subset(self.area_list)
+        self.K = network.K.subset(self.area_list)
+        self.W = network.W.subset(self.area_list)
+        self.W_sd = network.W_sd.subset(self.area_list)
+        self.syn_matrix = self.synapses.to_matrix(self.structure)
+        self.K_matrix = self.K.to_matrix(self.structure)
+        self.W_matrix = self.W.to_matrix(self.structure)
+
+        conn_params = self.params['connection_params']
+        if conn_params['replace_cc']:
+            self.replacement_type = conn_params['replace_cc']
+            self.replaced_areas = {target_area: [area for area in self.area_list
+                                                 if area != target_area]
+                                   for target_area in self.area_list}
+        else:
+            self.replacement_type = conn_params['replace_non_simulated_areas']
+            non_simulated = [area for area in network.area_list if area not in areas]
+            self.replaced_areas = {target_area: non_simulated
+                                   for target_area in self.area_list}
+        if self.replacement_type in ['hom_poisson_stat', 'het_poisson_stat']:
+            self.replacement_input = self.aggregate_replacement_input()
+        else:
+            self.replacement_input = None
+
+    def __str__(self):
+        s = "Sub-model of network {} with areas {}".format(self.label, self.area_list)
+        return s
+
+    def aggregate_replacement_input(self):
+        """
+        Compute the aggregated Poisson input replacing the connections
+        from the replaced source areas to each population of the
+        sub-model.
+
+        Returns
+        -------
+        replacement_input : dict
+            Dictionary with levels target area --> target population
+            containing arrays of the rates ('rate'), synaptic weights
+            ('weight') and delays ('delay') of the aggregated Poisson
+            processes, one entry per distinct weight.
+        """
+        network = self.network
+        area_of_pop = np.array([area for area in network.area_list
+                                for pop in network.structure[area]])
+        index = {name: i for i, name in enumerate(network.structure_vec)}
+        if self.replacement_type == 'het_poisson_stat':
+            with open(self.params['connection_params']['replace_cc_input_source'], 'r') as f:
+                cc_input = json.load(f)
+            # Only the rates of replaced areas have to be defined
+            rates = np.zeros(network.N_vec.size)
+            for area in set().union(*self.replaced_areas.values()):
+                for pop in network.structure[area]:
+                    rates[index['-'.join((area, pop))]] = cc_input[area][pop]
+        else:
+            rates = np.full(network.N_vec.size, self.params['input_params']['rate_ext'])
+        v = self.params['delay_params']['interarea_speed']
+
+        replacement_input = {}
+        for target_area in self.area_list:
+            replacement_input[target_area] = {}
+            sources = np.isin(area_of_pop, self.replaced_areas[target_area])
+            delays = np.array([network.distances[target_area][source_area] / v
+                               for source_area in area_of_pop[sources]])
+            for pop in self.structure[target_area]:
+                i = index['-'.join((target_area, pop))]
+                K = network.syn_matrix[i, :-1][sources] / network.N_vec[i]
+                rate = K * rates[sources]
+                weight = network.W_matrix[i, :-1][sources]
+                nonzero = rate > 0.
+                weights, inverse = np.unique(weight[nonzero], return_inverse=True)
+                total_rate = np.bincount(inverse, weights=rate[nonzero],
+                                         minlength=weights.size)
+                mean_delay = np.bincount(inverse, weights=rate[nonzero] * delays[nonzero],
+                                         minlength=weights.size) / total_rate
+                replacement_input[target_area][pop] = {'rate': total_rate,
+                                                       'weight': weights,
+                                                       'delay': mean_delay}
+        return replacement_input
@@ -18,14 +18,13 @@ provedure.
 
 import json
 import pprint
-import nest
 import numpy as np
 
 from copy import copy
 from .default_params import nested_update, theory_params
 from .default_params import check_custom_params
-from dicthash import dicthash
-from .multiarea_helpers import create_mask, create_vector_mask, dict_to_vector
+from .multiarea_helpers import area_slice, create_mask, dict_to_vector, generate_label
+from .multiarea_helpers import mask_indices
 from .theory_helpers import d_nu_d_mu_fb_numeric, d_nu_d_sigma_fb_numeric
 
 
@@ -45,8 +44,15 @@ class Theory:
                    'tau_syn': self.params['neuron_params']['single_neuron_dict']['tau_syn_ex'],
                    't_ref': self.params['neuron_params']['single_neuron_dict']['t_ref'],
                    'tau': 1.}
-        self.label = dicthash.generate_hash_from_dict({'params': self.params,
-                                                       'network_label': self.network.label})
+        backends = ['dense', 'sparse']
+        if self.params['backend'] not in backends:
+            raise ValueError("Unknown backend {}. "
+                             "Choose one of {}.".format(self.params['backend'], backends))
+        self._sparse_weights = None
+        # The backend does not change the results
+        self.label = generate_label({'params': self.params,
+                                     'network_label': self.network.label},
+                                    blacklist=[('params', 'backend')])
 
     def __eq__(self, other):
         return self.label == other.label
@@ -65,6 +71,7 @@ class Theory:
         Integrate siegert formula to obtain stationary rates. See Eq. (3)
         and following in Schuecker, Schmidt et al. (2017).
         """
+        import nest
         dt = self.params['dt']
         T = self.params['T']
         rate_ext = self.network.params['input_params']['rate_ext']
@@ -107,8 +114,7 @@ class Theory:
         if (self.network.params['connection_params']['replace_cc'] in
                 ['hom_poisson_stat', 'het_poisson_stat']):
             mu_CC, sigma2_CC = self.replace_cc_input()
-            mask = create_mask(self.network.structure, cortico_cortical=True, external=False)
-            K[mask] = 0.
+            K[mask_indices(self.network.structure, cortico_cortical=True, external=False)] = 0.
             # Additional external drive
             # The actual rate is included in the connection
             add_drive = nest.Create('siegert_neuron', 1, params={'rate': 1., 'mean': 1.})
@@ -203,21 +209,14 @@ class Theory:
         elif self.network.params['connection_params']['replace_cc'] == 'hom_poisson_stat':
             self.cc_input_rates = (np.ones(self.network.K_matrix.shape[0]) *
                                    self.network.params['input_params']['rate_ext'])
+        dim = self.network.K_matrix.shape[0]
         for area in self.network.area_list:
-            area_dim = len(self.network.structure[area])
-            mask = create_mask(self.network.structure,
-                               cortico_cortical=True, target_areas=[area],
-                               external=False)
-
-            input_areas = list(set(self.network.structure.keys()).difference({area}))
-            rate_mask = create_vector_mask(self.network.structure,
-                                           areas=input_areas)
-            rate_vector = self.cc_input_rates[rate_mask]
-            N_input_pops = self.network.K_matrix.shape[1] - 1 - area_dim
-            K_CC = self.network.K_matrix[mask].reshape((area_dim,
-                                                        N_input_pops))
-            J_CC = self.network.J_matrix[mask].reshape((area_dim,
-                                                        N_input_pops))
+            rows = area_slice(self.network.structure, area)
+            # Populations of all other areas
+            cols = np.r_[0:rows.start, rows.stop:dim]
+            rate_vector = self.cc_input_rates[cols]
+            K_CC = self.network.K_matrix[rows][:, cols]
+            J_CC = self.network.J_matrix[rows][:, cols]
             mu_CC = np.append(mu_CC, np.dot(K_CC * J_CC, rate_vector))
             sigma2_CC = np.append(sigma2_CC, np.dot(K_CC * J_CC**2, rate_vector))
         tau = self.NP['tau_m'] * 1e-3
@@ -271,25 +270,46 @@ class Theory:
             Filter to filter for a subset of the network. Defaults to
             None.
         """
-        if matrix_filter is not None:
-            K = copy(self.network.K_matrix)
-            J = copy(self.network.J_matrix)
-            K[np.logical_not(matrix_filter)] = 0.
-            J[np.logical_not(matrix_filter)] = 0.
-        else:
-            K = self.network.K_matrix
-            J = self.network.J_matrix
         if (self.network.params['connection_params']['replace_cc'] in
                 ['hom_poisson_stat', 'het_poisson_stat']):
             mu_CC, sigma2_CC = self.replace_cc_input()
-            mask = create_mask(self.network.structure, cortico_cortical=True, external=False)
-            K[mask] = 0.
+            replace_cc = True
         else:
             mu_CC = np.zeros_like(rates)
             sigma2_CC = np.zeros_like(rates)
-        KJ = K * J
-        J2 = J * J
-        KJ2 = K * J2
+            replace_cc = False
+        if self.params['backend'] == 'sparse':
+            KJ, KJ2 = self.sparse_weights()
+            # Entries outside of the filter or of replaced
+            # cortico-cortical connections are removed from the
+            # sparsity pattern
+            keep = None
+            if matrix_filter is not None:
+                keep = np.asarray(matrix_filter, dtype=bool)
+            if replace_cc:
+                cc_mask = create_mask(self.network.structure, cortico_cortical=True,
+                                      external=False)
+                keep = np.logical_not(cc_mask) if keep is None else keep & ~cc_mask
+            if keep is not None:
+                KJ = KJ.multiply(keep).tocsr()
+                KJ2 = KJ2.multiply(keep).tocsr()
+        else:
+            if matrix_filter is not None:
+                K = copy(self.network.K_matrix)
+                J = copy(self.network.J_matrix)
+                K[np.logical_not(matrix_filter)] = 0.
+                J[np.logical_not(matrix_filter)] = 0.
+            else:
+                K = self.network.K_matrix
+                J = self.network.J_matrix
+            if replace_cc:
+                # Copy to not modify the connectivity of the network
+                K = copy(K)
+                K[mask_indices(self.network.structure, cortico_cortical=True,
+                               external=False)] = 0.
+            KJ = K * J
+            J2 = J * J
+            KJ2 = K * J2
         if external:
             rates = np.hstack((rates, self.network.params['input_params']['rate_ext']))
         else:
@@ -298,12 +318,28 @@ class Theory:
         #     # due to distributed weights with std = 0.1
         #     J2[:, :7] += 0.01 * J[:, :7] * J[:, :7]
         C_m = self.network.params['neuron_params']['single_neuron_dict']['C_m']
-        mu = self.NP['tau_m'] * 1e-3 * np.dot(KJ, rates) + mu_CC + self.NP[
+        mu = self.NP['tau_m'] * 1e-3 * KJ.dot(rates) + mu_CC + self.NP[
             'tau_m'] / C_m * self.network.add_DC_drive
-        sigma2 = self.NP['tau_m'] * 1e-3 * np.dot(KJ2, rates) + sigma2_CC
+        sigma2 = self.NP['tau_m'] * 1e-3 * KJ2.dot(rates) + sigma2_CC
         sigma = np.sqrt(sigma2)
         return mu, sigma
 
+    def sparse_weights(self):
+        """
+        Return the products of indegrees and synaptic weights, K * J
+        and K * J**2, as CSR matrices holding only the existing
+        connections. The last column contains the external input. The
+        matrices are computed once and reused.
+        """
+        if self._sparse_weights is None:
+            from scipy import sparse
+
+            K = sparse.csr_matrix(self.network.K_matrix)
+            J = self.network.J_matrix
+            self._sparse_weights = (sparse.csr_matrix(K.multiply(J)),
+                                    sparse.csr_matrix(K.multiply(J**2)))
+        return self._sparse_weights
+
     def d_nu(self, mu, sigma):
         """
         Compute the derivative of the Siegert function by mu and sigma
@@ -351,25 +387,35 @@ class Theory:
         full_output : bool
             Whether to return only the matrix itself or all variables
             contributing. Defaults to False.
+
+        Returns
+        -------
+        G : numpy.ndarray or scipy.sparse.csr_matrix
+            Stability matrix, a CSR matrix for the sparse backend.
         """
         if np.any(matrix_filter is not None):
             assert(np.any(vector_filter is not None))
             assert(self.network.N_vec[vector_filter].size *
                    (self.network.N_vec[vector_filter].size + 1) ==
                    self.network.K_matrix[matrix_filter].size)
-            N = self.network.N_vec[vector_filter]
-            K = (self.network.K_matrix[matrix_filter].reshape((N.size, N.size + 1)))[:, :-1]
-            J = (self.network.J_matrix[matrix_filter].reshape((N.size, N.size + 1)))[:, :-1]
+        if self.params['backend'] == 'sparse':
+            KJ, KJ2 = self.sparse_weights()
+            if np.any(matrix_filter is not None):
+                rows = np.nonzero(np.any(matrix_filter, axis=1))[0]
+                cols = np.nonzero(np.any(matrix_filter[:, :-1], axis=0))[0]
+                KJ = KJ[rows][:, cols]
+                KJ2 = KJ2[rows][:, cols]
+            else:
+                KJ = KJ[:, :-1]
+                KJ2 = KJ2[:, :-1]
         else:
-            N = self.network.N_vec
-            K = self.network.K_matrix[:, :-1]
-            J = self.network.J_matrix[:, :-1]
-
-        N_pre = np.zeros_like(K)
-        N_post = np.zeros_like(K)
-        for i in range(N.size):
-            N_pre[i] = N
-            N_post[:, i] = N
+            if np.any(matrix_filter is not None):
+                N = self.network.N_vec[vector_filter]
+                K = (self.network.K_matrix[matrix_filter].reshape((N.size, N.size + 1)))[:, :-1]
+                J = (self.network.J_matrix[matrix_filter].reshape((N.size, N.size + 1)))[:, :-1]
+            else:
+                K = self.network.K_matrix[:, :-1]
+                J = self.network.J_matrix[:, :-1]
 
         # Connection probabilities between populations
         mu, sigma = self.mu_sigma(rates)
@@ -380,13 +426,18 @@ class Theory:
 
         d_nu_d_mu, d_nu_d_sigma = self.d_nu(mu, sigma)
 
-        slope_mu_matrix = np.zeros_like(J)
-        slope_sigma_matrix = np.zeros_like(J)
-        for i in range(N.size):
-            slope_mu_matrix[:, i] = d_nu_d_mu
-            slope_sigma_matrix[:, i] = d_nu_d_sigma
-        G = self.NP['tau_m'] * 1e-3 * (slope_mu_matrix * K * J +
-                                       slope_sigma_matrix * K * J**2)
+        if self.params['backend'] == 'sparse':
+            from scipy import sparse
+
+            G = self.NP['tau_m'] * 1e-3 * (sparse.diags(d_nu_d_mu).dot(KJ) +
+                                           sparse.diags(d_nu_d_sigma).dot(KJ2))
+            G = G.tocsr()
+        else:
+            # The slopes scale the rows of the connectivity
+            slope_mu_matrix = d_nu_d_mu[:, np.newaxis]
+            slope_sigma_matrix = d_nu_d_sigma[:, np.newaxis]
+            G = self.NP['tau_m'] * 1e-3 * (slope_mu_matrix * K * J +
+                                           slope_sigma_matrix * K * J**2)
         if full_output:
             return G, d_nu_d_mu, d_nu_d_sigma
         else:
@@ -420,6 +471,8 @@ class Theory:
             G = self.gain_matrix(rates, matrix_filter=matrix_filter,
                                  vector_filter=vector_filter,
                                  full_output=full_output)
+        if self.params['backend'] == 'sparse':
+            G = G.toarray()
         EV = np.linalg.eig(G)
         lambda_max = np.sqrt(np.max(np.real(EV[0])))
         if full_output:
@@ -22,7 +22,6 @@ Moritz Helias
 import numpy as np
 import scipy
 import scipy.integrate
-import scipy.stats
 import scipy.special
 
 
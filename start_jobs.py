@@ -1,4 +1,5 @@
 import json
+import numpy as np
 import os
 import shutil
 
@@ -11,7 +12,8 @@ except ImportError:
     sumatra_found = False
 
 
-def start_job(label, submit_cmd, jobscript_template, sumatra=False, reason=None, tag=None):
+def start_job(label, submit_cmd, jobscript_template, sumatra=False, reason=None, tag=None,
+              job=None):
     """
     Start job on a compute cluster.
 
@@ -37,6 +39,22 @@ def start_job(label, submit_cmd, jobscript_template, sumatra=False, reason=None,
                 Number of OpenMP threads per MPI process, defined in sim_params
             base_path : str
                 Base path of the library defined in config.py
+        If job is given, it can additionally include:
+            num_nodes : int
+                Number of compute nodes
+            processes_per_node : int
+                Number of MPI processes per node
+            memory_per_node : int
+                Memory to request per node in MB
+            time_limit : str
+                Time limit of the job in the format HH:MM:SS
+    job : dict, optional
+        Job sized with resource_helpers.size_job. Since num_processes
+        and local_num_threads enter the label of the simulation, the
+        job has to be sized before the simulation is created, with
+        num_processes and local_num_threads of the simulation
+        parameters set to the values chosen by size_job. Defaults to
+        None.
     """
 
     # Copy run_simulation script to simulation folder
@@ -51,6 +69,12 @@ def start_job(label, submit_cmd, jobscript_template, sumatra=False, reason=None,
     with open(fn, 'r') as f:
         custom_params = json.load(f)
     nested_update(sim_params, custom_params['sim_params'])
+    if job is not None:
+        for key in ['num_processes', 'local_num_threads']:
+            if sim_params[key] != job[key]:
+                raise ValueError("The simulation uses {} = {}, but the job was sized for {}. "
+                                 "Size the job before creating the simulation.".format(
+                                     key, sim_params[key], job[key]))
 
     # Copy custom param file for each MPI process
     for i in range(sim_params['num_processes']):
@@ -65,6 +89,12 @@ def start_job(label, submit_cmd, jobscript_template, sumatra=False, reason=None,
          'local_num_threads': sim_params['local_num_threads'],
          'num_processes': sim_params['num_processes'],
          'num_vp': num_vp}
+    if job is not None:
+        minutes = int(np.ceil(job['time_limit'] / 60.))
+        d.update({'num_nodes': job['num_nodes'],
+                  'processes_per_node': job['processes_per_node'],
+                  'memory_per_node': int(np.ceil(job['memory_per_node'])),
+                  'time_limit': '{:02d}:{:02d}:00'.format(minutes // 60, minutes % 60)})
 
     # Write job script
     job_script_fn = os.path.join(data_path,
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from copy import deepcopy
+from multiarea_model import MultiAreaModel
+from multiarea_model.connection_helpers import connection_plan, delay_bounds, delay_report
+from multiarea_model.connection_helpers import read_connection_plan, write_connection_plan
+from multiarea_model.default_params import sim_params
+
+
+def test_connection_plan(tmpdir):
+    """
+    Test if the connection plan contains all projections with synapses
+    between the given pairs of areas with the synapse numbers, weights
+    and delays of the network, ordered by the GIDs of the target and
+    source populations, and if it can be written to and read from file.
+    """
+    M = MultiAreaModel({})
+    areas = ['V1', 'V2']
+    gids = {}
+    first = 1
+    for area in areas:
+        gids[area] = {}
+        for pop in M.structure[area]:
+            n = int(M.N[area][pop])
+            gids[area][pop] = (first, first + n - 1)
+            first += n
+    pairs = [('V1', 'V1'), ('V2', 'V1'), ('V1', 'V2')]
+    plan = connection_plan(M, gids, pairs, sim_params)
+
+    expected = set()
+    for target_area, source_area in pairs:
+        synapses = M.synapses.area_dict(target_area, source_area, M.structure)
+        for target in synapses:
+            for source in synapses[target]:
+                if int(synapses[target][source]) > 0:
+                    expected.add((target_area, target, source_area, source))
+    projections = set(zip(plan['target_area'], plan['target_pop'],
+                          plan['source_area'], plan['source_pop']))
+    assert(projections == expected)
+    assert(len(plan['N']) == len(expected))
+    assert(np.all(np.diff(plan['target_first']) >= 0))
+
+    v = M.params['delay_params']['interarea_speed']
+    for k in range(len(plan['N'])):
+        target_area, target = plan['target_area'][k], plan['target_pop'][k]
+        source_area, source = plan['source_area'][k], plan['source_pop'][k]
+        assert(plan['N'][k] == int(M.synapses[target_area][target][source_area][source]))
+        assert(plan['weight_mean'][k] == M.W[target_area][target][source_area][source])
+        assert(plan['weight_sd'][k] == M.W_sd[target_area][target][source_area][source])
+        assert(plan['target_first'][k] == gids[target_area][target][0])
+        assert(plan['source_last'][k] == gids[source_area][source][1])
+        if target_area == source_area:
+            assert(np.isfinite(plan['weight_low'][k]) == ('E' in source))
+            assert(np.isfinite(plan['weight_high'][k]) == ('I' in source))
+        else:
+            assert(np.isclose(plan['delay_mean'][k],
+                              M.distances[target_area][source_area] / v))
+
+    fn = str(tmpdir.join('connection_plan'))
+    write_connection_plan(plan, fn)
+    plan2 = read_connection_plan(fn)
+    for column in plan:
+        assert(np.all(plan[column] == plan2[column]))
+
+
+def test_delay_floor():
+    """
+    Test if the delays of the connection plan are bounded by the
+    delay floors and max_delay and if the delay report reflects the
+    shift of the delay distributions.
+    """
+    M = MultiAreaModel({})
+    pairs = [('V1', 'V1'), ('V2', 'V1')]
+    plan = connection_plan(M, None, pairs, sim_params)
+    assert(np.all(plan['target_first'] == -1))
+    assert(np.all(plan['delay_low'] == sim_params['dt']))
+    assert(np.all(np.isinf(plan['delay_high'])))
+    report = delay_report(plan, sim_params['dt'])
+    assert(report['min_delay'] == sim_params['dt'])
+    for key in ['intra_area', 'inter_area']:
+        assert(report[key]['shift'] == 0.)
+
+    params = deepcopy(sim_params)
+    params.update({'delay_floor': {'intra_area': 0.5, 'inter_area': 1.},
+                   'min_delay': 0.5,
+                   'max_delay': 100.})
+    plan = connection_plan(M, None, pairs, params)
+    intra = plan['target_area'] == plan['source_area']
+    assert(np.all(plan['delay_low'][intra] == 0.5))
+    assert(np.all(plan['delay_low'][~intra] == 1.))
+    assert(np.all(plan['delay_high'] == 100.))
+    report = delay_report(plan, params['dt'])
+    assert(report['min_delay'] == 0.5)
+    for key in ['intra_area', 'inter_area']:
+        assert(report[key]['fraction_shifted'] > 0.)
+        assert(report[key]['shift'] > 0.)
+    assert(report['intra_area']['mean_delay'] > 0.5)
+
+    params['max_delay'] = None
+    with pytest.raises(ValueError):
+        delay_bounds(params)
+    params.update({'max_delay': 100., 'delay_floor': {'intra_area': 0.2, 'inter_area': None}})
+    with pytest.raises(ValueError):
+        delay_bounds(params)
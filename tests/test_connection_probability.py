@@ -0,0 +1,26 @@
+import numpy as np
+
+from multiarea_model.data_multiarea.Model import mean_connection_probability
+from scipy import integrate
+
+
+def test_mean_connection_probability():
+    """
+    Test if the batched Gauss-Legendre evaluation of the mean
+    connection probability agrees with adaptive quadrature.
+    """
+    sigma = 0.29653208289812366
+    C0 = 0.1429914097112598
+
+    def integrand(r, R):
+        x1 = np.arctan(np.sqrt((2 * R - r) / (2 * R + r)))
+        return r * np.exp(-r ** 2 / (2 * sigma ** 2)) * (4 * x1 - np.sin(4 * x1))
+
+    surfaces = np.array([0.1, 1., 10., 100., 1000., 3000.])
+    C_mean = mean_connection_probability(surfaces, sigma, C0)
+    assert(C_mean.shape == surfaces.shape)
+    for surface, C in zip(surfaces, C_mean):
+        R = np.sqrt(surface / np.pi)
+        C_quad = 2 * C0 / surface * integrate.quad(integrand, 0, 2 * R, args=(R,),
+                                                   epsabs=0., epsrel=1e-12, limit=200)[0]
+        assert(np.isclose(C, C_quad, rtol=1e-9, atol=0.))
@@ -0,0 +1,28 @@
+import numpy as np
+from multiarea_model import MultiAreaModel
+from multiarea_model.connectivity_tensor import ConnectivityTensor
+from multiarea_model.multiarea_helpers import dict_to_matrix, extract_area_dict
+
+
+def test_connectivity_tensor():
+    """
+    Test that the connectivity tensors of the network and their
+    dictionary-style views are consistent with the connectivity
+    matrices.
+    """
+    M = MultiAreaModel({})
+    for T, matrix in zip([M.K, M.synapses, M.W], [M.K_matrix, M.syn_matrix, M.W_matrix]):
+        d = T.to_dict()
+        assert(np.all(dict_to_matrix(d, M.area_list, M.structure) == matrix))
+        assert(np.all(dict_to_matrix(T, M.area_list, M.structure) == matrix))
+        T2 = ConnectivityTensor.from_dict(d)
+        assert(np.all(T2.values == T.values))
+        T3 = ConnectivityTensor.from_matrix(matrix, M.area_list, M.structure,
+                                            external=matrix[:, -1])
+        assert(np.all(T3.to_matrix(M.structure) == matrix))
+
+    block = M.K.block('V1', 'V2')
+    assert(block[M.K.pop_index['23E'], M.K.pop_index['4E']] == M.K['V1']['23E']['V2']['4E'])
+    assert(M.K['V1']['23E']['external']['external'] == M.K.external[0, 0])
+    assert(M.synapses.area_dict('TH', 'V1', M.structure) ==
+           extract_area_dict(M.synapses.to_dict(), M.structure, 'TH', 'V1'))
@@ -0,0 +1,32 @@
+import numpy as np
+from multiarea_model import MultiAreaModel
+from multiarea_model.multiarea_helpers import (
+    create_vector_mask,
+    dict_to_matrix,
+    dict_to_vector,
+    matrix_to_dict,
+    structure_index,
+    vector_to_dict,
+)
+
+
+def test_conversion_helpers():
+    """
+    Test that converting between dictionaries, vectors and matrices
+    is consistent in both directions.
+    """
+    M = MultiAreaModel({})
+    K = matrix_to_dict(M.K_matrix[:, :-1], M.area_list, M.structure,
+                       external=M.K_matrix[:, -1])
+    assert(np.all(dict_to_matrix(K, M.area_list, M.structure) == M.K_matrix))
+
+    N = vector_to_dict(M.N_vec, M.area_list, M.structure)
+    assert(np.all(dict_to_vector(N, M.area_list, M.structure) == M.N_vec))
+    assert(N['TH']['4E'] == 0.)
+    assert(np.isclose(N['V1']['total'], M.N['V1']['total']))
+
+    area_index, pop_index = structure_index(M.area_list, M.structure)
+    mask = create_vector_mask(M.structure, areas=['V1', 'TH'], pops=['4E', '5I'])
+    assert(np.sum(mask) == 3)
+    assert(np.all(np.isin(area_index[mask], [M.area_list.index('V1'),
+                                             M.area_list.index('TH')])))
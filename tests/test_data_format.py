@@ -0,0 +1,36 @@
+import numpy as np
+import os
+
+from multiarea_model import MultiAreaModel
+from multiarea_model.storage_helpers import convert_data_file, data_file_name, load_data
+
+
+def test_data_format():
+    """
+    Test that networks stored in the 'npy' format are identical to
+    networks stored in the 'json' format and that the formats can
+    be converted into each other.
+    """
+    M = MultiAreaModel({}, data_format='json')
+    fn = convert_data_file(M.label, 'npy')
+    assert(os.path.isdir(fn))
+    assert(data_file_name(M.label) == fn)
+
+    M2 = MultiAreaModel(M.label)
+    assert(M == M2)
+    assert(isinstance(M2.synapses.values, np.memmap) or
+           isinstance(M2.synapses.values.base, np.memmap))
+    assert(np.all(M.K_matrix == M2.K_matrix))
+    assert(np.all(M.W_matrix == M2.W_matrix))
+
+    M3 = MultiAreaModel(M.label, lazy=True)
+    assert(M3.N == M.N)
+    assert(np.all(M3.syn_matrix == M.syn_matrix))
+
+    M4 = MultiAreaModel({'connection_params': {'g': -10.}}, data_format='npy')
+    assert(os.path.isdir(M4.data_fn))
+    assert(M4 == MultiAreaModel(M4.label))
+
+    dat_json = load_data(data_file_name(M.label, 'json'))
+    fn_json = convert_data_file(M.label, 'json')
+    assert(load_data(fn_json) == dat_json)
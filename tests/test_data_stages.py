@@ -0,0 +1,90 @@
+import json
+import numpy as np
+import os
+
+from multiarea_model import default_params
+from multiarea_model.data_multiarea import VisualCortex_Data as vcd
+from scipy import stats
+
+
+def test_stage_dependencies():
+    """
+    Test if every input of a stage is the output of exactly one
+    preceding stage.
+    """
+    produced = []
+    for name, spec in vcd.stages.items():
+        for x in spec['inputs']:
+            assert(x in produced)
+        for x in spec['outputs']:
+            assert(x not in produced)
+        produced += spec['outputs']
+
+
+def test_stage_keys(tmpdir, monkeypatch):
+    """
+    Test if changing a raw data file only changes the keys
+    of the stages depending on it.
+    """
+    fn = str(tmpdir.join('surfaces.csv'))
+    with open(fn, 'w') as f:
+        f.write('1')
+    spec = dict(vcd.stages['load_surfaces'])
+    spec['raw_files'] = spec['raw_files'] + [fn]
+    monkeypatch.setitem(vcd.stages, 'load_surfaces', spec)
+
+    keys = {name: vcd.stage_key(name) for name in vcd.stages}
+    with open(fn, 'w') as f:
+        f.write('2')
+    changed = [name for name in vcd.stages if vcd.stage_key(name) != keys[name]]
+    assert(changed == ['load_surfaces', 'compute_neuronal_numbers'])
+
+
+def test_stage_cache(tmpdir, monkeypatch):
+    """
+    Test if cached outputs of the stages are identical to
+    freshly computed ones.
+    """
+    monkeypatch.setattr(vcd, 'stage_cache_path', str(tmpdir))
+    res = vcd.run_stages(['realistic_neuronal_numbers'], use_cache=False)
+    cached = vcd.run_stages(['realistic_neuronal_numbers'])
+    assert(json.dumps(res) == json.dumps(cached))
+    # Only the 12 stages required for the neuron numbers are executed
+    assert(len(os.listdir(str(tmpdir))) == 12)
+
+
+def test_SLN_fit():
+    """
+    Test if the beta-binomial fit of the SLN data reproduces
+    the coefficients obtained with the R package aod.
+    """
+    assert(vcd.fit_SLN() == [-0.1516142, -1.5343200])
+    x = np.linspace(-3., 3., 7)
+    assert(np.allclose(vcd.probit(x), stats.norm.cdf(x)))
+
+
+def test_av_indegree_constants():
+    """
+    Test if the average indegrees defined in default_params.py agree
+    with the raw data.
+    """
+    res = vcd.run_stages(['av_indegree_Cragg', 'av_indegree_OKusky'])
+    assert(res['av_indegree_Cragg'] == default_params.av_indegree_Cragg)
+    assert(res['av_indegree_OKusky'] == default_params.av_indegree_OKusky)
+
+
+def test_process_raw_data(monkeypatch):
+    """
+    Test if process_raw_data returns the content of the json files
+    and only writes the files if their content changes.
+    """
+    raw_data, processed_data = vcd.process_raw_data()
+    for name, dat in [('viscortex_raw_data', raw_data),
+                      ('viscortex_processed_data', processed_data)]:
+        with open(os.path.join(vcd.basepath, name + '.json'), 'r') as f:
+            assert(json.dumps(json.load(f)) == json.dumps(dat))
+
+    def write_json(obj, fn):
+        raise AssertionError('{} was written again.'.format(fn))
+    monkeypatch.setattr(vcd, 'write_json', write_json)
+    assert(json.dumps(vcd.process_raw_data()) == json.dumps((raw_data, processed_data)))
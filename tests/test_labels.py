@@ -0,0 +1,29 @@
+import numpy as np
+
+from multiarea_model.multiarea_helpers import generate_label
+
+
+def test_generate_label():
+    """
+    Test if labels are reproducible, insensitive to float deviations
+    below the label precision and to the type of sequences, and
+    sensitive to relevant changes.
+    """
+    params = {'a': 1.5, 'b': [1, 2., 'x'], 'c': {'d': None, 'e': True}}
+    arrays = {'x': np.arange(6.).reshape(2, 3) / 7.}
+    label = generate_label(params, arrays=arrays)
+    # The label must not depend on the process or platform
+    assert(label == '757111147b541b2e3631d207545c70f4')
+
+    params2 = {'c': {'e': True, 'd': None}, 'b': np.array([1, 2., 'x'], dtype=object),
+               'a': 1.500001}
+    arrays2 = {'x': arrays['x'] + 1e-9}
+    assert(generate_label(params2, arrays=arrays2) == label)
+
+    assert(generate_label(dict(params, a=1.6), arrays=arrays) != label)
+    assert(generate_label(params, arrays={'x': arrays['x'] + 1e-3}) != label)
+    assert(generate_label(params, arrays={'x': arrays['x'].reshape(3, 2)}) != label)
+    assert(generate_label(dict(params, f=0.), arrays=arrays,
+                          blacklist=['f']) == label)
+    assert(generate_label(dict(params, c={'d': None, 'e': True, 'f': 0.}),
+                          arrays=arrays, blacklist=[('c', 'f')]) == label)
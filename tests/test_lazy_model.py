@@ -0,0 +1,33 @@
+import numpy as np
+import multiarea_model
+from multiarea_model import MultiAreaModel
+
+
+def test_lazy_model(monkeypatch):
+    """
+    Test that a network loaded in lazy mode from a label only loads
+    the connectivity on first access and then yields the same
+    network as the original instance. The json data file is only
+    parsed once.
+    """
+    # Parameters not used by other tests to ensure that the network
+    # is only stored in json format
+    M = MultiAreaModel({'connection_params': {'g': -13.5}})
+    calls = []
+    load_data = multiarea_model.multiarea_model.load_data
+
+    def counting_load_data(*args, **kwargs):
+        calls.append(args[0])
+        return load_data(*args, **kwargs)
+    monkeypatch.setattr(multiarea_model.multiarea_model, 'load_data', counting_load_data)
+    M2 = MultiAreaModel(M.label, lazy=True)
+    assert(M2.label == M.label)
+    assert(M2.structure == M.structure)
+    assert(M2.N == M.N)
+    assert('K' not in M2.__dict__)
+
+    assert(np.all(M2.K_matrix == M.K_matrix))
+    assert('K' in M2.__dict__)
+    assert(np.all(M2.J_matrix == M.J_matrix))
+    assert(M2.K_areas == M.K_areas)
+    assert(len(calls) == 1)
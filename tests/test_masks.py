@@ -0,0 +1,36 @@
+import numpy as np
+from multiarea_model import MultiAreaModel
+from multiarea_model.multiarea_helpers import (
+    area_slice,
+    create_mask,
+    create_vector_mask,
+    mask_indices,
+)
+
+
+def test_masks():
+    """
+    Test that cortico-cortical and internal masks partition the
+    connectivity matrix and that index arrays and slices select the
+    same entries as the corresponding masks.
+    """
+    M = MultiAreaModel({})
+    cc_mask = create_mask(M.structure, cortico_cortical=True, external=False)
+    internal_mask = create_mask(M.structure, internal=True, external=False)
+    assert(not np.any(np.logical_and(cc_mask, internal_mask)))
+    assert(np.all(np.logical_or(cc_mask, internal_mask)[:, :-1]))
+
+    mask = create_mask(M.structure, target_areas=['V1'], source_pops=['4E'],
+                       cortico_cortical=True)
+    rows, cols = mask_indices(M.structure, target_areas=['V1'], source_pops=['4E'],
+                              cortico_cortical=True)
+    assert(np.all(np.array(np.nonzero(mask)) == np.array([rows, cols])))
+
+    # Returned masks can be modified without affecting the cache
+    cc_mask[:] = False
+    assert(np.any(create_mask(M.structure, cortico_cortical=True, external=False)))
+
+    for area in M.area_list:
+        vmask = create_vector_mask(M.structure, areas=[area])
+        assert(np.all(np.arange(vmask.size)[area_slice(M.structure, area)] ==
+                      np.nonzero(vmask)[0]))
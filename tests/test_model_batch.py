@@ -0,0 +1,28 @@
+import numpy as np
+
+from multiarea_model import MultiAreaModel
+
+
+def test_model_batch():
+    """
+    Test if the variants of a network created with
+    MultiAreaModel.batch are identical to networks created
+    separately.
+    """
+    base_params = {'connection_params': {'av_indegree_V1': 3950.}}
+    variations = [{},
+                  {'connection_params': {'g': -11.}},
+                  {'connection_params': {'g': -11., 'cc_weights_factor': 1.9}},
+                  {'connection_params': {'fac_nu_ext_5E': 1.125, 'fac_nu_ext_6E': 1.4}},
+                  {'connection_params': {'av_indegree_V1': 3000.}}]
+    models = MultiAreaModel.batch(base_params, variations, use_cache=False, persist=False)
+    assert(len(models) == len(variations))
+    for M, variation in zip(models, variations):
+        params = {'connection_params': dict(base_params['connection_params'],
+                                            **variation.get('connection_params', {}))}
+        M2 = MultiAreaModel(params, use_cache=False, persist=False)
+        assert(M == M2)
+        assert(np.all(M.N_vec == M2.N_vec))
+        assert(np.all(M.K_matrix == M2.K_matrix))
+        assert(np.all(M.W_matrix == M2.W_matrix))
+        assert(np.all(M.W_sd_matrix == M2.W_sd_matrix))
@@ -0,0 +1,68 @@
+import multiarea_model
+import numpy as np
+import os
+
+from multiarea_model import MultiAreaModel
+from multiarea_model.cache_helpers import data_cache_key, _cache_fn
+
+
+def test_model_cache():
+    """
+    Test if a network loaded from the cache for the output of the
+    data scripts is identical to a network computed from scratch.
+    """
+    conn_params = {'g': -11.,
+                   'av_indegree_V1': 3950.}
+    network_params = {'connection_params': conn_params}
+
+    M = MultiAreaModel(network_params, use_cache=False)
+    M_cached = MultiAreaModel(network_params)
+    assert(os.path.exists(_cache_fn(data_cache_key(network_params))))
+    M_cached2 = MultiAreaModel(network_params)
+
+    for M2 in [M_cached, M_cached2]:
+        assert(M == M2)
+        assert(np.all(M.K_matrix == M2.K_matrix))
+        assert(np.all(M.W_matrix == M2.W_matrix))
+
+    # Parameters that do not enter the data scripts do not change the key
+    network_params2 = {'connection_params': conn_params,
+                       'N_scaling': 0.1}
+    assert(data_cache_key(network_params) == data_cache_key(network_params2))
+    conn_params2 = {'g': -12.,
+                    'av_indegree_V1': 3950.}
+    network_params3 = {'connection_params': conn_params2}
+    assert(data_cache_key(network_params) != data_cache_key(network_params3))
+
+
+def test_partial_rebuild(monkeypatch):
+    """
+    Test if a network differing from a cached network only in the
+    parameters of the synaptic weights is obtained by recomputing
+    the synaptic weights only, and identical to a network computed
+    from scratch.
+    """
+    conn_params = {'g': -11.,
+                   'av_indegree_V1': 3950.}
+    MultiAreaModel({'connection_params': conn_params})
+
+    conn_params2 = {'g': -12.5,
+                    'av_indegree_V1': 3950.,
+                    'PSP_e': 0.2,
+                    'cc_weights_factor': 1.5,
+                    'cc_weights_I_factor': 2.,
+                    'lognormal_weights': True}
+    network_params2 = {'connection_params': conn_params2}
+    M = MultiAreaModel(network_params2, use_cache=False)
+
+    def compute_Model_data(*args, **keywords):
+        raise AssertionError('Data scripts should not be executed.')
+    monkeypatch.setattr(multiarea_model.multiarea_model, 'compute_Model_data',
+                        compute_Model_data)
+    monkeypatch.setattr(multiarea_model.multiarea_model, 'read_from_cache',
+                        lambda key: None)
+    M_partial = MultiAreaModel(network_params2)
+    assert(M == M_partial)
+    assert(np.all(M.K_matrix == M_partial.K_matrix))
+    assert(np.all(M.W_matrix == M_partial.W_matrix))
+    assert(np.all(M.W_sd_matrix == M_partial.W_sd_matrix))
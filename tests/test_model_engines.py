@@ -0,0 +1,22 @@
+import json
+import os
+
+from multiarea_model.data_multiarea.Model import compute_Model_params
+
+"""
+Test if the loop and tensor engines of the data scripts
+yield identical results.
+"""
+
+
+def test_model_engines():
+    basepath = os.path.join(os.path.dirname(compute_Model_params.__code__.co_filename))
+    dat = {}
+    for engine in ['loop', 'tensor']:
+        out_label = 'test_engine_{}'.format(engine)
+        compute_Model_params(out_label=out_label, mode='default', engine=engine)
+        fn = os.path.join(basepath, 'default_Data_Model_{}.json'.format(out_label))
+        with open(fn, 'r') as f:
+            dat[engine] = json.load(f)
+        os.remove(fn)
+    assert(dat['loop'] == dat['tensor'])
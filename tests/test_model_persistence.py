@@ -0,0 +1,78 @@
+import json
+import numpy as np
+import os
+
+from config import base_path
+from copy import deepcopy
+from multiarea_model import MultiAreaModel, storage_helpers
+from multiarea_model.default_params import nested_update, sim_params
+from multiarea_model.multiarea_helpers import simulation_label
+from multiarea_model.storage_helpers import data_file_name, migrate_labels
+
+
+def test_model_persistence():
+    """
+    Test that the files of a network are only written when requested
+    and that the network can then be loaded from its label.
+    """
+    network_params = {'connection_params': {'g': -10.5}}
+    M = MultiAreaModel(network_params, use_cache=False, persist=False)
+    fns = [os.path.join(base_path, 'config_files', '{}_config'.format(M.label)),
+           os.path.join(base_path, 'config_files', 'custom_Data_Model_{}.json'.format(M.label))]
+    # Remove files from previous runs
+    for fn in fns:
+        if os.path.exists(fn):
+            os.remove(fn)
+
+    M.persist()
+    assert(all(os.path.exists(fn) for fn in fns))
+    M2 = MultiAreaModel(M.label)
+    assert(M == M2)
+    assert(np.all(M.K_matrix == M2.K_matrix))
+
+    M3 = MultiAreaModel(network_params, persist='async')
+    M3.persist()
+    assert(M == M3)
+    assert(all(os.path.exists(fn) for fn in fns))
+
+
+def test_migrate_labels(tmpdir, monkeypatch):
+    """
+    Test that a network stored under a label of an earlier version
+    and its simulation are relabeled and that the network can then be
+    loaded from its new label.
+    """
+    M = MultiAreaModel({'connection_params': {'g': -14.5}})
+    old_label = 'f' * 32
+    old_sim_label = 'e' * 32
+    config_dir = os.path.join(base_path, 'config_files')
+    os.replace(os.path.join(config_dir, '{}_config'.format(M.label)),
+               os.path.join(config_dir, '{}_config'.format(old_label)))
+    os.replace(data_file_name(M.label, 'json'), data_file_name(old_label, 'json'))
+
+    monkeypatch.setattr(storage_helpers, 'data_path', str(tmpdir))
+    sim_dir = tmpdir.mkdir(old_sim_label)
+    sim_dir.mkdir('recordings').join('{}_logfile_0'.format(old_sim_label)).write('{}')
+    sim_dir.join('{}_config'.format(old_label)).write('{}')
+    d = {'sim_params': {'t_sim': 100.},
+         'network_params': M.custom_params,
+         'network_label': old_label}
+    for fn in ['custom_params_{}'.format(old_sim_label),
+               'custom_params_{}_0'.format(old_sim_label)]:
+        sim_dir.join(fn).write(json.dumps(d))
+
+    networks, simulations = migrate_labels([old_label])
+    params = deepcopy(sim_params)
+    nested_update(params, d['sim_params'])
+    sim_label = simulation_label(params, M.label)
+    assert(networks == {old_label: M.label})
+    assert(simulations == {old_sim_label: sim_label})
+    assert(not os.path.exists(data_file_name(old_label, 'json')))
+    assert(MultiAreaModel(M.label) == M)
+
+    new_dir = tmpdir.join(sim_label)
+    assert(new_dir.join('recordings', '{}_logfile_0'.format(sim_label)).check())
+    assert(new_dir.join('{}_config'.format(M.label)).check())
+    for fn in ['custom_params_{}'.format(sim_label),
+               'custom_params_{}_0'.format(sim_label)]:
+        assert(json.loads(new_dir.join(fn).read())['network_label'] == M.label)
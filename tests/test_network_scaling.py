@@ -1,7 +1,8 @@
 from multiarea_model import MultiAreaModel
-from multiarea_model.multiarea_helpers import vector_to_dict
+from multiarea_model.multiarea_helpers import dict_to_vector, scaling_vector, vector_to_dict
 import numpy as np
 import json
+import pytest
 
 
 def test_network_scaling():
@@ -60,3 +61,66 @@ def test_network_scaling():
     assert(np.allclose(mu, mu0))
     assert(np.allclose(sigma, sigma0))
     assert(np.allclose(r[:, -1], r0[:, -1]))
+
+
+def test_heterogeneous_network_scaling():
+    """
+    Test the downscaling with factors differing between areas and
+    populations.
+
+    - Test whether indegrees, synapse numbers and neuron numbers of each
+      population are scaled with its factors.
+    - Test whether the mean and variance of the input currents are
+      preserved for the full-scale rates.
+    """
+    M0 = MultiAreaModel({})
+    N_scaling = {'V1': 1., 'V2': {'23E': 0.5}, 'FEF': 0.2}
+    K_scaling = {'V1': 1., 'V4': 0.3, 'FEF': {'5E': 0.1, '6I': 0.4}}
+    network_params = {'N_scaling': N_scaling,
+                      'K_scaling': K_scaling,
+                      'fullscale_rates': 'fullscale_rates.json'}
+    M = MultiAreaModel(network_params)
+
+    n = np.ones_like(M0.N_vec)
+    k = np.ones_like(M0.N_vec)
+    for i, name in enumerate(M0.structure_vec):
+        area, pop = name.split('-')
+        if area == 'V2' and pop == '23E':
+            n[i] = 0.5
+        elif area == 'FEF':
+            n[i] = 0.2
+            k[i] = {'5E': 0.1, '6I': 0.4}.get(pop, 1.)
+        if area == 'V4':
+            k[i] = 0.3
+    assert(np.allclose(M.N_vec, n * M0.N_vec))
+    assert(np.allclose(M.K_matrix, k[:, np.newaxis] * M0.K_matrix))
+    assert(np.allclose(M.syn_matrix, (k * n)[:, np.newaxis] * M0.syn_matrix))
+    assert(np.allclose(M.W_matrix, M0.W_matrix / np.sqrt(k)[:, np.newaxis]))
+
+    with open('fullscale_rates.json', 'r') as f:
+        rates = dict_to_vector(json.load(f), M0.area_list, M0.structure)
+    rates = np.append(rates, M0.params['input_params']['rate_ext'])
+    tau_m = M.params['neuron_params']['single_neuron_dict']['tau_m']
+    C_m = M.params['neuron_params']['single_neuron_dict']['C_m']
+    mu0 = 1e-3 * tau_m * np.dot(M0.K_matrix * M0.J_matrix, rates)
+    mu = 1e-3 * tau_m * np.dot(M.K_matrix * M.J_matrix, rates) + tau_m / C_m * M.add_DC_drive
+    sigma0 = np.sqrt(1e-3 * tau_m * np.dot(M0.K_matrix * M0.J_matrix**2, rates))
+    sigma = np.sqrt(1e-3 * tau_m * np.dot(M.K_matrix * M.J_matrix**2, rates))
+    assert(np.allclose(mu, mu0))
+    assert(np.allclose(sigma, sigma0))
+
+
+def test_scaling_vector():
+    """
+    Test if scaling factors are assigned to the populations in the
+    order of the network and if unknown areas and populations are
+    rejected.
+    """
+    area_list = ['V1', 'TH']
+    structure = {'V1': ['23E', '4E'], 'TH': ['23E', '5E']}
+    assert(np.all(scaling_vector(0.5, area_list, structure) == 0.5))
+    assert(np.all(scaling_vector({'TH': {'5E': 0.1}, 'V1': 0.2}, area_list, structure) ==
+                  [0.2, 0.2, 1., 0.1]))
+    for scaling in [{'V3': 0.5}, {'V1': {'23e': 0.5}}, {'TH': {'4E': 0.5}}]:
+        with pytest.raises(KeyError):
+            scaling_vector(scaling, area_list, structure)
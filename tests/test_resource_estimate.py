@@ -0,0 +1,166 @@
+import copy
+import json
+import numpy as np
+import os
+import pytest
+import start_jobs
+
+from multiarea_model import MultiAreaModel
+from multiarea_model.resource_helpers import _features, count_resources, size_job
+from multiarea_model.resource_helpers import default_calibration, fit_calibration, simulated_time
+
+
+def test_count_resources():
+    """
+    Test if the counts agree with the populations, connections and
+    devices created by Simulation for a network with two simulated
+    areas.
+    """
+    # Non-simulated areas replaced by one current generator per
+    # source population
+    network_params = {'connection_params': {'replace_non_simulated_areas':
+                                            'het_current_nonstat'}}
+    M = MultiAreaModel(network_params)
+    sim_spec = {'areas_simulated': ['V1', 'V2'], 't_sim': 100.,
+                'recording_dict': {'areas_recorded': ['V1']}}
+    counts = count_resources(M, sim_spec, rates=5.)
+
+    num_neurons = num_synapses = num_spikes = 0
+    num_devices = 1
+    num_device_connections = 0
+    non_simulated = [area for area in M.area_list if area not in ['V1', 'V2']]
+    for target_area in ['V1', 'V2']:
+        for target_pop in M.structure[target_area]:
+            N = int(M.N[target_area][target_pop])
+            num_neurons += N
+            # Poisson generator for external input
+            num_devices += 1
+            num_device_connections += N
+            if target_area == 'V1':
+                num_device_connections += N
+                num_spikes += N * 5. * 0.1
+            for source_area in ['V1', 'V2']:
+                for source_pop in M.structure[source_area]:
+                    num_synapses += int(M.synapses[target_area][target_pop]
+                                        [source_area][source_pop])
+            for source_area in non_simulated:
+                num_devices += len(M.structure[source_area])
+                num_device_connections += N * len(M.structure[source_area])
+    assert(counts['num_neurons'] == num_neurons)
+    assert(counts['num_synapses'] == num_synapses)
+    assert(counts['num_devices'] == num_devices)
+    assert(counts['num_device_connections'] == num_device_connections)
+    assert(np.isclose(counts['num_spikes'], num_spikes))
+
+    # One spike detector per recorded population writing binary files
+    sim_spec['recording_dict']['spike_recording'] = 'population'
+    counts_pop = count_resources(M, sim_spec, rates=5.)
+    assert(counts_pop['num_devices'] == num_devices - 1 + len(M.structure['V1']))
+    assert(np.isclose(counts_pop['spike_output_bytes'], num_spikes * 8))
+
+
+def test_fit_calibration():
+    """
+    Test if fit_calibration recovers the coefficients used to create
+    synthetic log files.
+    """
+    calibration = {'memory': {'base': 300., 'neuron': 2e-3,
+                              'synapse': 4e-5, 'device': 5e-3},
+                   'time_network': {'base': 2., 'neuron': 2e-5, 'synapse': 3e-6},
+                   'time_simulate': {'base': 1., 'update': 3e-8, 'event': 2e-8}}
+    counts_list = []
+    logs_list = []
+    for i, (num_processes, threads) in enumerate([(1, 1), (2, 4), (4, 2), (8, 8),
+                                                  (16, 4), (3, 1)]):
+        counts = {'num_neurons': 1000 * (i + 1) ** 2,
+                  'num_synapses': 4e6 * (i + 1) ** 3,
+                  'num_devices': 50 + 200 * i,
+                  'num_device_connections': 5000 * (i + 1),
+                  'num_spike_events': 1e8 * (i + 1),
+                  'num_steps': 10000 * (6 - i),
+                  'num_processes': num_processes,
+                  'local_num_threads': threads}
+        features = _features(counts)
+        measured = {quantity: sum(coefficients[name] * features[quantity][name]
+                                  for name in coefficients)
+                    for quantity, coefficients in calibration.items()}
+        logs_list.append([{'total_memory': measured['memory'] * 1024.,
+                           'time_prepare': 0.,
+                           'time_network_local': measured['time_network'],
+                           'time_network_global': 0.,
+                           'time_simulate': measured['time_simulate']}])
+        counts_list.append(counts)
+    fitted = fit_calibration(counts_list, logs_list)
+    assert(set(fitted) == set(default_calibration))
+    for quantity, coefficients in calibration.items():
+        for name in coefficients:
+            assert(np.isclose(fitted[quantity][name], coefficients[name], rtol=1e-6))
+
+
+def test_simulated_time():
+    """
+    Test if the simulated time is read from the log files of
+    simulations stopped early and defaults to t_sim for log files
+    without it.
+    """
+    logs = [{'time_simulate': 10., 't_simulated': 800.},
+            {'time_simulate': 11., 't_simulated': 800.}]
+    assert(simulated_time(logs, 1000.) == 800.)
+    assert(simulated_time([{'time_simulate': 10.}], 1000.) == 1000.)
+    assert(simulated_time([], 1000.) == 1000.)
+
+
+def test_size_job():
+    """
+    Test if size_job chooses the smallest number of nodes whose
+    memory suffices for the simulation.
+    """
+    M = MultiAreaModel({})
+    node_spec = {'memory': 64 * 1024., 'cores': 16, 'max_nodes': 64,
+                 'memory_margin': 1., 'time_margin': 2.}
+    job = size_job(M, {'t_sim': 100.}, node_spec=node_spec, rates=5.)
+    assert(job['num_processes'] == job['num_nodes'] * job['processes_per_node'])
+    assert(job['processes_per_node'] * job['local_num_threads'] == 16)
+    assert(job['memory_per_node'] <= node_spec['memory'])
+    estimate = job['estimate']
+    assert(np.isclose(job['time_limit'],
+                      2. * (estimate['time_network'] + estimate['time_simulate'])))
+    # With one node less, no configuration fits into the memory
+    counts = count_resources(M, {'t_sim': 100.}, rates=5.)
+    num_nodes = job['num_nodes'] - 1
+    for n in [1, 2, 4, 8, 16]:
+        counts.update(num_processes=num_nodes * n, local_num_threads=16 // n)
+        features = _features(counts)['memory']
+        memory = sum(default_calibration['memory'][name] * features[name]
+                     for name in features)
+        assert(n * memory > node_spec['memory'])
+
+
+def test_start_sized_job(tmpdir, monkeypatch):
+    """
+    Test if start_job passes the sized job to the job script and
+    rejects simulations created with other numbers of processes and
+    threads than the sized job.
+    """
+    job = {'num_nodes': 2, 'num_processes': 8, 'processes_per_node': 4,
+           'local_num_threads': 12, 'time_limit': 3601., 'memory_per_node': 1000.5}
+    label = 'sim'
+    tmpdir.mkdir(label)
+    tmpdir.join('run_simulation.py').write('')
+    monkeypatch.setattr(start_jobs, 'base_path', str(tmpdir))
+    monkeypatch.setattr(start_jobs, 'data_path', str(tmpdir))
+    monkeypatch.setattr(start_jobs, 'sim_params', copy.deepcopy(start_jobs.sim_params))
+    template = '{num_nodes} {processes_per_node} {local_num_threads} {memory_per_node} {time_limit}'
+    fn = str(tmpdir.join(label, 'custom_params_sim'))
+    for sim_params in [{'num_processes': 8, 'local_num_threads': 12},
+                       {'num_processes': 1, 'local_num_threads': 1}]:
+        with open(fn, 'w') as f:
+            json.dump({'sim_params': sim_params, 'network_label': 'net'}, f)
+        if sim_params['num_processes'] == job['num_processes']:
+            start_jobs.start_job(label, 'true', template, job=job)
+            with open(str(tmpdir.join(label, 'job_script_sim.sh')), 'r') as f:
+                assert(f.read() == '2 4 12 1001 01:01:00')
+            assert(os.path.exists('_'.join((fn, '7'))))
+        else:
+            with pytest.raises(ValueError):
+                start_jobs.start_job(label, 'true', template, job=job)
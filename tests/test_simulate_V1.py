@@ -52,3 +52,25 @@ def test_het_current_non_stat_sim():
 
     M = MultiAreaModel(network_params, simulation=True, sim_spec=sim_params)
     M.simulation.simulate()
+
+
+def test_segmented_sim():
+    network_params = {'connection_params': {'replace_non_simulated_areas': 'hom_poisson_stat'},
+                      'N_scaling': 0.001,
+                      'K_scaling': 0.0001,
+                      'fullscale_rates': 'fullscale_rates.json'}
+    sim_params = {'t_sim': 10.,
+                  't_segment': 4.,
+                  'areas_simulated': ['V1']}
+
+    M = MultiAreaModel(network_params, simulation=True, sim_spec=sim_params)
+    segments = []
+
+    def callback(simulation, segment):
+        segments.append(segment)
+        return segment['t_stop'] >= 8.
+
+    M.simulation.simulate(callbacks=[callback])
+    assert([segment['t_stop'] for segment in segments] == [4., 8.])
+    assert(M.simulation.t_simulated == 8.)
+    assert(M.simulation.segments == segments)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from multiarea_model.analysis_helpers import load_spike_files, spike_dtype
+
+
+def test_load_spike_files(tmpdir):
+    """
+    Test if the spikes written to binary files by several MPI
+    processes are loaded in the format of the gdf files, also for
+    spike times of long simulations.
+    """
+    dt = 0.1
+    files = []
+    for rank, (senders, times) in enumerate([([3, 1], [0.1, 12.3]),
+                                             ([2, 4], [100000.1, 3600000.3])]):
+        spikes = np.empty(len(senders), dtype=spike_dtype)
+        spikes['senders'] = senders
+        spikes['steps'] = np.round(np.array(times) / dt)
+        fn = str(tmpdir.join('spikes-V1-23E-{}.dat'.format(rank)))
+        with open(fn, 'ab') as f:
+            spikes.tofile(f)
+        files.append(fn)
+    data = load_spike_files(files, dt)
+    assert(data.shape == (4, 2))
+    assert(np.all(data[:, 0] == [3, 1, 2, 4]))
+    # Identical to the times read from the text of a gdf file
+    assert(np.all(data[:, 1] == [float(t) for t in ['0.1', '12.3', '100000.1', '3600000.3']]))
+    assert(load_spike_files([], dt).shape == (0, 2))
@@ -0,0 +1,48 @@
+import numpy as np
+
+from multiarea_model import MultiAreaModel, SubModel
+
+
+def test_sub_model():
+    """
+    Test if the sub-model contains the connectivity of the simulated
+    areas and if the aggregated Poisson input replacing the
+    non-simulated areas has the same total rate as the input of the
+    separate source populations.
+    """
+    network_params = {'connection_params': {'replace_non_simulated_areas':
+                                            'hom_poisson_stat'}}
+    M = MultiAreaModel(network_params)
+    areas = ['V2', 'V1', 'FEF']
+    S = SubModel(M, areas)
+    assert(S.area_list == ['V1', 'V2', 'FEF'])
+    for target_area in S.area_list:
+        for source_area in S.area_list:
+            assert(S.synapses.area_dict(target_area, source_area, S.structure) ==
+                   M.synapses.area_dict(target_area, source_area, M.structure))
+            assert(S.W_sd.area_dict(target_area, source_area, S.structure) ==
+                   M.W_sd.area_dict(target_area, source_area, M.structure))
+    mask = np.isin([name.split('-')[0] for name in M.structure_vec], areas)
+    assert(np.all(S.K_matrix == M.K_matrix[mask][:, np.append(mask, True)]))
+    assert(np.all(S.N_vec == M.N_vec[mask]))
+
+    rate_ext = M.params['input_params']['rate_ext']
+    v = M.params['delay_params']['interarea_speed']
+    non_simulated = [area for area in M.area_list if area not in areas]
+    for target_area in S.area_list:
+        for pop in S.structure[target_area]:
+            rates = {}
+            for source_area in non_simulated:
+                for source_pop in M.structure[source_area]:
+                    K = (M.synapses[target_area][pop][source_area][source_pop] /
+                         M.N[target_area][pop])
+                    W = M.W[target_area][pop][source_area][source_pop]
+                    if K > 0.:
+                        rates.setdefault(W, []).append(
+                            (K * rate_ext, M.distances[target_area][source_area] / v))
+            d = S.replacement_input[target_area][pop]
+            assert(sorted(rates) == list(d['weight']))
+            for W, rate, delay in zip(d['weight'], d['rate'], d['delay']):
+                r = np.array(rates[W])
+                assert(np.isclose(rate, np.sum(r[:, 0])))
+                assert(np.min(r[:, 1]) <= delay <= np.max(r[:, 1]))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from multiarea_model import MultiAreaModel
+from multiarea_model.multiarea_helpers import create_mask, create_vector_mask
+from multiarea_model.stabilize import S_T
+from multiarea_model.theory import Theory
+
+
+def test_sparse_backend():
+    """
+    Test if the sparse backend of Theory leads to the same results as
+    the dense backend.
+    """
+    M = MultiAreaModel({})
+    dense = Theory(M, {})
+    sparse = Theory(M, {'backend': 'sparse'})
+    assert(dense.label == sparse.label)
+
+    rates = np.random.RandomState(5).uniform(1., 10., M.N_vec.size)
+    for mu, mu_sparse in zip(dense.mu_sigma(rates), sparse.mu_sigma(rates)):
+        assert(np.allclose(mu, mu_sparse, rtol=1e-9, atol=0.))
+
+    matrix_filter = create_mask(M.structure, target_areas=['V1', 'V2'],
+                                source_areas=['V1', 'V2'])
+    vector_filter = create_vector_mask(M.structure, areas=['V1', 'V2'])
+    for keywords in [{}, {'matrix_filter': matrix_filter, 'vector_filter': vector_filter}]:
+        G = dense.gain_matrix(rates, **keywords)
+        G_sparse = sparse.gain_matrix(rates, **keywords)
+        assert(G_sparse.nnz < G.size)
+        assert(np.allclose(G, G_sparse.toarray(), rtol=1e-9, atol=0.))
+
+    M_dense = S_T(dense, rates)[-1]
+    M_sparse = S_T(sparse, rates)[-1]
+    assert(np.allclose(M_dense, M_sparse.toarray(), rtol=1e-9, atol=0.))
+
+    with pytest.raises(ValueError):
+        Theory(M, {'backend': 'gpu'})